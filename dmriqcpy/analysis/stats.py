@@ -1,21 +1,51 @@
 # -*- coding: utf-8 -*-
 
+import itertools
+
 import nibabel as nib
 import numpy as np
 import os
 import pandas as pd
 
+from dmriqcpy.analysis.utils import (compute_intensity_window,
+                                     get_display_data, set_intensity_window)
+from dmriqcpy.io.executor import Executor
+from dmriqcpy.io.image import (get_data, get_data_slice, load_data,
+                               load_img, load_mask)
+from dmriqcpy.io.tractogram import iter_streamlines_chunks
+
+# Bins (mm) of the histograms of the streamline lengths. Longer streamlines
+# are counted in the last bin.
+LENGTH_BINS = np.arange(0, 502, 2)
 
-def stats_mean_median(column_names, filenames):
+
+def stats_mean_median(column_names, filenames, nb_threads=1,
+                      all_volumes=False, chunk_size=10, cache=None,
+                      executor=None):
     """
     Compute mean and median values in an image where voxels are higher than 0.
 
+    For 4D images, only the volume with the highest value at the center voxel
+    is read, unless all_volumes is set.
+
     Parameters
     ----------
     column_names : array of strings
         Name of the columns.
     filenames : array of strings
         Array of filenames in Nifti format.
+    nb_threads : int
+        Number of processes used to compute the stats of the subjects.
+    all_volumes : bool
+        If set, compute the stats over all the volumes of 4D images. The
+        volumes are read chunk_size at a time.
+    chunk_size : int
+        Number of volumes read at once when all_volumes is set.
+    cache : ResultCache
+        Cache of the stats of each subject. Not used if None.
+    executor : Executor
+        Executor running the subjects. A pool of nb_threads processes if
+        None.
 
     Returns
     -------
@@ -25,38 +55,143 @@ def stats_mean_median(column_names, filenames):
         DataFrame containing mean, std, min and max of mean and medians
         across subjects.
     """
-    values = []
     sub_filenames = [os.path.basename(curr_subj).split('.')[0] for curr_subj in filenames]
 
-    for filename in filenames:
-        data = nib.load(filename).get_fdata()
-        shape = data.shape
-
-        if len(shape) > 3:
-            sub = list(data[shape[0] // 2, shape[1] // 2, shape[2] // 2, :])
-            idx = sub.index(max(sub))
-            data = data[:, :, :, idx]
-        mean = np.mean(data[data > 0])
-        median = np.median(data[data > 0])
-
-        values.append(
-            [mean, median])
+    values = []
+    for filename, (row, window) in zip(filenames, _map_subjects(
+            _stats_mean_median_subject,
+            zip(filenames, itertools.repeat(all_volumes),
+                itertools.repeat(chunk_size)),
+            nb_threads, cache, executor)):
+        values.append(row)
+        if window is not None:
+            set_intensity_window(filename, window)
 
     stats_per_subjects = pd.DataFrame(values, index=sub_filenames,
                                       columns=column_names)
 
-    stats_across_subjects = pd.DataFrame([stats_per_subjects.mean(),
-                                          stats_per_subjects.std(),
-                                          stats_per_subjects.min(),
-                                          stats_per_subjects.max()],
-                                         index=['mean', 'std', 'min', 'max'],
-                                         columns=column_names)
+    return stats_per_subjects, stats_across_subjects(stats_per_subjects,
+                                                      column_names)
+
+
+def _stats_mean_median_subject(filename, all_volumes=False, chunk_size=10):
+    # The stats are computed in float64, like the values of the reports.
+    img = load_img(filename)
+    shape = img.shape
+
+    if len(shape) > 3 and all_volumes:
+        return list(_positive_stats_chunked(img, chunk_size)), None
+    elif len(shape) > 3:
+        sub = get_data_slice(img, (shape[0] // 2, shape[1] // 2,
+                                   shape[2] // 2, slice(None)))
+        idx = int(np.argmax(sub))
+        data = get_data_slice(img, (Ellipsis, idx), dtype=np.float64)
+        data = data[data > 0]
+    else:
+        data = get_data(img, dtype=np.float64)
+        positive = data[data > 0]
+
+        mean = np.mean(positive, dtype=np.float64)
+        median = np.median(positive)
+
+        # The intensity window is computed from the displayed values, like
+        # the screenshots do, so they can reuse it.
+        return [mean, median], compute_intensity_window(
+            get_display_data(data))
 
-    return stats_per_subjects, stats_across_subjects
+    mean = np.mean(data, dtype=np.float64)
+    median = np.median(data)
+
+    return [mean, median], None
+
+
+def _positive_stats_chunked(img, chunk_size, nb_bins=4096,
+                           max_values=2 ** 20):
+    """
+    Compute the mean and median of the values higher than 0 of a 4D image,
+    reading chunk_size volumes at a time so neither the whole 4D array nor
+    all its positive values are held in memory.
+
+    The mean is accumulated over the chunks. The median is exact and found
+    by refining a histogram: each pass over the volumes counts the values of
+    the current range in nb_bins bins and keeps the bins holding the middle
+    ranks, until they hold at most max_values values. These are then
+    gathered and the median selected among them. Most images need three
+    passes: the count, one histogram and the gathering.
+    """
+    count = 0
+    total = 0.
+    low = np.inf
+    high = -np.inf
+    for values in _iter_positive_chunks(img, chunk_size):
+        if len(values):
+            count += len(values)
+            total += np.sum(values)
+            low = min(low, np.min(values))
+            high = max(high, np.max(values))
+
+    if count == 0:
+        return np.nan, np.nan
+    if low == high:
+        return total / count, float(low)
+
+    # Middle ranks, among the values of [low, high] (or [low, high[ once
+    # the range is not closed) with below values lower than low.
+    ranks = np.array([(count - 1) // 2, count // 2])
+    below = 0
+    closed = True
+    nb_values = count
+    while nb_values > max_values:
+        edges = np.linspace(low, high, nb_bins + 1)
+        counts = np.zeros(nb_bins, dtype=np.int64)
+        range_low = np.inf
+        range_high = -np.inf
+        for values in _iter_positive_chunks(img, chunk_size):
+            values = values[_in_range(values, low, high, closed)]
+            if len(values):
+                counts += np.histogram(values, edges)[0]
+                range_low = min(range_low, np.min(values))
+                range_high = max(range_high, np.max(values))
+
+        if range_low == range_high:
+            # Ties: the middle ranks are all the same value.
+            return total / count, float(range_low)
+
+        cumulative = below + np.cumsum(counts)
+        first, last = np.searchsorted(cumulative, ranks, side='right')
+        refined = (edges[first], edges[last + 1],
+                   closed and last == nb_bins - 1)
+        if refined == (low, high, closed):
+            # The bins cannot split the range further.
+            break
+        low, high, closed = refined
+        below += np.sum(counts[:first])
+        nb_values = np.sum(counts[first:last + 1])
+
+    selected = np.concatenate([values[_in_range(values, low, high, closed)]
+                               for values in _iter_positive_chunks(
+                                   img, chunk_size)])
+    selected = np.partition(selected, ranks - below)
+    return total / count, np.mean(selected[ranks - below])
+
+
+def _iter_positive_chunks(img, chunk_size):
+    for start in range(0, img.shape[3], chunk_size):
+        chunk = get_data_slice(img, (Ellipsis,
+                                     slice(start, start + chunk_size)),
+                               dtype=np.float64)
+        yield chunk[chunk > 0]
+
+
+def _in_range(values, low, high, closed):
+    if closed:
+        return (values >= low) & (values <= high)
+    return (values >= low) & (values < high)
 
 
 def stats_mean_in_tissues(column_names, images, wm_images, gm_images,
-                          csf_images):
+                          csf_images, nb_threads=1, cache=None,
+                          executor=None):
     """
     Compute mean value in WM, GM and CSF mask.
 
@@ -72,6 +207,13 @@ def stats_mean_in_tissues(column_names, images, wm_images, gm_images,
         GM filenames in Nifti format.
     csf_images : array of strings
         CSF filenames in Nifti format.
+    nb_threads : int
+        Number of processes used to compute the stats of the subjects.
+    cache : ResultCache
+        Cache of the stats of each subject. Not used if None.
+    executor : Executor
+        Executor running the subjects. A pool of nb_threads processes if
+        None.
 
     Returns
     -------
@@ -80,37 +222,111 @@ def stats_mean_in_tissues(column_names, images, wm_images, gm_images,
     stats_across_subjects : DataFrame
         DataFrame containing mean, std, min and max of mean across subjects.
     """
+    return stats_mean_in_tissues_multi([(column_names, images)], wm_images,
+                                       gm_images, csf_images,
+                                       nb_threads=nb_threads,
+                                       cache=cache, executor=executor)[0]
+
+
+def stats_mean_in_tissues_multi(metrics, wm_images, gm_images, csf_images,
+                                nb_threads=1, cache=None, executor=None):
+    """
+    Compute mean value in WM, GM and CSF mask for several metrics at once.
+    The tissue masks of a subject are loaded only once and shared by all
+    the metrics.
+
+    Parameters
+    ----------
+    metrics : list of tuple
+        List of (column_names, images) for each metric. column_names are the
+        names of the columns and images the array of filenames in Nifti
+        format of the metric.
+    wm_images : array of strings
+        WM filenames in Nifti format.
+    gm_images : array of strings
+        GM filenames in Nifti format.
+    csf_images : array of strings
+        CSF filenames in Nifti format.
+    nb_threads : int
+        Number of processes used to compute the stats of the subjects.
+    cache : ResultCache
+        Cache of the stats of each subject. Not used if None.
+    executor : Executor
+        Executor running the subjects. A pool of nb_threads processes if
+        None.
+
+    Returns
+    -------
+    stats : list of tuple
+        (stats_per_subjects, stats_across_subjects) for each metric, in the
+        same order as metrics.
+    """
+    subjects_images = zip(*[images for _, images in metrics])
+    subjects_values = _map_subjects(_stats_in_tissues_subject,
+                                    zip(subjects_images, wm_images,
+                                        gm_images, csf_images),
+                                    nb_threads, cache, executor)
+
+    stats = []
+    for i, (column_names, images) in enumerate(metrics):
+        sub_images = [os.path.basename(curr_subj).split('.')[0]
+                      for curr_subj in images]
+        stats_per_subjects = pd.DataFrame([values[i] for values in
+                                           subjects_values],
+                                          index=sub_images,
+                                          columns=column_names)
+        stats.append((stats_per_subjects,
+                      stats_across_subjects(stats_per_subjects,
+                                             column_names)))
+
+    return stats
+
+
+def _stats_in_tissues_subject(images, wm_image, gm_image, csf_image):
+    masks = [wm_image, gm_image, csf_image]
+    tissues = [_load_mask_indices(mask) for mask in masks]
+    indices = [curr_indices for _, curr_indices in tissues]
+
     values = []
-    sub_images = [os.path.basename(curr_subj).split('.')[0] for curr_subj in images]
+    for image in images:
+        data = load_data(image, dtype=np.float64)
+        for mask, (shape, _) in zip(masks, tissues):
+            if data.shape[:3] != shape:
+                raise ValueError('The mask {} {} and the image {} {} do not '
+                                 'have the same shape.'.format(
+                                     mask, shape, image, data.shape[:3]))
 
-    for i in range(len(images)):
-        data = nib.load(images[i]).get_fdata()
-        wm = nib.load(wm_images[i]).get_fdata()
-        gm = nib.load(gm_images[i]).get_fdata()
-        csf = nib.load(csf_images[i]).get_fdata()
+        # One row per voxel (Fortran order, like the mask indices), with the
+        # values of all the volumes of 4D images.
+        data = np.reshape(data, (-1,) + data.shape[3:], order='F')
+        values.append(_mean_in_tissues(data, *indices))
 
-        data_wm = np.mean(data[wm > 0])
-        data_gm = np.mean(data[gm > 0])
-        data_csf = np.mean(data[csf > 0])
-        data_max = np.max(data[wm > 0])
+    return values
 
-        values.append(
-            [data_wm, data_gm, data_csf, data_max])
 
-    stats_per_subjects = pd.DataFrame(values, index=sub_images,
-                                      columns=column_names)
+def _load_mask_indices(filename):
+    """
+    Load a mask as its shape and the flat (Fortran order) indices of its
+    non-zero voxels.
+    """
+    mask = load_mask(filename)
+    return mask.shape, np.flatnonzero(np.ravel(mask, order='F'))
 
-    stats_across_subjects = pd.DataFrame([stats_per_subjects.mean(),
-                                          stats_per_subjects.std(),
-                                          stats_per_subjects.min(),
-                                          stats_per_subjects.max()],
-                                         index=['mean', 'std', 'min', 'max'],
-                                         columns=column_names)
 
-    return stats_per_subjects, stats_across_subjects
+def _mean_in_tissues(data, wm, gm, csf):
+    """
+    Compute the mean in WM, GM and CSF and the max in WM of data flattened
+    to one row per voxel.
+    """
+    data_wm = data[wm]
+    return [np.mean(data_wm, dtype=np.float64),
+            np.mean(data[gm], dtype=np.float64),
+            np.mean(data[csf], dtype=np.float64),
+            np.max(data_wm)]
 
 
-def stats_frf(column_names, filenames):
+def stats_frf(column_names, filenames, nb_threads=1, cache=None,
+              executor=None):
     """
     Compute mean fiber response function.
 
@@ -120,6 +336,13 @@ def stats_frf(column_names, filenames):
         Name of the columns.
     filenames : array of strings
         Array of filenames in txt format.
+    nb_threads : int
+        Number of processes used to compute the stats of the subjects.
+    cache : ResultCache
+        Cache of the stats of each subject. Not used if None.
+    executor : Executor
+        Executor running the subjects. A pool of nb_threads processes if
+        None.
 
     Returns
     -------
@@ -128,26 +351,24 @@ def stats_frf(column_names, filenames):
     stats_across_subjects : DataFrame
         DataFrame containing mean, std, min and max of mean across subjects.
     """
-    values = []
-    for filename in filenames:
-        frf = np.loadtxt(filename)
-        values.append([frf[0], frf[1], frf[3]])
+    values = _map_subjects(_stats_frf_subject, zip(filenames), nb_threads,
+                           cache, executor)
 
     sub_filenames = [os.path.basename(curr_subj).split('.')[0] for curr_subj in filenames]
     stats_per_subjects = pd.DataFrame(values, index=sub_filenames,
                                       columns=column_names)
 
-    stats_across_subjects = pd.DataFrame([stats_per_subjects.mean(),
-                                          stats_per_subjects.std(),
-                                          stats_per_subjects.min(),
-                                          stats_per_subjects.max()],
-                                         index=['mean', 'std', 'min', 'max'],
-                                         columns=column_names)
+    return stats_per_subjects, stats_across_subjects(stats_per_subjects,
+                                                      column_names)
+
 
-    return stats_per_subjects, stats_across_subjects
+def _stats_frf_subject(filename):
+    frf = np.loadtxt(filename)
+    return [frf[0], frf[1], frf[3]]
 
 
-def stats_tractogram(column_names, tractograms):
+def stats_tractogram(column_names, tractograms, nb_threads=1, cache=None,
+                     executor=None):
     """
     Compute mean number of streamlines.
 
@@ -157,6 +378,13 @@ def stats_tractogram(column_names, tractograms):
         Name of the columns.
     tractograms : array of strings
         Array of tractogram files.
+    nb_threads : int
+        Number of processes used to compute the stats of the subjects.
+    cache : ResultCache
+        Cache of the stats of each subject. Not used if None.
+    executor : Executor
+        Executor running the subjects. A pool of nb_threads processes if
+        None.
 
     Returns
     -------
@@ -165,28 +393,140 @@ def stats_tractogram(column_names, tractograms):
     stats_across_subjects : DataFrame
         DataFrame containing mean, std, min and max of mean across subjects.
     """
-    values = []
     sub_tractograms = [os.path.basename(curr_subj).split('.')[0] for curr_subj in tractograms]
-    for tractogram_file in tractograms:
-        tractogram = nib.streamlines.load(tractogram_file, lazy_load=True)
 
-        values.append(
-            [tractogram.header['nb_streamlines']])
+    values = _map_subjects(_stats_tractogram_subject, zip(tractograms),
+                           nb_threads, cache, executor)
 
     stats_per_subjects = pd.DataFrame(values, index=sub_tractograms,
                                       columns=column_names)
 
-    stats_across_subjects = pd.DataFrame([stats_per_subjects.mean(),
-                                          stats_per_subjects.std(),
-                                          stats_per_subjects.min(),
-                                          stats_per_subjects.max()],
-                                         index=['mean', 'std', 'min', 'max'],
-                                         columns=column_names)
+    return stats_per_subjects, stats_across_subjects(stats_per_subjects,
+                                                      column_names)
+
+
+def _stats_tractogram_subject(tractogram_file):
+    tractogram = nib.streamlines.load(tractogram_file, lazy_load=True)
+    return [tractogram.header['nb_streamlines']]
+
+
+def stats_streamlines(column_names, tractograms, nb_threads=1, cache=None,
+                      chunk_size=100000, executor=None):
+    """
+    Compute streamline statistics: number of streamlines, mean, median, 5th
+    and 95th percentiles of the lengths, mean number of points, mean step
+    size and extent (x, y, z) of the streamlines. The tractograms are read
+    chunk_size streamlines at a time.
+
+    The median and percentiles are computed from the histogram of the
+    lengths (bins of LENGTH_BINS).
+
+    Parameters
+    ----------
+    column_names : array of strings
+        Name of the columns.
+    tractograms : array of strings
+        Array of tractogram files.
+    nb_threads : int
+        Number of processes used to compute the stats of the subjects.
+    cache : ResultCache
+        Cache of the stats of each subject. Not used if None.
+    executor : Executor
+        Executor running the subjects. A pool of nb_threads processes if
+        None.
+    chunk_size : int
+        Number of streamlines read at a time.
+
+    Returns
+    -------
+    stats_per_subjects : DataFrame
+        DataFrame containing the stats for each subject.
+    stats_across_subjects : DataFrame
+        DataFrame containing mean, std, min and max of the stats across
+        subjects.
+    histograms : DataFrame
+        Number of streamlines in each length bin (columns, lower edge of
+        the bins) for each subject.
+    """
+    sub_tractograms = [os.path.basename(curr_subj).split('.')[0] for curr_subj in tractograms]
+
+    results = _map_subjects(_stats_streamlines_subject,
+                            zip(tractograms, itertools.repeat(chunk_size)),
+                            nb_threads, cache, executor)
 
-    return stats_per_subjects, stats_across_subjects
+    stats_per_subjects = pd.DataFrame([row for row, _ in results],
+                                      index=sub_tractograms,
+                                      columns=column_names)
+    histograms = pd.DataFrame([histogram for _, histogram in results],
+                              index=sub_tractograms,
+                              columns=LENGTH_BINS[:-1])
+
+    return (stats_per_subjects,
+            stats_across_subjects(stats_per_subjects, column_names),
+            histograms)
+
+
+def _stats_streamlines_subject(tractogram_file, chunk_size=100000):
+    nb_streamlines = 0
+    nb_points = 0
+    nb_steps = 0
+    total_length = 0.
+    histogram = np.zeros(len(LENGTH_BINS) - 1, dtype=np.int64)
+    min_coords = np.full(3, np.inf)
+    max_coords = np.full(3, -np.inf)
+    for chunk in iter_streamlines_chunks(tractogram_file,
+                                         chunk_size=chunk_size, voxel=False):
+        nb_streamlines += len(chunk)
+        data = chunk._data
+        if not len(data):
+            continue
+
+        offsets = chunk._offsets[chunk._lengths > 0]
+        last = offsets + chunk._lengths[chunk._lengths > 0] - 1
+
+        # Path length from the first point of the chunk to each point. The
+        # steps between two streamlines are never between offsets and last.
+        steps = np.sqrt(np.sum(np.diff(data, axis=0) ** 2, axis=1))
+        cum_length = np.concatenate([[0.],
+                                     np.cumsum(steps, dtype=np.float64)])
+        lengths = cum_length[last] - cum_length[offsets]
+
+        nb_points += len(data)
+        nb_steps += len(data) - len(offsets)
+        total_length += np.sum(lengths)
+        histogram += np.histogram(np.minimum(lengths, LENGTH_BINS[-1]),
+                                  LENGTH_BINS)[0]
+        min_coords = np.minimum(min_coords, np.min(data, axis=0))
+        max_coords = np.maximum(max_coords, np.max(data, axis=0))
+
+    if nb_points == 0:
+        row = [nb_streamlines] + [np.nan] * 9
+        return row, histogram.tolist()
+
+    extent = max_coords - min_coords
+    row = [nb_streamlines,
+           total_length / nb_streamlines,
+           _histogram_percentile(histogram, 50),
+           _histogram_percentile(histogram, 5),
+           _histogram_percentile(histogram, 95),
+           nb_points / nb_streamlines,
+           total_length / nb_steps if nb_steps > 0 else np.nan,
+           extent[0], extent[1], extent[2]]
+
+    return row, histogram.tolist()
+
+
+def _histogram_percentile(histogram, q):
+    """
+    Percentile q of the lengths counted in histogram, interpolated linearly
+    in the bins.
+    """
+    cdf = np.concatenate([[0.], np.cumsum(histogram) / np.sum(histogram)])
+    return float(np.interp(q / 100., cdf, LENGTH_BINS))
 
 
-def stats_mask_volume(column_names, images):
+def stats_mask_volume(column_names, images, nb_threads=1, cache=None,
+                      executor=None):
     """
     Compute mean volume in a mask.
 
@@ -196,6 +536,13 @@ def stats_mask_volume(column_names, images):
         Name of the columns.
     images : array of strings
         Array of filenames in Nifti format.
+    nb_threads : int
+        Number of processes used to compute the stats of the subjects.
+    cache : ResultCache
+        Cache of the stats of each subject. Not used if None.
+    executor : Executor
+        Executor running the subjects. A pool of nb_threads processes if
+        None.
 
     Returns
     -------
@@ -204,25 +551,108 @@ def stats_mask_volume(column_names, images):
     stats_across_subjects : DataFrame
         DataFrame containing mean, std, min and max of mean across subjects.
     """
-    values = []
     sub_images = [os.path.basename(curr_subj).split('.')[0] for curr_subj in images]
 
-    for image in images:
-        img = nib.load(image)
-        data = img.get_fdata()
-        voxel_volume = np.prod(img.header['pixdim'][1:4])
-        volume = np.count_nonzero(data) * voxel_volume
-
-        values.append([volume])
+    values = _map_subjects(_stats_mask_volume_subject, zip(images),
+                           nb_threads, cache, executor)
 
     stats_per_subjects = pd.DataFrame(values, index=sub_images,
                                       columns=column_names)
 
-    stats_across_subjects = pd.DataFrame([stats_per_subjects.mean(),
-                                          stats_per_subjects.std(),
-                                          stats_per_subjects.min(),
-                                          stats_per_subjects.max()],
-                                         index=['mean', 'std', 'min', 'max'],
-                                         columns=column_names)
+    return stats_per_subjects, stats_across_subjects(stats_per_subjects,
+                                                      column_names)
+
+
+def _stats_mask_volume_subject(image):
+    img = load_img(image)
+    data = get_data(img, dtype=None)
+    voxel_volume = np.prod(img.header['pixdim'][1:4])
+    volume = np.count_nonzero(data) * voxel_volume
+
+    return [volume]
+
 
-    return stats_per_subjects, stats_across_subjects
+def stats_across_subjects(stats_per_subjects, column_names):
+    """
+    Compute mean, std, min and max across subjects.
+    """
+    return pd.DataFrame([stats_per_subjects.mean(),
+                         stats_per_subjects.std(),
+                         stats_per_subjects.min(),
+                         stats_per_subjects.max()],
+                        index=['mean', 'std', 'min', 'max'],
+                        columns=column_names)
+
+
+def _map_subjects(func, args, nb_threads=1, cache=None, executor=None):
+    """
+    Apply func to the arguments of each subject. The subjects are dispatched
+    to the executor, or to a pool of processes if nb_threads is higher than
+    1. Only the small result row of each subject is sent back and the
+    results keep the order of args.
+
+    Parameters
+    ----------
+    func : callable
+        Function computing the result row of one subject.
+    args : iterable of tuple
+        Arguments of func for each subject.
+    nb_threads : int
+        Number of processes.
+    cache : ResultCache
+        Cache of the result rows. Only the subjects missing from the cache
+        are computed.
+    executor : Executor
+        Executor running the subjects. A pool of nb_threads processes if
+        None.
+
+    Returns
+    -------
+    values : list
+        Result of func for each subject.
+    """
+    args = list(args)
+    if cache is None:
+        return _map(func, args, nb_threads, executor)
+
+    keys = [cache.key(func.__name__, *curr_args) for curr_args in args]
+    values = [cache.get_stats(key) for key in keys]
+    missing = [i for i, curr_values in enumerate(values)
+               if curr_values is None]
+
+    computed = _map(func, [args[i] for i in missing], nb_threads, executor)
+    for i, curr_values in zip(missing, computed):
+        cache.set_stats(keys[i], curr_values)
+        values[i] = curr_values
+
+    return values
+
+
+def _map(func, args, nb_threads, executor=None):
+    """
+    Apply func to each tuple of arguments with the executor.
+
+    Parameters
+    ----------
+    func : callable
+        Function to apply.
+    args : list of tuple
+        Arguments of func for each task.
+    nb_threads : int
+        Number of processes of the default executor.
+    executor : Executor
+        Executor running the tasks. A pool of nb_threads processes if None.
+
+    Returns
+    -------
+    values : list
+        Result of func for each task, in the order of args.
+    """
+    if executor is not None:
+        return executor.starmap(func, args)
+
+    executor = Executor(nb_threads=nb_threads)
+    try:
+        return executor.starmap(func, args)
+    finally:
+        executor.close()
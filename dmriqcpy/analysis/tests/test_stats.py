@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+import unittest
+
+import nibabel as nib
+import numpy as np
+
+from dmriqcpy.analysis.stats import _positive_stats_chunked
+
+
+class TestPositiveStatsChunked(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.rng = np.random.RandomState(0)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _check(self, data, chunk_size=3, **kwargs):
+        filename = os.path.join(self.tmp_dir.name, 'dwi.nii.gz')
+        nib.save(nib.Nifti1Image(data, np.eye(4)), filename)
+        img = nib.load(filename)
+
+        mean, median = _positive_stats_chunked(img, chunk_size, **kwargs)
+
+        positive = np.asanyarray(img.dataobj, dtype=np.float64)
+        positive = positive[positive > 0]
+        self.assertAlmostEqual(mean, np.mean(positive))
+        self.assertEqual(median, np.median(positive))
+
+    def test_floats(self):
+        data = self.rng.normal(100, 50, (6, 7, 8, 10)).astype(np.float32)
+        self._check(data)
+
+    def test_floats_refined(self):
+        # A few values per bin force several refinement passes.
+        data = self.rng.normal(100, 50, (6, 7, 8, 10)).astype(np.float32)
+        self._check(data, nb_bins=4, max_values=5)
+
+    def test_odd_count(self):
+        # 5 * 5 * 5 * 3 positive values: a single middle rank.
+        data = self.rng.uniform(0.1, 1, (5, 5, 5, 3))
+        self._check(data, nb_bins=8, max_values=10)
+
+    def test_integers(self):
+        data = self.rng.randint(-20, 300, (6, 7, 8, 10)).astype(np.int16)
+        self._check(data, nb_bins=16, max_values=50)
+
+    def test_ties(self):
+        # Most values are equal so the bins cannot split the middle ranks.
+        data = np.full((6, 7, 8, 10), 7, dtype=np.int16)
+        data[:2] = self.rng.randint(0, 20, (2, 7, 8, 10))
+        self._check(data, nb_bins=4, max_values=5)
+
+    def test_constant(self):
+        self._check(np.full((3, 3, 3, 4), 2.5, dtype=np.float32))
+
+    def test_no_positive_value(self):
+        filename = os.path.join(self.tmp_dir.name, 'dwi.nii.gz')
+        nib.save(nib.Nifti1Image(np.zeros((3, 3, 3, 4), dtype=np.float32),
+                                 np.eye(4)), filename)
+
+        mean, median = _positive_stats_chunked(nib.load(filename), 2)
+        self.assertTrue(np.isnan(mean))
+        self.assertTrue(np.isnan(median))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+import unittest
+
+import nibabel as nib
+import numpy as np
+
+from dmriqcpy.analysis import utils
+from dmriqcpy.analysis.stats import _stats_mean_median_subject
+
+
+class TestIntensityWindow(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        utils._intensity_windows.clear()
+
+    def tearDown(self):
+        utils._intensity_windows.clear()
+        self.tmp_dir.cleanup()
+
+    def _save(self, data):
+        filename = os.path.join(self.tmp_dir.name, 'image.nii.gz')
+        nib.save(nib.Nifti1Image(data, np.eye(4)), filename)
+        return filename
+
+    def test_same_window_with_nan(self):
+        # Low contrast integer values use the minimum of the whole image,
+        # which the NaN and infinite voxels change if they are not replaced.
+        data = np.arange(4 * 5 * 6, dtype=np.float32).reshape((4, 5, 6)) % 8
+        data[1, 2, 3] = np.nan
+        data[2, 2, 2] = -np.inf
+        filename = self._save(data)
+
+        _, stats_window = _stats_mean_median_subject(filename)
+        utils._intensity_windows.clear()
+        screenshot_window = utils.get_intensity_window(filename)
+
+        self.assertTrue(np.all(np.isfinite(stats_window)))
+        self.assertEqual(stats_window, screenshot_window)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,6 +4,8 @@ import numpy as np
 import os
 import pandas as pd
 
+from dmriqcpy.io.image import load_data
+
 """
 Some functions comes from
 https://github.com/scilus/scilpy/blob/master/scilpy/utils/bvec_bval_tools.py
@@ -263,3 +265,113 @@ def build_ms_from_shell_idx(bvecs, shell_idx):
         ms.append(bvecs[shell_idx == i_ms])
 
     return ms
+
+
+_intensity_windows = {}
+
+
+def get_display_data(data):
+    """
+    Convert image data to the values displayed by the screenshots: float32,
+    with NaN and infinite values replaced by finite numbers. The intensity
+    windows are always computed from these values, whether by the stats or
+    by the screenshots.
+
+    Parameters
+    ----------
+    data : array
+        Image data.
+
+    Returns
+    -------
+    data : array
+        New array of the displayed values.
+    """
+    return np.nan_to_num(np.asarray(data, dtype=np.float32))
+
+
+def compute_intensity_window(data, positive=None):
+    """
+    Compute the intensity window (min, max) used to display an image. The
+    voxels higher than 0 are extracted only once and the percentiles are
+    computed in place with a partition instead of a copy and a sort.
+
+    Parameters
+    ----------
+    data : array
+        Image data, as given by get_display_data.
+    positive : array
+        Values of data higher than 0, if already available. It is reordered
+        in place.
+
+    Returns
+    -------
+    window : tuple of float
+        Min and max values of the window.
+    """
+    if positive is None:
+        positive = data[data > 0]
+
+    min_val = np.min(positive)
+    max_val = np.percentile(positive, 99, overwrite_input=True)
+    if max_val - min_val < 20 and float(max_val).is_integer():
+        min_val = np.nanmin(data)
+        max_val = np.percentile(positive, 99.99, overwrite_input=True)
+
+    return min_val, max_val
+
+
+def get_intensity_window(filename, data=None):
+    """
+    Get the intensity window of an image file. The window is computed once
+    per file and process and reused afterward, e.g. by the screenshots of a
+    subject after its stats.
+
+    The windows are kept in a plain dictionary of the process: a worker
+    only sees the windows known by the parent when it was started, and the
+    ones it computes are lost with it. Only stats_mean_median fills it, in
+    the parent, with the windows it gets back from its workers or from the
+    ResultCache where they are stored with the stats rows. The other stats
+    (e.g. the tissue stats) do not, so their images have their window
+    computed again by the screenshots.
+
+    Parameters
+    ----------
+    filename : string
+        Image filename.
+    data : array
+        Data of the image as given by get_display_data, to avoid loading it
+        again if the window is not known yet.
+
+    Returns
+    -------
+    window : tuple of float
+        Min and max values of the window.
+    """
+    key = _file_key(filename)
+    if key not in _intensity_windows:
+        if data is None:
+            data = get_display_data(load_data(filename))
+        _intensity_windows[key] = compute_intensity_window(data)
+
+    return _intensity_windows[key]
+
+
+def set_intensity_window(filename, window):
+    """
+    Store the intensity window of an image file computed elsewhere, e.g. in
+    a worker process.
+
+    Parameters
+    ----------
+    filename : string
+        Image filename.
+    window : tuple of float
+        Min and max values of the window.
+    """
+    _intensity_windows[_file_key(filename)] = window
+
+
+def _file_key(filename):
+    stat = os.stat(filename)
+    return os.path.realpath(filename), stat.st_size, stat.st_mtime_ns
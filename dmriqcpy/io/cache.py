@@ -0,0 +1,607 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+
+from dmriqcpy.version import __version__
+
+MANIFEST_SUFFIX = '_manifest.json'
+STATS_FILENAME = 'stats.json'
+
+# Entries of the manifests loaded in this process, by manifest filename.
+_manifest_entries = {}
+
+# Entries used during the run, by manifest filename, and the entries used by
+# the tasks of this process when it is a worker, sent back to the parent by
+# the pools of the Executor.
+_used_entries = {}
+_worker_entries = []
+_used_entries_lock = threading.Lock()
+
+
+class ResultCache():
+    """
+    Class to cache per-subject results (stats rows and screenshots) on disk
+    between runs of the dmriqc scripts.
+
+    Each entry is a folder named after a key computed from the inputs of a
+    subject and the parameters used to process it. The inputs are
+    identified by their path, size and modification time, or by a hash of
+    their content.
+    """
+    def __init__(self, cache_dir, max_size=None, hash_content=False):
+        """
+        Initialise the ResultCache Class.
+
+        Parameters
+        ----------
+        cache_dir : string
+            Folder of the cache. Created if it does not exist.
+        max_size : int
+            Maximum size of the cache in bytes. The least recently used
+            entries are removed by evict. No limit if None.
+        hash_content : bool
+            Identify the input files by a hash of their content instead of
+            their size and modification time.
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.hash_content = hash_content
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, name, *args, **kwargs):
+        """
+        Compute the key of an entry.
+
+        Parameters
+        ----------
+        name : string
+            Name of the computation, e.g. the function name.
+        args, kwargs :
+            Arguments of the computation. Strings that are existing files
+            are identified by their fingerprint, the other arguments by
+            their value.
+
+        Returns
+        -------
+        key : string
+            Key of the entry.
+        """
+        return compute_key(name, args, kwargs, self.hash_content)
+
+    def get_stats(self, key):
+        """
+        Get the stats stored for a key.
+
+        Parameters
+        ----------
+        key : string
+            Key of the entry.
+
+        Returns
+        -------
+        values : list
+            Stats of the entry or None if it is not in the cache.
+        """
+        filename = os.path.join(self._entry_dir(key), STATS_FILENAME)
+        try:
+            with open(filename) as f:
+                values = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        self._touch(key)
+        return values
+
+    def set_stats(self, key, values):
+        """
+        Store the stats of a key.
+
+        Parameters
+        ----------
+        key : string
+            Key of the entry.
+        values : list
+            Stats to store. Must be made of numbers, strings, lists or None.
+        """
+        with tempfile.NamedTemporaryFile('w', dir=self.cache_dir,
+                                         suffix='.tmp', delete=False) as f:
+            json.dump(_to_builtin(values), f)
+        self._store(key, f.name, STATS_FILENAME)
+
+    def get_file(self, key, directory):
+        """
+        Copy the file stored for a key into a directory.
+
+        Parameters
+        ----------
+        key : string
+            Key of the entry.
+        directory : string
+            Directory where the file is copied.
+
+        Returns
+        -------
+        filename : string
+            Path of the copied file or None if it is not in the cache.
+        """
+        entry_dir = self._entry_dir(key)
+        try:
+            names = [name for name in os.listdir(entry_dir)
+                     if name != STATS_FILENAME]
+        except OSError:
+            return None
+
+        if not names:
+            return None
+
+        filename = os.path.join(directory, names[0])
+        shutil.copyfile(os.path.join(entry_dir, names[0]), filename)
+        self._touch(key)
+        return filename
+
+    def set_file(self, key, filename):
+        """
+        Store a copy of a file for a key.
+
+        Parameters
+        ----------
+        key : string
+            Key of the entry.
+        filename : string
+            File to store.
+        """
+        fd, tmp_name = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        os.close(fd)
+        shutil.copyfile(filename, tmp_name)
+        self._store(key, tmp_name, os.path.basename(filename))
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache is smaller
+        than max_size.
+        """
+        if self.max_size is None:
+            return
+
+        entries = []
+        total_size = 0
+        for prefix in os.listdir(self.cache_dir):
+            prefix_dir = os.path.join(self.cache_dir, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for key in os.listdir(prefix_dir):
+                entry_dir = os.path.join(prefix_dir, key)
+                size = sum(entry.stat().st_size
+                           for entry in os.scandir(entry_dir))
+                entries.append((os.stat(entry_dir).st_mtime, size,
+                                entry_dir))
+                total_size += size
+
+        for _, size, entry_dir in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total_size -= size
+
+    def close(self):
+        """
+        Called at the end of a run. Evict the least recently used entries.
+        """
+        self.evict()
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def _store(self, key, tmp_name, name):
+        entry_dir = self._entry_dir(key)
+        os.makedirs(entry_dir, exist_ok=True)
+        # Atomic, so concurrent workers never read a partial file.
+        os.replace(tmp_name, os.path.join(entry_dir, name))
+        self._touch(key)
+
+    def _touch(self, key):
+        try:
+            os.utime(self._entry_dir(key))
+        except OSError:
+            pass
+
+
+class ReportManifest():
+    """
+    Class to record the stats and screenshots of each subject of a report in
+    a manifest written next to it.
+
+    With update, the manifest of the previous run is loaded and the subjects
+    whose inputs and parameters did not change reuse their stats and the
+    screenshots already in the data folder. Only the new or changed subjects
+    are processed.
+
+    It has the same interface as ResultCache, which it can use as a second
+    level for the entries missing from the manifest.
+    """
+    def __init__(self, report_name, cache=None, update=False,
+                 hash_content=False):
+        """
+        Initialise the ReportManifest Class.
+
+        Parameters
+        ----------
+        report_name : string
+            Report filename. The manifest is written next to it.
+        cache : ResultCache
+            Cache used for the entries missing from the manifest. Not used
+            if None.
+        update : bool
+            Load the manifest of the previous run.
+        hash_content : bool
+            Identify the input files by a hash of their content instead of
+            their size and modification time.
+        """
+        self.filename = os.path.splitext(report_name)[0] + MANIFEST_SUFFIX
+        self.cache = cache
+        self.update = update
+        self.hash_content = hash_content
+
+        # The workers of a pool only get a copy of this object, so they
+        # send the entries they use back to this process, see
+        # pop_worker_entries.
+        self._owner = os.getpid()
+        _used_entries[self.filename] = []
+
+        self._load()
+
+    def __getstate__(self):
+        # The entries are not sent with each task of a pool: forked workers
+        # find them in _manifest_entries, the others read the manifest.
+        state = self.__dict__.copy()
+        state['stats'] = None
+        state['files'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.filename in _manifest_entries:
+            self.stats, self.files = _manifest_entries[self.filename]
+        else:
+            self._load()
+
+    def key(self, name, *args, **kwargs):
+        """
+        Compute the key of an entry. See ResultCache.key.
+        """
+        return compute_key(name, args, kwargs, self.hash_content)
+
+    def get_stats(self, key):
+        """
+        Get the stats recorded for a key.
+
+        Parameters
+        ----------
+        key : string
+            Key of the entry.
+
+        Returns
+        -------
+        values : list
+            Stats of the entry or None if it is not in the manifest.
+        """
+        values = self.stats.get(key)
+        if values is not None:
+            self._log('stats', key)
+            return values
+
+        if self.cache is not None:
+            values = self.cache.get_stats(key)
+            if values is not None:
+                self._log('stats', key, values)
+                return values
+
+        return None
+
+    def set_stats(self, key, values):
+        """
+        Record the stats of a key.
+
+        Parameters
+        ----------
+        key : string
+            Key of the entry.
+        values : list
+            Stats to record.
+        """
+        self._log('stats', key, _to_builtin(values))
+        if self.cache is not None:
+            self.cache.set_stats(key, values)
+
+    def get_file(self, key, directory):
+        """
+        Get the file recorded for a key.
+
+        Parameters
+        ----------
+        key : string
+            Key of the entry.
+        directory : string
+            Directory of the file. Files of the manifest are already there,
+            files of the cache are copied into it.
+
+        Returns
+        -------
+        filename : string
+            Path of the file or None if it is not in the manifest.
+        """
+        filename = self.files.get(key)
+        if filename is not None and os.path.isfile(filename):
+            self._log('files', key)
+            return filename
+
+        if self.cache is not None:
+            filename = self.cache.get_file(key, directory)
+            if filename is not None:
+                self._log('files', key, filename)
+                return filename
+
+        return None
+
+    def set_file(self, key, filename):
+        """
+        Record the file of a key.
+
+        Parameters
+        ----------
+        key : string
+            Key of the entry.
+        filename : string
+            File to record.
+        """
+        self._log('files', key, filename)
+        if self.cache is not None:
+            self.cache.set_file(key, filename)
+
+    def close(self):
+        """
+        Called at the end of a run. Write the manifest with the entries used
+        during the run and remove the files of the previous run that are no
+        longer used.
+        """
+        stats = {}
+        files = {}
+        with _used_entries_lock:
+            used_entries = _used_entries.pop(self.filename, [])
+            _used_entries[self.filename] = []
+        for kind, key, value in used_entries:
+            entries, previous = ((stats, self.stats) if kind == 'stats'
+                                 else (files, self.files))
+            entries[key] = previous[key] if value is None else value
+
+        used = set(files.values())
+        for filename in set(self.files.values()) - used:
+            if os.path.isfile(filename):
+                os.remove(filename)
+
+        with tempfile.NamedTemporaryFile(
+                'w', dir=os.path.dirname(os.path.abspath(self.filename)),
+                suffix='.tmp', delete=False) as f:
+            json.dump({'version': __version__, 'stats': stats,
+                       'files': files}, f)
+        os.replace(f.name, self.filename)
+        self.stats = stats
+        self.files = files
+        _manifest_entries[self.filename] = (stats, files)
+
+        if self.cache is not None:
+            self.cache.close()
+
+    def _load(self):
+        self.stats = {}
+        self.files = {}
+        if self.update and os.path.isfile(self.filename):
+            with open(self.filename) as f:
+                manifest = json.load(f)
+            if manifest.get('version') == __version__:
+                self.stats = manifest['stats']
+                self.files = manifest['files']
+        _manifest_entries[self.filename] = (self.stats, self.files)
+
+    def _log(self, kind, key, value=None):
+        if os.getpid() == self._owner:
+            record_worker_entries([(self.filename, kind, key, value)])
+        else:
+            _worker_entries.append((self.filename, kind, key, value))
+
+
+class NoCache():
+    """
+    Class with the interface of ResultCache that caches nothing, used when
+    neither a cache directory nor the update of the report is requested.
+    """
+    def key(self, name, *args, **kwargs):
+        return None
+
+    def get_stats(self, key):
+        return None
+
+    def set_stats(self, key, values):
+        pass
+
+    def get_file(self, key, directory):
+        return None
+
+    def set_file(self, key, filename):
+        pass
+
+    def close(self):
+        pass
+
+
+def pop_worker_entries():
+    """
+    Get the manifest entries used by the tasks run by this worker process
+    since the last call. The pools of the Executor return them with the
+    result of each task.
+
+    Returns
+    -------
+    entries : list of tuple
+        Manifest filename, kind, key and value of each entry.
+    """
+    entries = list(_worker_entries)
+    del _worker_entries[:]
+    return entries
+
+
+def record_worker_entries(entries):
+    """
+    Record in the parent process the manifest entries used by a worker, as
+    given by pop_worker_entries. They are written by ReportManifest.close.
+
+    Parameters
+    ----------
+    entries : list of tuple
+        Manifest filename, kind, key and value of each entry.
+    """
+    with _used_entries_lock:
+        for filename, kind, key, value in entries:
+            _used_entries.setdefault(filename, []).append((kind, key, value))
+
+
+def cached_screenshot(cache, screenshot_func, directory, *args, **kwargs):
+    """
+    Compute a screenshot, or copy it from the cache if the same inputs were
+    already rendered with the same parameters.
+
+    Parameters
+    ----------
+    cache : ResultCache or ReportManifest
+        Cache of the results. If None, the screenshot is always computed.
+    screenshot_func : callable
+        Screenshot function returning the path of the image it saved in
+        the directory given as keyword argument.
+    directory : string
+        Directory to save the screenshot.
+    args, kwargs :
+        Arguments of screenshot_func.
+
+    Returns
+    -------
+    name : string
+        Path of the screenshot.
+    """
+    if cache is None:
+        return screenshot_func(*args, directory=directory, **kwargs)
+
+    key = cache.key(screenshot_func.__name__, *args, **kwargs)
+    name = cache.get_file(key, directory)
+    if name is None:
+        name = screenshot_func(*args, directory=directory, **kwargs)
+        cache.set_file(key, name)
+
+    return name
+
+
+def load_cache(args):
+    """
+    Create the manifest of the report and its cache from the arguments added
+    by add_cache_arg and add_update_arg.
+
+    Parameters
+    ----------
+    args: argparse namespace
+
+    Returns
+    -------
+    manifest : ReportManifest
+        Manifest of the report, using a ResultCache if a cache directory was
+        given. For a shard of a job array (see add_executor_arg), which does
+        not write the report, the manifest of the shard in the shard
+        directory, or the ResultCache alone. A NoCache if neither a cache
+        directory nor the update of the report is requested.
+    """
+    cache = None
+    partial = getattr(args, 'executor', None) == 'array'
+    if args.cache_dir:
+        max_size = None
+        # The shards do not evict the entries of the others, the run writing
+        # the report does.
+        if args.cache_size is not None and not partial:
+            max_size = int(args.cache_size * 1024 ** 2)
+        cache = ResultCache(args.cache_dir, max_size=max_size,
+                            hash_content=args.cache_hash)
+
+    if partial:
+        if not args.shard_dir:
+            return cache
+        os.makedirs(args.shard_dir, exist_ok=True)
+        return ReportManifest(
+            os.path.join(args.shard_dir, 'shard_{}'.format(args.shard_index)),
+            cache=cache, update=args.update, hash_content=args.cache_hash)
+
+    if cache is None and not args.update:
+        return NoCache()
+
+    return ReportManifest(args.output_report, cache=cache,
+                          update=args.update, hash_content=args.cache_hash)
+
+
+def compute_key(name, args, kwargs, hash_content=False):
+    """
+    Compute the key of a computation from its name and arguments.
+
+    Parameters
+    ----------
+    name : string
+        Name of the computation, e.g. the function name.
+    args : tuple
+        Positional arguments of the computation.
+    kwargs : dict
+        Keyword arguments of the computation.
+    hash_content : bool
+        Identify the input files by a hash of their content instead of
+        their size and modification time.
+
+    Returns
+    -------
+    key : string
+        Key of the computation.
+    """
+    description = [__version__, name,
+                   [_describe(arg, hash_content) for arg in args],
+                   {param: _describe(value, hash_content)
+                    for param, value in sorted(kwargs.items())}]
+    description = json.dumps(description, sort_keys=True, default=repr)
+    return hashlib.sha1(description.encode('utf-8')).hexdigest()
+
+
+def _describe(arg, hash_content):
+    if isinstance(arg, (list, tuple, np.ndarray)):
+        return [_describe(curr_arg, hash_content) for curr_arg in arg]
+    if isinstance(arg, str) and os.path.isfile(arg):
+        return _fingerprint(arg, hash_content)
+    return _to_builtin(arg)
+
+
+def _fingerprint(filename, hash_content):
+    if hash_content:
+        sha1 = hashlib.sha1()
+        with open(filename, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                sha1.update(chunk)
+        return [os.path.basename(filename), sha1.hexdigest()]
+
+    stat = os.stat(filename)
+    return [os.path.realpath(filename), stat.st_size, stat.st_mtime_ns]
+
+
+def _to_builtin(value):
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [_to_builtin(curr_value) for curr_value in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
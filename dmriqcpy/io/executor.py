@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+
+import itertools
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+from multiprocessing.util import Finalize
+
+from dmriqcpy.io.cache import pop_worker_entries, record_worker_entries
+from dmriqcpy.viz.utils import close_render_context
+
+EXECUTORS = ['process', 'thread', 'array']
+
+
+class Executor():
+    """
+    Class to run the per-subject tasks of a report.
+
+    With process or thread, every subject is processed on this host by a
+    pool of processes or threads. array is a job array backend: each of
+    nb_shards independent processes (e.g. the tasks of a SLURM array) only
+    processes its shard of the subjects and leaves their stats and
+    screenshots in a cache directory shared by all of them. A last run of
+    the script with the same cache directory and a local executor merges
+    them in the report, all the subjects being found in the cache.
+    """
+    def __init__(self, kind='process', nb_threads=1, shard_index=0,
+                 nb_shards=1):
+        """
+        Initialise the Executor Class.
+
+        Parameters
+        ----------
+        kind : string
+            Backend, one of EXECUTORS.
+        nb_threads : int
+            Number of processes or threads of the pools.
+        shard_index : int
+            Index of the shard processed, from 0 to nb_shards - 1. Only
+            used by array.
+        nb_shards : int
+            Number of shards the subjects are split in. Only used by array.
+        """
+        if kind not in EXECUTORS:
+            raise ValueError('Unknown executor {}.'.format(kind))
+        if kind == 'array' and not 0 <= shard_index < nb_shards:
+            raise ValueError('The shard index must be between 0 and the '
+                             'number of shards minus 1.')
+
+        self.kind = kind
+        self.nb_threads = nb_threads
+        self.shard_index = shard_index
+        self.nb_shards = nb_shards
+        self._pool = None
+
+    @property
+    def partial(self):
+        """
+        True if this process only handles a shard of the subjects and does
+        not write the report.
+        """
+        return self.kind == 'array'
+
+    def shard(self, *subjects):
+        """
+        Select the subjects of the shard of this process. The shards are
+        interleaved so they get a similar mix of subjects.
+
+        Parameters
+        ----------
+        subjects : lists
+            Lists of per-subject items (e.g. filenames), in the same order.
+
+        Returns
+        -------
+        subjects : list or tuple of lists
+            Items of the subjects of the shard. All of them without array.
+        """
+        subjects = [list(items) for items in subjects]
+        if self.partial:
+            subjects = [items[self.shard_index::self.nb_shards]
+                        for items in subjects]
+
+        if len(subjects) == 1:
+            return subjects[0]
+        return tuple(subjects)
+
+    def pool(self):
+        """
+        Create a pool of processes, or of threads with thread, with the
+        interface of multiprocessing.Pool. The worker processes release
+        their offscreen render window when they exit, the worker threads
+        when they are joined.
+
+        Returns
+        -------
+        pool : TaskPool
+            New pool of nb_threads workers.
+        """
+        if self.kind == 'thread':
+            return TaskPool(ThreadPool(self.nb_threads))
+        return TaskPool(Pool(self.nb_threads, initializer=_init_worker))
+
+    def starmap(self, func, args):
+        """
+        Apply func to each tuple of arguments. The tasks are run in the
+        current process if there are no more than one task or worker,
+        otherwise in a pool created by the first call and reused by the
+        next ones until close.
+
+        Parameters
+        ----------
+        func : callable
+            Function to apply.
+        args : iterable of tuple
+            Arguments of each task.
+
+        Returns
+        -------
+        results : list
+            Result of each task, in the order of args.
+        """
+        args = list(args)
+        if self.nb_threads is not None and self.nb_threads > 1 and\
+                len(args) > 1:
+            if self._pool is None:
+                self._pool = self.pool()
+            return self._pool.starmap(func, args)
+
+        return list(itertools.starmap(func, args))
+
+    def close(self):
+        """
+        Close the pool of starmap, if any, and wait for its workers to exit.
+        Called by the scripts once their stats are computed, before the
+        pool of the screenshots is created.
+        """
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+
+class TaskPool():
+    """
+    Class wrapping a multiprocessing pool. The manifest entries used by each
+    task in a worker process (see ReportManifest) are returned with its
+    result and recorded in this process, so the workers never write to a
+    shared file.
+
+    Only the methods used by the dmriqc scripts are provided: starmap,
+    starmap_async, imap_unordered, apply_async, close, join and terminate.
+    """
+    def __init__(self, pool):
+        """
+        Initialise the TaskPool Class.
+
+        Parameters
+        ----------
+        pool : multiprocessing.pool.Pool
+            Pool running the tasks.
+        """
+        self._pool = pool
+
+    def starmap(self, func, iterable, chunksize=None):
+        return [_receive(result) for result in self._pool.starmap(
+            _run_task, _tasks(func, iterable), chunksize)]
+
+    def starmap_async(self, func, iterable, chunksize=None):
+        def receive(results):
+            for _, entries in results:
+                record_worker_entries(entries)
+        return _AsyncResult(self._pool.starmap_async(
+            _run_task, _tasks(func, iterable), chunksize, callback=receive),
+            lambda results: [value for value, _ in results])
+
+    def imap_unordered(self, func, iterable, chunksize=1):
+        for result in self._pool.imap_unordered(
+                _run_packed_task, _tasks(func, ((arg,) for arg in iterable)),
+                chunksize):
+            yield _receive(result)
+
+    def apply_async(self, func, args=(), kwds={}, callback=None,
+                    error_callback=None):
+        def receive(result):
+            value = _receive(result)
+            if callback is not None:
+                callback(value)
+        return _AsyncResult(self._pool.apply_async(
+            _run_task, (func, args, kwds), callback=receive,
+            error_callback=error_callback), lambda result: result[0])
+
+    def close(self):
+        self._pool.close()
+
+    def join(self):
+        self._pool.join()
+
+    def terminate(self):
+        self._pool.terminate()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.terminate()
+
+
+class _AsyncResult():
+    # Result of the async methods of TaskPool. The manifest entries are
+    # recorded by the callback of the task, before its result is ready.
+    def __init__(self, result, unpack):
+        self._result = result
+        self._unpack = unpack
+
+    def ready(self):
+        return self._result.ready()
+
+    def wait(self, timeout=None):
+        self._result.wait(timeout)
+
+    def get(self, timeout=None):
+        return self._unpack(self._result.get(timeout))
+
+
+def _init_worker():
+    # The pool workers do not run the atexit handlers, only the finalizers
+    # of multiprocessing, and only when they exit after close and join.
+    Finalize(None, close_render_context, exitpriority=0)
+
+
+def _tasks(func, iterable):
+    return ((func, args) for args in iterable)
+
+
+def _run_task(func, args, kwargs={}):
+    return func(*args, **kwargs), pop_worker_entries()
+
+
+def _run_packed_task(task):
+    return _run_task(*task)
+
+
+def _receive(result):
+    value, entries = result
+    record_worker_entries(entries)
+    return value
+
+
+def load_executor(args):
+    """
+    Create the executor from the arguments added by add_executor_arg.
+
+    Parameters
+    ----------
+    args: argparse namespace
+
+    Returns
+    -------
+    executor : Executor
+        Executor of the per-subject tasks.
+    """
+    return Executor(args.executor, nb_threads=args.nb_threads,
+                    shard_index=args.shard_index, nb_shards=args.nb_shards)
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+import nibabel as nib
+import numpy as np
+
+
+def load_img(filename):
+    """
+    Load a Nifti image. Uncompressed images are memory-mapped, so the data is
+    only read from the disk when it is accessed.
+
+    Parameters
+    ----------
+    filename : string
+        Image filename.
+
+    Returns
+    -------
+    img : nibabel image
+        Image with its data proxy.
+    """
+    return nib.load(filename, mmap=True)
+
+
+def get_data(img, dtype=np.float32):
+    """
+    Get the data of an image without the float64 upcast of get_fdata.
+
+    Parameters
+    ----------
+    img : nibabel image
+        Image.
+    dtype : numpy dtype
+        Type of the returned data. If None, the data keeps the type stored
+        on disk (after the scaling of the header, if any) and unscaled
+        uncompressed images stay memory-mapped.
+
+    Returns
+    -------
+    data : array
+        Data of the image.
+    """
+    return np.asarray(img.dataobj, dtype=dtype)
+
+
+def load_data(filename, dtype=np.float32):
+    """
+    Load the data of a Nifti image.
+
+    Parameters
+    ----------
+    filename : string
+        Image filename.
+    dtype : numpy dtype
+        Type of the returned data. See get_data.
+
+    Returns
+    -------
+    data : array
+        Data of the image.
+    """
+    return get_data(load_img(filename), dtype=dtype)
+
+
+def load_mask(filename):
+    """
+    Load a Nifti image as a boolean mask of its non-zero voxels.
+
+    Parameters
+    ----------
+    filename : string
+        Mask filename.
+
+    Returns
+    -------
+    mask : array of bool
+        Mask of the image.
+    """
+    return get_data(load_img(filename), dtype=None) > 0
+
+
+def get_data_slice(img, slicer, dtype=np.float32):
+    """
+    Read only a part of the data of an image through its array proxy.
+
+    Parameters
+    ----------
+    img : nibabel image
+        Image.
+    slicer : tuple
+        Slicing applied to the data before it is read, e.g.
+        (Ellipsis, idx) to get the volume idx of a 4D image.
+    dtype : numpy dtype
+        Type of the returned data. If None, keep the type stored on disk.
+
+    Returns
+    -------
+    data : array
+        Sliced data of the image.
+    """
+    return np.asarray(img.dataobj[slicer], dtype=dtype)
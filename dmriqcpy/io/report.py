@@ -1,10 +1,25 @@
 # -*- coding: utf-8 -*-
 
-from os.path import dirname, join, realpath
+import filecmp
+import hashlib
+from os.path import basename, dirname, join, realpath, splitext
 import os
-from shutil import copytree, copyfile
+import re
+import shutil
+import tempfile
 
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+import plotly
+import plotly.io
+from plotly.offline import get_plotlyjs_version
+
+TEMPLATE_DIR = join(dirname(realpath(__file__)), "../template")
+LIBS_DIR = join(TEMPLATE_DIR, "libs")
+
+# Libraries installed from other packages, used by every graph of the
+# report.
+PACKAGE_LIBS = {'js/plotly.min.js': join(dirname(plotly.__file__),
+                                         "package_data", "plotly.min.js")}
 
 ONLINE_LIBS = ['js/FileSaver.js',
                'js/StreamSaver.min.js',
@@ -13,12 +28,41 @@ ONLINE_LIBS = ['js/FileSaver.js',
                'css/style.css',
                'css/w3.css']
 
+OFFLINE_LIBS = ONLINE_LIBS + [
+    'css/bootstrap.min.css',
+    'css/select2.min.css',
+    'css/ekko-lightbox.css',
+    'css/bootstrap-multiselect.css',
+    'fontawesome-free-5.11.2-web/css/all.css',
+    'DataTables/datatables.min.css',
+    'DataTables/Buttons-1.6.1/css/buttons.dataTables.css',
+    'js/jquery.min.js',
+    'js/jquery-3.3.1.js',
+    'js/bootstrap.min.js',
+    'js/ekko-lightbox.js',
+    'js/ekko-lightbox.min.js',
+    'js/select2.min.js',
+    'DataTables/datatables.min.js',
+    'DataTables/Buttons-1.6.1/js/dataTables.buttons.js',
+    'DataTables/Buttons-1.6.1/js/buttons.print.min.js',
+    'DataTables/Buttons-1.6.1/js/buttons.html5.min.js',
+    'js/pdfmake.min.js',
+    'js/vfs_fonts.js',
+    'js/bootstrap-multiselect.js',
+    'js/plotly.min.js']
+
+# Name of the asset bundle of each mode, computed once per process.
+_bundle_names = {}
+
+# Jinja environment shared by the reports of the process.
+_environment = None
+
 
 class Report():
     """
     Class to create html report for dmriqc.
     """
-    def __init__(self, report_name):
+    def __init__(self, report_name, assets_dir=None, page_size=None):
         """
         Initialise the Report Class.
 
@@ -26,12 +70,23 @@ class Report():
         ----------
         report_name : string
             Report name in html format.
+        assets_dir : string
+            Folder of the libraries shared by several reports. The report
+            refers to them by relative path instead of having its own copy
+            in a libs folder next to it. Not used if None.
+        page_size : int
+            Number of subjects per page. If set, the report only holds the
+            list of the subjects of each metric and their stats and
+            screenshots are written by pages in a folder next to it, loaded
+            by the browser when they are viewed. All the subjects are in
+            the report if None.
         """
         self.path = dirname(realpath(__file__))
-        self.env = Environment(loader=FileSystemLoader(
-            join(self.path, "../template")))
+        self.env = get_environment()
 
         self.report_name = report_name
+        self.assets_dir = assets_dir
+        self.page_size = page_size
         self.out_dir = dirname(report_name)
         if ".html" not in self.report_name:
             self.report_name += ".html"
@@ -66,25 +121,189 @@ class Report():
             warning_dict[METRIC_NAME] = { 'WANING_TYPE': ARRAY_OF_SUBJECTS,
                                           'nb_warnings': NUMBER_OF_SUBJECTS}
         """
-        if online:
-            os.makedirs(join(self.out_dir, "libs/css"))
-            os.makedirs(join(self.out_dir, "libs/js"))
-            for curr_lib in ONLINE_LIBS:
-                copyfile(join(self.path, "../template/libs/", curr_lib),
-                         join(self.out_dir, "libs/", curr_lib))
-        else:
-            copytree(join(self.path, "../template/libs"),
-                     join(self.out_dir, "libs"))
+        libs = install_libs(self.out_dir, online=online,
+                            assets_dir=self.assets_dir)
+
+        pages = None
+        if self.page_size:
+            pages = self._write_pages(metrics_dict)
 
+        template = self.env.get_template('template.html')
         with open(self.report_name, 'w') as out_file:
-            template = self.env.get_template('template.html')
-
-            rendered = template.render(title=title,
-                                       nb_subjects=nb_subjects,
-                                       summary_dict=summary_dict,
-                                       graph_summ=graph_array,
-                                       metrics_dict=metrics_dict,
-                                       warning_list=warning_dict,
-                                       online=online)
-            out_file.write(rendered)
-            out_file.close()
+            # Written as it is rendered, the report is never held whole in
+            # memory.
+            out_file.writelines(template.generate(
+                title=title,
+                nb_subjects=nb_subjects,
+                summary_dict=summary_dict,
+                graph_summ=graph_array,
+                metrics_dict=metrics_dict,
+                warning_list=warning_dict,
+                online=online,
+                libs=libs,
+                plotlyjs_version=get_plotlyjs_version(),
+                figure_template=plotly.io.templates['plotly'].to_plotly_json(),
+                page_size=self.page_size,
+                pages=pages))
+
+    def _write_pages(self, metrics_dict):
+        """
+        Write the pages of subjects of each metric as scripts, loaded by the
+        report on demand. Scripts are used instead of JSON files, which
+        browsers do not let a local report fetch.
+
+        Parameters
+        ----------
+        metrics_dict : dict
+            Dictionnary of the subjects informations for each metric, as
+            given to generate.
+
+        Returns
+        -------
+        pages : string
+            Folder of the pages, relative to the folder of the report.
+        """
+        pages = splitext(basename(self.report_name))[0] + "_pages"
+        pages_dir = join(self.out_dir, pages)
+        if os.path.isdir(pages_dir):
+            shutil.rmtree(pages_dir)
+        os.makedirs(pages_dir)
+
+        template = self.env.get_template('page.js')
+        for metric_index, (metric_name, metric_values) in enumerate(
+                sorted(metrics_dict.items())):
+            subjects = sorted(metric_values.items())
+            for page, start in enumerate(range(0, len(subjects),
+                                               self.page_size)):
+                filename = join(pages_dir,
+                                "{}_{}.js".format(metric_index, page))
+                with open(filename, 'w') as out_file:
+                    out_file.writelines(template.generate(
+                        metric_id=metric_name.replace(" ", "_"), page=page,
+                        subjects=subjects[start:start + self.page_size]))
+
+        return pages
+
+
+def get_environment():
+    """
+    Get the Jinja environment of the templates of the report. It is created
+    once per process and the compiled templates are cached on disk, in a
+    folder of the temporary directory, for the next processes.
+
+    Returns
+    -------
+    env : jinja2.Environment
+        Environment loading the templates of the report.
+    """
+    global _environment
+    if _environment is None:
+        _environment = Environment(loader=FileSystemLoader(TEMPLATE_DIR),
+                                   bytecode_cache=FileSystemBytecodeCache())
+    return _environment
+
+
+def list_libs(online=False):
+    """
+    List the files of the libraries used by the report, with the files
+    their stylesheets refer to (fonts, images).
+
+    Parameters
+    ----------
+    online : bool
+        If set, the report grabs most of its libraries from the internet.
+
+    Returns
+    -------
+    libs : list of strings
+        Paths of the files, relative to the libs folder of the template.
+    """
+    libs = set()
+    for curr_lib in ONLINE_LIBS if online else OFFLINE_LIBS:
+        libs.add(curr_lib)
+        if curr_lib.endswith('.css'):
+            libs.update(_css_dependencies(curr_lib))
+    return sorted(libs)
+
+
+def install_libs(out_dir, online=False, assets_dir=None):
+    """
+    Install the libraries used by a report. The files already installed and
+    identical are not copied again.
+
+    Parameters
+    ----------
+    out_dir : string
+        Folder of the report.
+    online : bool
+        If set, the report grabs most of its libraries from the internet.
+    assets_dir : string
+        Folder of the libraries shared by several reports. They are
+        installed in a sub-folder named after their content, shared by all
+        the reports using the same files. If None, they are installed in
+        the libs folder of the report.
+
+    Returns
+    -------
+    libs : string
+        Path of the folder of the libraries, relative to out_dir.
+    """
+    libs = list_libs(online)
+    if assets_dir is None:
+        _copy_libs(libs, join(out_dir, "libs"))
+        return "libs"
+
+    if online not in _bundle_names:
+        _bundle_names[online] = _bundle_name(libs)
+    bundle = join(assets_dir, _bundle_names[online])
+    if not os.path.isdir(bundle):
+        # Copied aside then renamed, so the reports written at the same
+        # time never see a partial bundle.
+        os.makedirs(assets_dir, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(prefix='.tmp', dir=assets_dir)
+        _copy_libs(libs, tmp_dir)
+        try:
+            os.rename(tmp_dir, bundle)
+        except OSError:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    return os.path.relpath(bundle, out_dir or os.curdir)
+
+
+def _css_dependencies(css_lib):
+    with open(join(LIBS_DIR, css_lib), encoding='utf-8',
+              errors='ignore') as f:
+        urls = re.findall(r'url\(\s*["\']?([^"\')]+)', f.read())
+
+    dependencies = []
+    for url in urls:
+        url = re.split('[?#]', url)[0]
+        if ':' in url:
+            continue
+        dependency = os.path.normpath(join(dirname(css_lib), url))
+        if os.path.isfile(join(LIBS_DIR, dependency)):
+            dependencies.append(dependency)
+    return dependencies
+
+
+def _lib_source(curr_lib):
+    return PACKAGE_LIBS.get(curr_lib, join(LIBS_DIR, curr_lib))
+
+
+def _copy_libs(libs, out_dir):
+    for curr_lib in libs:
+        src = _lib_source(curr_lib)
+        dst = join(out_dir, curr_lib)
+        if os.path.isfile(dst) and filecmp.cmp(src, dst):
+            continue
+        os.makedirs(dirname(dst), exist_ok=True)
+        shutil.copy2(src, dst)
+
+
+def _bundle_name(libs):
+    sha1 = hashlib.sha1()
+    for curr_lib in libs:
+        sha1.update(curr_lib.encode('utf-8'))
+        with open(_lib_source(curr_lib), 'rb') as f:
+            sha1.update(hashlib.sha1(f.read()).digest())
+    return sha1.hexdigest()
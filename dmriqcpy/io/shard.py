@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import re
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from dmriqcpy.analysis.stats import stats_across_subjects
+from dmriqcpy.io.report import Report
+from dmriqcpy.version import __version__
+import dmriqcpy.viz.graph as graph
+from dmriqcpy.viz.utils import analyse_qa, dataframe_to_html
+
+SHARD_PREFIX = 'shard_'
+
+
+class ReportShard():
+    """
+    Class to record the partial results of a report for a shard of the
+    subjects: the stats rows, screenshots and HTML fragments of each
+    subject. merge_shards combines any number of shards of the same report,
+    recomputes the stats across subjects, the warnings and the graphs, and
+    writes the report.
+    """
+    def __init__(self, title, nb_subjects):
+        """
+        Initialise the ReportShard Class.
+
+        Parameters
+        ----------
+        title : string
+            Title of the report.
+        nb_subjects : int
+            Number of subjects of the shard.
+        """
+        self.title = title
+        self.nb_subjects = nb_subjects
+        self.tables = {}
+        self.summaries = []
+        self.graphs = []
+        self.metrics = {}
+        self.warnings = {}
+
+    def add_table(self, name, table):
+        """
+        Record a table with a row for each subject of the shard.
+
+        Parameters
+        ----------
+        name : string
+            Name of the table.
+        table : DataFrame
+            Table indexed by subject.
+        """
+        self.tables[name] = json.loads(table.to_json(orient='split',
+                                                     double_precision=15))
+
+    def add_summary(self, name, summary, qa_columns):
+        """
+        Record the stats of a metric, shown in the summary tab. The stats
+        across subjects and the warnings are computed by merge_shards.
+
+        Parameters
+        ----------
+        name : string
+            Name of the metric.
+        summary : DataFrame
+            Stats of each subject of the shard.
+        qa_columns : list of strings
+            Columns of summary analysed for the warnings (see analyse_qa).
+        """
+        self.add_table(name, summary)
+        self.summaries.append([name, list(qa_columns)])
+
+    def add_graph(self, function, title, table, columns=None):
+        """
+        Record a graph of the report, built by merge_shards from a table of
+        all the subjects.
+
+        Parameters
+        ----------
+        function : string
+            Name of the graph function of dmriqcpy.viz.graph.
+        title : string
+            Title of the graph.
+        table : string
+            Name of the table given to the graph function.
+        columns : string or list of strings
+            Column or columns given to the graph function, if it takes any.
+        """
+        if columns is not None and not isinstance(columns, str):
+            columns = list(columns)
+        self.graphs.append([function, title, table, columns])
+
+    def add_subjects(self, metrics_dict):
+        """
+        Record the screenshots and stats HTML of the subjects of the shard.
+
+        Parameters
+        ----------
+        metrics_dict : dict
+            Subjects informations for each metric, as given to
+            Report.generate.
+        """
+        for name, subjects_dict in metrics_dict.items():
+            self.metrics.setdefault(name, {}).update(subjects_dict)
+
+    def add_warnings(self, name, warning_type, subjects):
+        """
+        Record subjects flagged by the script itself (e.g. failed
+        screenshots) in the warnings of a metric.
+
+        Parameters
+        ----------
+        name : string
+            Name of the metric.
+        warning_type : string
+            Type of warning.
+        subjects : list of strings
+            Flagged subjects.
+        """
+        self.warnings.setdefault(name, {}).setdefault(
+            warning_type, []).extend(subjects)
+
+    def save(self, shard_dir, shard_index):
+        """
+        Write the shard in a directory shared by the shards of the report.
+
+        Parameters
+        ----------
+        shard_dir : string
+            Directory of the shards. Created if it does not exist.
+        shard_index : int
+            Index of the shard, which names its file.
+
+        Returns
+        -------
+        filename : string
+            Filename of the shard.
+        """
+        os.makedirs(shard_dir, exist_ok=True)
+        filename = os.path.join(shard_dir,
+                                '{}{}.json'.format(SHARD_PREFIX, shard_index))
+        with tempfile.NamedTemporaryFile('w', dir=shard_dir, suffix='.tmp',
+                                         delete=False) as f:
+            json.dump({'version': __version__, 'title': self.title,
+                       'nb_subjects': self.nb_subjects,
+                       'tables': self.tables, 'summaries': self.summaries,
+                       'graphs': self.graphs, 'metrics': self.metrics,
+                       'warnings': self.warnings}, f)
+        os.replace(f.name, filename)
+        return filename
+
+
+def list_shards(paths):
+    """
+    List the shard files of directories of shards or of a list of files.
+
+    Parameters
+    ----------
+    paths : list of strings
+        Shard directories or files.
+
+    Returns
+    -------
+    shards : list of strings
+        Shard filenames, sorted.
+    """
+    shards = []
+    for path in paths:
+        if os.path.isdir(path):
+            shards.extend(os.path.join(path, name)
+                          for name in os.listdir(path)
+                          if re.match(SHARD_PREFIX + r'\d+\.json$', name))
+        else:
+            shards.append(path)
+    return sorted(shards)
+
+
+def merge_shards(shards, report_name, online=False, assets_dir=None,
+                 page_size=None):
+    """
+    Combine the shards of a report and write it. The screenshot paths of
+    the shards are used as is, so the report is written in the directory
+    the shards were computed in.
+
+    Parameters
+    ----------
+    shards : list of strings
+        Shard filenames.
+    report_name : string
+        Report name in html format.
+    online : bool
+        If set, the report uses the internet connexion to grab the needed
+        libraries.
+    assets_dir : string
+        Folder of the libraries shared by several reports. See Report.
+    page_size : int
+        Number of subjects per page of the report. See Report.
+    """
+    contents = []
+    for filename in shards:
+        with open(filename) as f:
+            content = json.load(f)
+        if content['version'] != __version__:
+            raise ValueError('{} was written by dmriqcpy {}, not {}.'.format(
+                filename, content['version'], __version__))
+        if contents and content['title'] != contents[0]['title']:
+            raise ValueError('{} is a shard of another report ({}).'.format(
+                filename, content['title']))
+        contents.append(content)
+
+    if not contents:
+        raise ValueError('No shard to merge.')
+    # The shards of the processes without subjects (more shards than
+    # subjects) are empty but still describe the tables of the report.
+    if not sum(content['nb_subjects'] for content in contents):
+        raise ValueError('No subject in the shards.')
+    first = contents[0]
+
+    # The columns of a table may differ between the shards (e.g. the shells
+    # of their subjects), the missing values are NaN.
+    tables = {}
+    for name in first['tables']:
+        tables[name] = pd.concat(
+            [pd.DataFrame(**content['tables'][name])
+             for content in contents], sort=False).sort_index()
+
+    summary_dict = {}
+    warning_dict = {}
+    for name, qa_columns in first['summaries']:
+        summary = tables[name]
+        stats = stats_across_subjects(summary, summary.columns)
+        summary_dict[name] = dataframe_to_html(stats)
+
+        warning_dict[name] = analyse_qa(summary, stats, qa_columns)
+        for content in contents:
+            for warning_type, subjects in content['warnings'].get(
+                    name, {}).items():
+                warning_dict[name].setdefault(warning_type, []).extend(
+                    subjects)
+        warning_list = np.concatenate([[]] +
+                                      list(warning_dict[name].values()))
+        warning_dict[name]['nb_warnings'] = len(np.unique(warning_list))
+
+    graphs = []
+    for function, title, table, columns in first['graphs']:
+        graph_function = getattr(graph, function)
+        if columns is None:
+            graphs.append(graph_function(title, tables[table]))
+        else:
+            graphs.append(graph_function(title, columns, tables[table]))
+
+    metrics_dict = {}
+    for content in contents:
+        for name, subjects_dict in content['metrics'].items():
+            metrics_dict.setdefault(name, {}).update(subjects_dict)
+    for name, subjects_dict in metrics_dict.items():
+        metrics_dict[name] = dict(sorted(subjects_dict.items()))
+
+    report = Report(report_name, assets_dir=assets_dir,
+                    page_size=page_size)
+    report.generate(title=first['title'],
+                    nb_subjects=sum(content['nb_subjects']
+                                    for content in contents),
+                    summary_dict=summary_dict, graph_array=graphs,
+                    metrics_dict=metrics_dict, warning_dict=warning_dict,
+                    online=online)
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from dmriqcpy.io.cache import ReportManifest, ResultCache
+from dmriqcpy.io.executor import Executor
+
+
+def _record_file(manifest, key, filename):
+    manifest.set_file(key, filename)
+    return key
+
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = ResultCache(os.path.join(self.tmp_dir.name, 'cache'))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _write(self, name, content):
+        filename = os.path.join(self.tmp_dir.name, name)
+        with open(filename, 'w') as f:
+            f.write(content)
+        return filename
+
+    def test_key(self):
+        filename = self._write('image.nii', 'a')
+        key = self.cache.key('stats', filename, skip=2)
+
+        self.assertEqual(self.cache.key('stats', filename, skip=2), key)
+        self.assertNotEqual(self.cache.key('stats', filename, skip=3), key)
+        self.assertNotEqual(self.cache.key('other', filename, skip=2), key)
+
+        self._write('image.nii', 'ab')
+        self.assertNotEqual(self.cache.key('stats', filename, skip=2), key)
+
+    def test_stats(self):
+        self.assertIsNone(self.cache.get_stats('0123'))
+        self.cache.set_stats('0123', [1.5, 2])
+        self.assertEqual(self.cache.get_stats('0123'), [1.5, 2])
+
+    def test_get_file(self):
+        filename = self._write('screenshot.png', 'png')
+        self.assertIsNone(self.cache.get_file('0123', self.tmp_dir.name))
+        self.cache.set_file('0123', filename)
+        os.remove(filename)
+
+        directory = os.path.join(self.tmp_dir.name, 'data')
+        os.makedirs(directory)
+        copy = self.cache.get_file('0123', directory)
+        self.assertEqual(copy, os.path.join(directory, 'screenshot.png'))
+        with open(copy) as f:
+            self.assertEqual(f.read(), 'png')
+
+    def test_evict(self):
+        for i, key in enumerate(['aa11', 'bb22', 'cc33']):
+            self.cache.set_file(key, self._write('{}.png'.format(key),
+                                                 'x' * 100))
+            entry_time = time.time() - 100 + i
+            os.utime(self.cache._entry_dir(key), (entry_time, entry_time))
+        # Reading an entry makes it the most recently used.
+        self.assertIsNotNone(self.cache.get_file('aa11', self.tmp_dir.name))
+
+        self.cache.max_size = 250
+        self.cache.evict()
+
+        self.assertIsNotNone(self.cache.get_file('aa11', self.tmp_dir.name))
+        self.assertIsNone(self.cache.get_file('bb22', self.tmp_dir.name))
+        self.assertIsNotNone(self.cache.get_file('cc33', self.tmp_dir.name))
+
+
+class TestReportManifest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.report = os.path.join(self.tmp_dir.name, 'report.html')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _screenshot(self, name):
+        filename = os.path.join(self.tmp_dir.name, name)
+        with open(filename, 'w') as f:
+            f.write(name)
+        return filename
+
+    def test_update(self):
+        manifest = ReportManifest(self.report)
+        manifest.set_stats('s1', [1., 2.])
+        manifest.set_stats('s2', [3., 4.])
+        manifest.set_file('f1', self._screenshot('sub1.png'))
+        manifest.set_file('f2', self._screenshot('sub2.png'))
+        manifest.close()
+
+        # Only the entries used by the update run are kept, and the
+        # screenshots no longer used are removed.
+        manifest = ReportManifest(self.report, update=True)
+        self.assertEqual(manifest.get_stats('s1'), [1., 2.])
+        self.assertEqual(manifest.get_file('f1', self.tmp_dir.name),
+                         os.path.join(self.tmp_dir.name, 'sub1.png'))
+        self.assertIsNone(manifest.get_stats('s3'))
+        manifest.set_stats('s3', [5., 6.])
+        manifest.close()
+
+        with open(os.path.join(self.tmp_dir.name,
+                               'report_manifest.json')) as f:
+            entries = json.load(f)
+        self.assertEqual(entries['stats'], {'s1': [1., 2.], 's3': [5., 6.]})
+        self.assertEqual(list(entries['files']), ['f1'])
+        self.assertTrue(os.path.isfile(
+            os.path.join(self.tmp_dir.name, 'sub1.png')))
+        self.assertFalse(os.path.isfile(
+            os.path.join(self.tmp_dir.name, 'sub2.png')))
+
+        manifest = ReportManifest(self.report)
+        self.assertIsNone(manifest.get_stats('s1'))
+
+    def test_worker_entries(self):
+        manifest = ReportManifest(self.report)
+        screenshots = [self._screenshot('sub{}.png'.format(i))
+                       for i in range(4)]
+        keys = ['f{}'.format(i) for i in range(4)]
+
+        pool = Executor('process', nb_threads=2).pool()
+        pool.starmap(_record_file,
+                     [(manifest, key, screenshot)
+                      for key, screenshot in zip(keys, screenshots)])
+        pool.close()
+        pool.join()
+        manifest.close()
+
+        self.assertEqual(manifest.files, dict(zip(keys, screenshots)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+import os
+import unittest
+
+from dmriqcpy.io.executor import Executor
+
+
+def _pid(value):
+    return value, os.getpid()
+
+
+class TestExecutor(unittest.TestCase):
+    def test_starmap_reuses_pool(self):
+        executor = Executor('process', nb_threads=2)
+        try:
+            first = executor.starmap(_pid, [(i,) for i in range(8)])
+            pool = executor._pool
+            second = executor.starmap(_pid, [(i,) for i in range(8)])
+            self.assertIs(executor._pool, pool)
+        finally:
+            executor.close()
+
+        self.assertEqual([value for value, _ in first], list(range(8)))
+        self.assertEqual([value for value, _ in second], list(range(8)))
+        self.assertNotIn(os.getpid(), {pid for _, pid in first + second})
+        self.assertIsNone(executor._pool)
+
+    def test_starmap_serial(self):
+        executor = Executor('process', nb_threads=1)
+        results = executor.starmap(_pid, [(i,) for i in range(3)])
+
+        self.assertEqual(results, [(i, os.getpid()) for i in range(3)])
+        self.assertIsNone(executor._pool)
+
+    def test_shard_interleaved(self):
+        subjects = ['sub{}'.format(i) for i in range(10)]
+        masks = ['mask{}'.format(i) for i in range(10)]
+
+        shards = [Executor('array', shard_index=i, nb_shards=3).shard(
+            subjects, masks) for i in range(3)]
+
+        self.assertEqual(shards[0], (['sub0', 'sub3', 'sub6', 'sub9'],
+                                     ['mask0', 'mask3', 'mask6', 'mask9']))
+        self.assertEqual(shards[2], (['sub2', 'sub5', 'sub8'],
+                                     ['mask2', 'mask5', 'mask8']))
+        self.assertEqual(sorted(sum((shard[0] for shard in shards), [])),
+                         sorted(subjects))
+
+    def test_shard_single_list(self):
+        executor = Executor('array', shard_index=1, nb_shards=4)
+        self.assertEqual(executor.shard(range(3)), [1])
+        self.assertEqual(executor.shard([]), [])
+
+    def test_shard_all_subjects(self):
+        subjects = ['sub{}'.format(i) for i in range(5)]
+        self.assertEqual(Executor('process', nb_threads=2).shard(subjects),
+                         subjects)
+
+
+if __name__ == '__main__':
+    unittest.main()
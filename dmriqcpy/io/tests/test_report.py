@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import re
+import tempfile
+import unittest
+
+from dmriqcpy.io.report import Report
+
+
+class TestPaginatedReport(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.report = Report(os.path.join(self.tmp_dir.name, 'report.html'),
+                             page_size=2)
+        self.metrics_dict = {
+            'FA': {'sub{}'.format(i): {'stats': '<p>fa{}</p>'.format(i)}
+                   for i in range(5)},
+            'AD': {'sub{}'.format(i): {'stats': '<p>ad{}</p>'.format(i)}
+                   for i in range(2)}}
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _read_page(self, pages, metric_index, page):
+        filename = os.path.join(self.tmp_dir.name, pages,
+                                '{}_{}.js'.format(metric_index, page))
+        with open(filename) as f:
+            content = f.read()
+        call = re.match(r'add_page\("(\w+)", (\d+), (\[.*\])\);\s*$',
+                        content, re.DOTALL)
+        self.assertIsNotNone(call)
+        self.assertEqual(int(call.group(2)), page)
+        return call.group(1), json.loads(call.group(3))
+
+    def test_write_pages(self):
+        pages = self.report._write_pages(self.metrics_dict)
+
+        self.assertEqual(pages, 'report_pages')
+        # The metrics are sorted: AD is 0 and FA is 1.
+        self.assertEqual(
+            sorted(os.listdir(os.path.join(self.tmp_dir.name, pages))),
+            ['0_0.js', '1_0.js', '1_1.js', '1_2.js'])
+
+        metric, subjects = self._read_page(pages, 0, 0)
+        self.assertEqual(metric, 'AD')
+        self.assertEqual(len(subjects), 2)
+        for page, names in enumerate([['sub0', 'sub1'], ['sub2', 'sub3'],
+                                      ['sub4']]):
+            metric, subjects = self._read_page(pages, 1, page)
+            self.assertEqual(metric, 'FA')
+            self.assertEqual(len(subjects), len(names))
+            for name, subject in zip(names, subjects):
+                self.assertIn('id="{}_status"'.format(name), subject)
+                self.assertIn('<p>fa{}</p>'.format(name[-1]), subject)
+
+    def test_generate(self):
+        self.report.generate(title='QC', nb_subjects=5,
+                             metrics_dict=self.metrics_dict)
+
+        with open(self.report.report_name) as f:
+            content = f.read()
+        # The report only has the page manifest of each metric, the
+        # subjects are added by the viewer from their page.
+        manifests = re.findall(
+            r'<script type="application/json" class="page-manifest">'
+            r'(.*?)</script>', content)
+        self.assertEqual([json.loads(manifest) for manifest in manifests],
+                         [['sub0', 'sub1'],
+                          ['sub0', 'sub1', 'sub2', 'sub3', 'sub4']])
+        self.assertNotIn('id="sub0"', content)
+        self.assertNotIn('<option value="sub0"', content)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import nibabel as nib
+import numpy as np
+
+from dmriqcpy.io.shard import ReportShard, list_shards, merge_shards
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(__file__), '..', '..', '..',
+                           'scripts')
+
+
+class TestShards(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _run(self, script, *args):
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(
+            [os.path.join(SCRIPTS_DIR, '..')] +
+            [path for path in [env.get('PYTHONPATH')] if path])
+        subprocess.run([sys.executable, os.path.join(SCRIPTS_DIR, script)] +
+                       list(args), cwd=self.tmp_dir.name, env=env,
+                       check=True, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL)
+
+    def test_more_shards_than_subjects(self):
+        data = np.random.RandomState(0).rand(20, 20, 20).astype(np.float32)
+        image = os.path.join(self.tmp_dir.name, 'sub0.nii.gz')
+        nib.save(nib.Nifti1Image(data, np.eye(4)), image)
+
+        for shard_index in range(3):
+            self._run('dmriqc_generic.py', 'T1', 'report.html',
+                      '--images', image, '--executor', 'array',
+                      '--shard_index', str(shard_index), '--nb_shards', '3',
+                      '--shard_dir', 'shards')
+
+        shard_dir = os.path.join(self.tmp_dir.name, 'shards')
+        shards = list_shards([shard_dir])
+        self.assertEqual(len(shards), 3)
+        with open(os.path.join(shard_dir, 'shard_2.json')) as f:
+            self.assertEqual(json.load(f)['nb_subjects'], 0)
+
+        self._run('dmriqc_merge_shards.py', 'report.html', 'shards')
+        self.assertTrue(os.path.isfile(os.path.join(self.tmp_dir.name,
+                                                    'report.html')))
+
+    def test_no_subject(self):
+        shard = ReportShard('Report', 0)
+        filename = shard.save(self.tmp_dir.name, 0)
+        with self.assertRaises(ValueError):
+            merge_shards([filename],
+                         os.path.join(self.tmp_dir.name, 'report.html'))
+
+
+if __name__ == '__main__':
+    unittest.main()
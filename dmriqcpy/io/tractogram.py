@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+import nibabel as nib
+from nibabel.affines import apply_affine
+from nibabel.streamlines import ArraySequence, Field
+import numpy as np
+
+
+def iter_streamlines_chunks(filename, reference=None, chunk_size=100000,
+                            voxel=True):
+    """
+    Read a tractogram (TRK or TCK) chunk_size streamlines at a time, so the
+    whole tractogram is never loaded in memory.
+
+    Parameters
+    ----------
+    filename : string
+        Tractogram filename.
+    reference : nibabel image
+        Image giving the voxel space of the streamlines. Only used for
+        formats without one in their header (e.g. TCK).
+    chunk_size : int
+        Number of streamlines in each chunk.
+    voxel : bool
+        If set, the streamlines are in voxel space (the center of a voxel
+        at its integer coordinates). Otherwise, they are in RAS+ mm.
+
+    Returns
+    -------
+    chunks : generator of ArraySequence
+        Streamlines of each chunk.
+    """
+    tractogram_file = nib.streamlines.load(filename, lazy_load=True)
+    rasmm_to_voxel = None
+    if voxel:
+        if isinstance(tractogram_file, nib.streamlines.TrkFile):
+            voxel_to_rasmm = tractogram_file.header[Field.VOXEL_TO_RASMM]
+        elif reference is not None:
+            voxel_to_rasmm = reference.affine
+        else:
+            raise ValueError('A reference image is needed to read the '
+                             'streamlines of {}.'.format(filename))
+        rasmm_to_voxel = np.linalg.inv(voxel_to_rasmm)
+
+    chunk = []
+    for streamline in tractogram_file.streamlines:
+        chunk.append(streamline)
+        if len(chunk) == chunk_size:
+            yield _to_array_sequence(chunk, rasmm_to_voxel)
+            chunk = []
+
+    if chunk:
+        yield _to_array_sequence(chunk, rasmm_to_voxel)
+
+
+def _to_array_sequence(chunk, affine=None):
+    streamlines = ArraySequence(chunk)
+    if affine is not None:
+        streamlines._data = apply_affine(affine,
+                                         streamlines._data).astype(np.float32)
+    return streamlines
@@ -55,7 +55,8 @@ def assert_inputs_exist(parser, required, optional=None,
 
 def assert_outputs_exist(parser, args, required, optional=None):
     """
-    Assert that all outputs don't exist or that if they exist, -f was used.
+    Assert that all outputs don't exist or that if they exist, -f or --update
+    was used.
     If not, print parser's usage and exit.
 
     Parameters
@@ -67,7 +68,11 @@ def assert_outputs_exist(parser, args, required, optional=None):
         Each element will be ignored if None
     """
     def check(path):
-        if os.path.isfile(path) and not args.overwrite:
+        # The shards of a job array do not write the report.
+        if os.path.isfile(path) and not (args.overwrite or
+                                         getattr(args, 'update', False) or
+                                         getattr(args, 'executor',
+                                                 None) == 'array'):
             parser.error('Output file {} exists. Use -f to force '
                          'overwriting'.format(path))
 
@@ -90,6 +95,90 @@ def add_online_arg(parser):
                              'connexion to grab the needed libraries.')
 
 
+def add_report_args(parser):
+    parser.add_argument('--assets_dir',
+                        help='Folder of the libraries shared by several '
+                             'reports, referred to\nby relative path. '
+                             'By default, each report has its own libs\n'
+                             'folder.')
+    parser.add_argument('--page_size', type=int,
+                        help='Number of subjects per page of the report. The '
+                             'report only\nlists the subjects and loads the '
+                             'stats and screenshots of\na page when they are '
+                             'viewed, for the large cohorts. All\nthe '
+                             'subjects are in the report if not set.')
+
+
+def add_cache_arg(parser):
+    parser.add_argument('--cache_dir',
+                        help='Folder used to cache the stats and screenshots '
+                             'of each subject.\nThey are reused by later '
+                             'runs if the inputs and parameters\nare the '
+                             'same. No cache if not set.')
+    parser.add_argument('--cache_size', type=float, default=10000,
+                        help='Maximum size of the cache in MB. The least '
+                             'recently used\nentries are removed. '
+                             '[%(default)s]')
+    parser.add_argument('--cache_hash', action='store_true',
+                        help='Identify the inputs of the cache by a hash of '
+                             'their content\ninstead of their size and '
+                             'modification time.')
+
+
+def add_update_arg(parser):
+    parser.add_argument('--update', action='store_true',
+                        help='Update an existing report. Only the new or '
+                             'changed subjects\nsince the previous run are '
+                             'processed, using the manifest\nwritten next to '
+                             'the report.')
+
+
+def add_executor_arg(parser):
+    parser.add_argument('--executor', default='process',
+                        choices=['process', 'thread', 'array'],
+                        help='How the subjects are processed. process and '
+                             'thread use a pool of\nnb_threads processes or '
+                             'threads. With array, the script only\n'
+                             'processes the shard --shard_index of the '
+                             'subjects (e.g. a task of\na SLURM array) and '
+                             'stores its results in --cache_dir. Run it\n'
+                             'again with the same --cache_dir and another '
+                             'executor once\nall the shards are done to '
+                             'write the report, or merge the\nshards of '
+                             '--shard_dir with dmriqc_merge_shards.py. '
+                             '[%(default)s]')
+    parser.add_argument('--shard_index', type=int, default=0,
+                        help='Index of the shard of the subjects processed, '
+                             'from 0 to\nnb_shards - 1. [%(default)s]')
+    parser.add_argument('--nb_shards', type=int, default=1,
+                        help='Number of shards the subjects are split in. '
+                             '[%(default)s]')
+    parser.add_argument('--shard_dir',
+                        help='Folder where the shards of --executor array '
+                             'write their partial\nreport, merged by '
+                             'dmriqc_merge_shards.py.')
+
+
+def assert_executor_args(parser, args):
+    """
+    Assert that the arguments added by add_executor_arg are valid. If not,
+    print parser's usage and exit.
+
+    Parameters
+    ----------
+    parser: argparse.ArgumentParser object
+    args: argparse namespace
+    """
+    if args.executor != 'array':
+        return
+
+    if not (getattr(args, 'cache_dir', None) or args.shard_dir):
+        parser.error('--executor array needs --cache_dir or --shard_dir to '
+                     'store the results of the shard.')
+    if not 0 <= args.shard_index < args.nb_shards:
+        parser.error('--shard_index must be between 0 and --nb_shards - 1.')
+
+
 def list_files_from_paths(paths):
     """
     Get all images from folder or list of files
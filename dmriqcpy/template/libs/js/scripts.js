@@ -1,4 +1,7 @@
 person = "";
+loaded_pages = {};
+qc_store = {};
+manifests = {};
 
 (function (factory) {
     if (typeof define === 'function' && define.amd) {
@@ -215,6 +218,7 @@ person = "";
 }));
 
 $(document).ready(function () {
+    draw_figures();
     $('.comment_choice').multiselect({ numberDisplayed: 1 });
     var native_width = 0;
     var native_height = 0;
@@ -235,37 +239,37 @@ $(document).ready(function () {
 
     showTab(dict_metrics[currentMetric]);
     function update(mx, my) {
-        var rx = Math.round(mx - $(document.getElementById(currentMetric).getElementsByClassName('magnify')[dict_metrics[currentMetric]]).children(".large").width() / (2 * zoom)) * -1;
-        var ry = Math.round(my - $(document.getElementById(currentMetric).getElementsByClassName('magnify')[dict_metrics[currentMetric]]).children(".large").height() / (2 * zoom)) * -1;
+        var rx = Math.round(mx - $(current_magnify()).children(".large").width() / (2 * zoom)) * -1;
+        var ry = Math.round(my - $(current_magnify()).children(".large").height() / (2 * zoom)) * -1;
         var bgp = rx * zoom + "px " + ry * zoom + "px";
-        var bgs = ($(document.getElementById(currentMetric).getElementsByClassName('magnify')[dict_metrics[currentMetric]]).children(".small").width() * zoom) + "px " + ($(document.getElementById(currentMetric).getElementsByClassName('magnify')[dict_metrics[currentMetric]]).children(".small").height() * zoom) + "px";
+        var bgs = ($(current_magnify()).children(".small").width() * zoom) + "px " + ($(current_magnify()).children(".small").height() * zoom) + "px";
         //Time to move the magnifying glass with the mouse
-        var px = mx - $(document.getElementById(currentMetric).getElementsByClassName('magnify')[dict_metrics[currentMetric]]).children(".large").width() / 2;
-        var py = my - $(document.getElementById(currentMetric).getElementsByClassName('magnify')[dict_metrics[currentMetric]]).children(".large").height() / 2;
+        var px = mx - $(current_magnify()).children(".large").width() / 2;
+        var py = my - $(current_magnify()).children(".large").height() / 2;
         //Now the glass moves with the mouse
         //The logic is to deduct half of the glass's width and height from the
         //mouse coordinates to place it with its center at the mouse coordinates
 
         //If you hover on the image now, you should see the magnifying glass in action
-        $(document.getElementById(currentMetric).getElementsByClassName('magnify')[dict_metrics[currentMetric]]).children(".large").css({ left: px, top: py, backgroundPosition: bgp, backgroundSize: bgs });
+        $(current_magnify()).children(".large").css({ left: px, top: py, backgroundPosition: bgp, backgroundSize: bgs });
     }
 
 
-    $('.large').on('mousewheel', function (event) {
+    $(document).on('mousewheel', '.large', function (event) {
         loadLocker = false;
         image_object = new Image();
-        image_object.src = $(document.getElementById(currentMetric).getElementsByClassName('magnify')[dict_metrics[currentMetric]]).children(".small").attr("src");
+        image_object.src = $(current_magnify()).children(".small").attr("src");
         native_width = image_object.width;
         native_height = image_object.height;
         if (zoom + event.deltaY > 1 && zoom + event.deltaY < 7) {
             zoom += event.deltaY;
-            var magnify_offset = $(document.getElementById(currentMetric).getElementsByClassName('magnify')[dict_metrics[currentMetric]]).offset();
+            var magnify_offset = $(current_magnify()).offset();
             update(event.pageX - magnify_offset.left, event.pageY - magnify_offset.top);
         }
     });
 
     //Now the mousemove function
-    $(".magnify").mousemove(function (e) {
+    $(document).on("mousemove", ".magnify", function (e) {
         if (zoom_activated) {
             //When the user hovers on the image, the script will first calculate
             //the native dimensions if they don't exist. Only after the native dimensions
@@ -278,7 +282,7 @@ $(document).ready(function () {
                 if (loadLocker) {
                     loadLocker = false;
                     image_object = new Image();
-                    image_object.src = $(document.getElementById(currentMetric).getElementsByClassName('magnify')[dict_metrics[currentMetric]]).children(".small").attr("src");
+                    image_object.src = $(current_magnify()).children(".small").attr("src");
                 }
                 //This code is wrapped in the .load function which is important.
                 //width and height of the object would return 0 if accessed before
@@ -290,7 +294,7 @@ $(document).ready(function () {
             else {
                 //x/y coordinates of the mouse
                 //This is the position of .magnify with respect to the document.
-                var magnify_offset = $(document.getElementById(currentMetric).getElementsByClassName('magnify')[dict_metrics[currentMetric]]).offset();
+                var magnify_offset = $(current_magnify()).offset();
                 //We will deduct the positions of .magnify from the mouse positions with
                 //respect to the document to get the mouse positions with respect to the
                 //container(.magnify)
@@ -298,35 +302,35 @@ $(document).ready(function () {
                 var my = e.pageY - magnify_offset.top;
 
                 //Finally the code to fade out the glass if the mouse is outside the container
-                if (mx < $(document.getElementById(currentMetric).getElementsByClassName('magnify')[dict_metrics[currentMetric]]).width() && my < $(document.getElementById(currentMetric).getElementsByClassName('magnify')[dict_metrics[currentMetric]]).height() && mx > 0 && my > 0) {
-                    $(document.getElementById(currentMetric).getElementsByClassName('magnify')[dict_metrics[currentMetric]]).children(".large").fadeIn(100);
+                if (mx < $(current_magnify()).width() && my < $(current_magnify()).height() && mx > 0 && my > 0) {
+                    $(current_magnify()).children(".large").fadeIn(100);
                 }
                 else {
-                    $(document.getElementById(currentMetric).getElementsByClassName('magnify')[dict_metrics[currentMetric]]).children(".large").fadeOut(100);
+                    $(current_magnify()).children(".large").fadeOut(100);
                 }
-                if ($(document.getElementById(currentMetric).getElementsByClassName('magnify')[dict_metrics[currentMetric]]).children(".large").is(":visible")) {
+                if ($(current_magnify()).children(".large").is(":visible")) {
                     //The background position of .large will be changed according to the position
                     //of the mouse over the .small image. So we will get the ratio of the pixel
                     //under the mouse pointer with respect to the image and use that to position the
                     //large image inside the magnifying glass
-                    var rx = Math.round(mx - $(document.getElementById(currentMetric).getElementsByClassName('magnify')[dict_metrics[currentMetric]]).children(".large").width() / (2 * zoom)) * -1;
-                    var ry = Math.round(my - $(document.getElementById(currentMetric).getElementsByClassName('magnify')[dict_metrics[currentMetric]]).children(".large").height() / (2 * zoom)) * -1;
+                    var rx = Math.round(mx - $(current_magnify()).children(".large").width() / (2 * zoom)) * -1;
+                    var ry = Math.round(my - $(current_magnify()).children(".large").height() / (2 * zoom)) * -1;
                     var bgp = rx * zoom + "px " + ry * zoom + "px";
-                    var bgs = ($(document.getElementById(currentMetric).getElementsByClassName('magnify')[dict_metrics[currentMetric]]).children(".small").width() * zoom) + "px " + ($(document.getElementById(currentMetric).getElementsByClassName('magnify')[dict_metrics[currentMetric]]).children(".small").height() * zoom) + "px";
+                    var bgs = ($(current_magnify()).children(".small").width() * zoom) + "px " + ($(current_magnify()).children(".small").height() * zoom) + "px";
 
                     //Time to move the magnifying glass with the mouse
-                    var px = mx - $(document.getElementById(currentMetric).getElementsByClassName('magnify')[dict_metrics[currentMetric]]).children(".large").width() / 2;
-                    var py = my - $(document.getElementById(currentMetric).getElementsByClassName('magnify')[dict_metrics[currentMetric]]).children(".large").height() / 2;
+                    var px = mx - $(current_magnify()).children(".large").width() / 2;
+                    var py = my - $(current_magnify()).children(".large").height() / 2;
                     //Now the glass moves with the mouse
                     //The logic is to deduct half of the glass's width and height from the
                     //mouse coordinates to place it with its center at the mouse coordinates
 
                     //If you hover on the image now, you should see the magnifying glass in action
-                    $(document.getElementById(currentMetric).getElementsByClassName('magnify')[dict_metrics[currentMetric]]).children(".large").css({ left: px, top: py, backgroundPosition: bgp, backgroundSize: bgs });
+                    $(current_magnify()).children(".large").css({ left: px, top: py, backgroundPosition: bgp, backgroundSize: bgs });
                 }
             }
         }
-    }).on("mouseleave", function () {
+    }).on("mouseleave", ".magnify", function () {
         native_width = 0;
         native_height = 0;
         loadLocker = true;
@@ -334,6 +338,15 @@ $(document).ready(function () {
 
 
 
+    init_page = function (subjects) {
+        // Bind the subjects of a page loaded after the report.
+        $(subjects).find('.comment_choice').multiselect({ numberDisplayed: 1 });
+        if (zoom_activated) {
+            $(subjects).find(".magnify").mousewheel(doMouseWheel);
+        }
+        $(subjects).each(videos_observer);
+    }
+
     function zoom_f(zoom_activated) {
         if (zoom_activated) {
             $(".magnify").mousewheel(doMouseWheel);
@@ -385,34 +398,29 @@ $(document).ready(function () {
             nextPrev(1);
         }
         else if (e.key == "1") {
-            var tab = document.getElementById(currentMetric);
-            var subj_id = tab.getElementsByClassName("tab")[dict_metrics[currentMetric]].id;
+            var subj_id = current_subject().id;
             update_status(document.getElementById(subj_id + "_pass"));
             qc_saved = false;
             nextPrev(1);
         }
         else if (e.key == "2") {
-            var tab = document.getElementById(currentMetric);
-            var subj_id = tab.getElementsByClassName("tab")[dict_metrics[currentMetric]].id;
+            var subj_id = current_subject().id;
             update_status(document.getElementById(subj_id + "_warning"));
             qc_saved = false;
         }
         else if (e.key == "3") {
-            var tab = document.getElementById(currentMetric);
-            var subj_id = tab.getElementsByClassName("tab")[dict_metrics[currentMetric]].id;
+            var subj_id = current_subject().id;
             update_status(document.getElementById(subj_id + "_fail"));
             qc_saved = false;
         }
         else if (e.key == "4") {
-            var tab = document.getElementById(currentMetric);
-            var subj_id = tab.getElementsByClassName("tab")[dict_metrics[currentMetric]].id;
+            var subj_id = current_subject().id;
             update_status(document.getElementById(subj_id + "_pending"));
             qc_saved = false;
         }
         else if (e.key == "c") {
             e.preventDefault();
-            var tab = document.getElementById(currentMetric);
-            var subj_id = tab.getElementsByClassName("tab")[dict_metrics[currentMetric]].id;
+            var subj_id = current_subject().id;
             openForm(document.getElementById(subj_id + "_comment"));
             document.getElementById(subj_id + "_comments").focus();
             document.removeEventListener("keydown", shortcut);
@@ -501,8 +509,7 @@ $(document).ready(function () {
 
     function close_comment(e) {
         if (e.key == "Escape") {
-            var tab = document.getElementById(currentMetric);
-            var subj_id = tab.getElementsByClassName("tab")[dict_metrics[currentMetric]].id;
+            var subj_id = current_subject().id;
             closeForm(document.getElementById(subj_id + "_comment_box").getElementsByClassName("btn")[0]);
             document.addEventListener("keydown", shortcut);
             update_summ_table();
@@ -513,12 +520,9 @@ $(document).ready(function () {
     document.addEventListener("keydown", close_comment);
 
     $(".js-dropdown").change(function () {
-        var x = document.getElementById(currentMetric).getElementsByClassName("tab");
-        x[dict_metrics[currentMetric]].style.display = "none";
-        if (x[dict_metrics[currentMetric]].getElementsByClassName("small").length > 0) {
-            x[dict_metrics[currentMetric]].getElementsByClassName("small")[0].removeAttribute("src");
-        }
-        dict_metrics[currentMetric] = document.getElementById(currentMetric).getElementsByClassName('js-dropdown')[0].selectedIndex;
+        var tab = document.getElementById(currentMetric);
+        hide_subject(tab, dict_metrics[currentMetric]);
+        dict_metrics[currentMetric] = first_subject(tab) + tab.getElementsByClassName('js-dropdown')[0].selectedIndex;
         showTab(dict_metrics[currentMetric])
     });
 
@@ -531,10 +535,9 @@ $(document).ready(function () {
         t = Array.prototype.slice.call(document.getElementsByClassName('tab-pane'));
         old_idx = t.indexOf(document.getElementById(currentMetric));
         currentMetric = this.parentNode.children[0].innerText;
-        var x = document.getElementById(currentMetric).getElementsByClassName("tab");
-        x[dict_metrics[currentMetric]].style.display = "none";
-        search = Array.prototype.slice.call(document.getElementById(currentMetric).children);
-        subj_id = search.indexOf(document.getElementById($(this).text())) - 1
+        var tab = document.getElementById(currentMetric);
+        hide_subject(tab, dict_metrics[currentMetric]);
+        subj_id = subject_names(tab).indexOf($(this).text());
         dict_metrics[currentMetric] = subj_id;
         showTab(subj_id)
         new_idx = t.indexOf(document.getElementById(currentMetric));
@@ -542,8 +545,7 @@ $(document).ready(function () {
         document.getElementById("navigation").children[old_idx].classList.remove("active");
         document.getElementsByClassName("tab-pane")[new_idx].classList.add("active", "in");
         document.getElementsByClassName("tab-pane")[old_idx].classList.remove("active", "in");
-        document.getElementById(currentMetric).getElementsByClassName('js-dropdown')[0].selectedIndex = dict_metrics[currentMetric];
-        $(document.getElementById(currentMetric).getElementsByClassName('js-dropdown')[0]).trigger("change");
+        select_subject(dict_metrics[currentMetric]);
     });
 
     $('select').on('select2:opening', function (event) {
@@ -554,20 +556,20 @@ $(document).ready(function () {
         document.addEventListener("keydown", shortcut);
     });
 
-    $('textarea').on('focus', function (event) {
+    $(document).on('focus', 'textarea', function (event) {
         document.removeEventListener("keydown", shortcut);
     });
 
-    $('textarea').on('blur', function (event) {
+    $(document).on('blur', 'textarea', function (event) {
         update_summ_table();
         document.addEventListener("keydown", shortcut);
     });
 
-    $('input').on('focus', function (event) {
+    $(document).on('focus', 'input', function (event) {
         document.removeEventListener("keydown", shortcut);
     });
 
-    $('input').on('blur', function (event) {
+    $(document).on('blur', 'input', function (event) {
         document.addEventListener("keydown", shortcut);
     });
 
@@ -609,8 +611,7 @@ function openForm(event) {
 }
 
 function closeForm(event) {
-    var tab = document.getElementById(currentMetric);
-    var subj_id = tab.getElementsByClassName("tab")[dict_metrics[currentMetric]].id;
+    var subj_id = current_subject().id;
     document.getElementById(subj_id + "_comment_box").style.display = "none";
     var div = document.getElementsByClassName("info")[0];
     div.style.display = "block";
@@ -620,8 +621,7 @@ function closeForm(event) {
 }
 
 function add_to_box() {
-    var tab = document.getElementById(currentMetric);
-    var subj_id = tab.getElementsByClassName("tab")[dict_metrics[currentMetric]].id;
+    var subj_id = current_subject().id;
     for (let selected of document.getElementById(subj_id + "_comment_choice").selectedOptions) {
         if (document.getElementById(subj_id + "_comments").value != "") {
             document.getElementById(subj_id + "_comments").value += "\n"
@@ -657,11 +657,220 @@ function matchCustom(params, data) {
     return null;
 }
 
+function decode_typed_array(array) {
+    var bytes = atob(array["bdata"]);
+    var buffer = new Uint8Array(bytes.length);
+    for (var i = 0; i < bytes.length; i++) {
+        buffer[i] = bytes.charCodeAt(i);
+    }
+    return new Float64Array(buffer.buffer);
+}
+
+function draw_figures() {
+    // Draw the figures written as JSON by dmriqcpy.viz.graph.
+    if (typeof Plotly == "undefined") {
+        return;
+    }
+    for (let spec of document.querySelectorAll("script.plotly-figure")) {
+        var figure = JSON.parse(spec.textContent);
+        for (let trace of figure["data"]) {
+            for (let key in trace) {
+                if (trace[key] != null && trace[key]["bdata"] !== undefined) {
+                    trace[key] = decode_typed_array(trace[key]);
+                }
+            }
+        }
+        // figure_template is the default template of plotly.py, set by the
+        // report.
+        figure["layout"]["template"] = figure_template;
+        var div = document.createElement("div");
+        div.className = "plotly-graph-div";
+        spec.parentNode.insertBefore(div, spec);
+        Plotly.newPlot(div, figure["data"], figure["layout"], { showLink: false });
+    }
+}
+
+function current_subject() {
+    return subject_at(document.getElementById(currentMetric), dict_metrics[currentMetric]);
+}
+
+function current_magnify() {
+    return current_subject().getElementsByClassName("magnify")[0];
+}
+
+function subject_names(tab) {
+    // Subjects of a metric. A paginated report lists them in the page
+    // manifest of the metric, only the page shown has a div per subject.
+    if (!tab.hasAttribute("data-pages")) {
+        return Array.prototype.map.call(tab.getElementsByClassName("tab"), function (subject) {
+            return subject.id;
+        });
+    }
+    if (!(tab.id in manifests)) {
+        manifests[tab.id] = JSON.parse(tab.getElementsByClassName("page-manifest")[0].textContent);
+    }
+    return manifests[tab.id];
+}
+
+function first_subject(tab) {
+    // Index of the first subject shown by a metric.
+    if (!tab.hasAttribute("data-shown-page")) {
+        return 0;
+    }
+    return parseInt(tab.getAttribute("data-shown-page")) * parseInt(tab.getAttribute("data-page-size"));
+}
+
+function subject_at(tab, n) {
+    // Div of the n-th subject of a metric, null if it is not on the page
+    // shown.
+    var x = tab.getElementsByClassName("tab");
+    n -= first_subject(tab);
+    if (n < 0 || n >= x.length) {
+        return null;
+    }
+    return x[n];
+}
+
+function hide_subject(tab, n) {
+    var subject = subject_at(tab, n);
+    if (subject == null) {
+        return;
+    }
+    subject.style.display = "none";
+    if (subject.getElementsByClassName("small").length > 0) {
+        subject.getElementsByClassName("small")[0].removeAttribute("src");
+    }
+}
+
+function select_subject(n) {
+    var dropdown = document.getElementById(currentMetric).getElementsByClassName('js-dropdown')[0];
+    dropdown.selectedIndex = n - first_subject(document.getElementById(currentMetric));
+    $(dropdown).trigger("change");
+}
+
+function show_page(tab, n) {
+    // Replace the subjects of the page shown of a paginated metric, and
+    // their options in the dropdown, by the placeholders of the page of
+    // the n-th subject, filled by add_page.
+    var size = parseInt(tab.getAttribute("data-page-size"));
+    var page = Math.floor(n / size);
+    var dropdown = tab.getElementsByClassName("js-dropdown")[0];
+    for (let subject of Array.prototype.slice.call(tab.getElementsByClassName("tab"))) {
+        if (!subject.hasAttribute("data-page")) {
+            qc_store[tab.id + "/" + subject.id] = get_qc(tab.id, subject.id);
+        }
+        subject.remove();
+    }
+    $(dropdown).empty();
+
+    for (let name of subject_names(tab).slice(page * size, (page + 1) * size)) {
+        var subject = document.createElement("div");
+        subject.className = "tab";
+        subject.id = name;
+        subject.setAttribute("data-page", page);
+        tab.appendChild(subject);
+        dropdown.add(new Option(name, name));
+    }
+    tab.setAttribute("data-shown-page", page);
+    dropdown.selectedIndex = n - page * size;
+    $(dropdown).trigger("change.select2");
+    // The placeholders are new, a page loaded before fills them again.
+    if (loaded_pages[tab.id + "_" + page] === true) {
+        delete loaded_pages[tab.id + "_" + page];
+    }
+}
+
+function get_subject(metric, name) {
+    var tab = document.getElementById(metric);
+    if (tab == null) {
+        return null;
+    }
+    return tab.querySelector('.tab[id="' + name + '"]');
+}
+
+function get_qc(metric, name) {
+    // Status and comments of a subject, kept in qc_store while its page is
+    // not shown.
+    var subject = get_subject(metric, name);
+    if (subject == null || subject.hasAttribute("data-page")) {
+        return qc_store[metric + "/" + name] || ["Pending", ""];
+    }
+    return [subject.querySelector('[id="' + name + '_status"]').innerText,
+            subject.querySelector('[id="' + name + '_comments"]').value];
+}
+
+function has_qc(metric, name) {
+    // Whether a subject is quality checked, the Dashboard and the Summary
+    // are not.
+    var subject = get_subject(metric, name);
+    return subject == null || subject.hasAttribute("data-page") || subject.querySelector('[id="' + name + '_status"]') != null;
+}
+
+function load_page(tab, page, callback) {
+    // Load a page of subjects of a paginated report. Its script calls
+    // add_page, then the callbacks waiting for the page.
+    var key = tab.id + "_" + page;
+    if (loaded_pages[key] === true) {
+        callback();
+        return;
+    }
+    if (key in loaded_pages) {
+        loaded_pages[key].push(callback);
+        return;
+    }
+    loaded_pages[key] = [callback];
+    var script = document.createElement("script");
+    script.src = tab.getAttribute("data-pages") + "_" + page + ".js";
+    script.onerror = function () {
+        console.log("ERROR: cannot load " + script.src);
+        delete loaded_pages[key];
+    };
+    document.body.appendChild(script);
+}
+
+function add_page(metric, page, subjects_html) {
+    color_dict = { "Pass": "green", "Warning": "orange", "Fail": "red", "Pending": "grey" };
+    var tab = document.getElementById(metric);
+    var subjects = tab.querySelectorAll('.tab[data-page="' + page + '"]');
+    for (var i = 0; i < subjects.length; i++) {
+        var subject = subjects[i];
+        subject.innerHTML = subjects_html[i];
+        subject.removeAttribute("data-page");
+        var key = metric + "/" + subject.id;
+        if (key in qc_store) {
+            var status = subject.querySelector('[id="' + subject.id + '_status"]');
+            status.innerText = qc_store[key][0];
+            status.style.backgroundColor = color_dict[qc_store[key][0].trim()];
+            subject.querySelector('[id="' + subject.id + '_comments"]').value = qc_store[key][1];
+            delete qc_store[key];
+        }
+    }
+    init_page(subjects);
+
+    var callbacks = loaded_pages[metric + "_" + page] || [];
+    loaded_pages[metric + "_" + page] = true;
+    for (let callback of callbacks) {
+        callback();
+    }
+}
+
 function showTab(n) {
     // This function will display the specified tab of the form...
     var tab = document.getElementById(currentMetric);
-    var x = tab.getElementsByClassName("tab");
-    x[n].style.display = "block";
+    if (tab.hasAttribute("data-pages") && subject_at(tab, n) == null) {
+        show_page(tab, n);
+    }
+    var subject = subject_at(tab, n);
+    if (subject.hasAttribute("data-page")) {
+        var metric = currentMetric;
+        load_page(tab, subject.getAttribute("data-page"), function () {
+            if (currentMetric == metric && dict_metrics[metric] == n) {
+                showTab(n);
+            }
+        });
+        return;
+    }
+    subject.style.display = "block";
     curr_subj = document.getElementById("curr_subj");
     curr_subj.innerText = "";
     counter = document.getElementById("counter");
@@ -670,18 +879,18 @@ function showTab(n) {
     document.getElementById("curr_subj").style.backgroundColor = "";
 
     if (tab.id != "Summary" && tab.id != "Dashboard") {
-        curr_subj.innerText = "Current subject: " + x[n].id;
-        counter.innerText = (n + 1) + "/" + x.length;
+        curr_subj.innerText = "Current subject: " + subject.id;
+        counter.innerText = (n + 1) + "/" + subject_names(tab).length;
         counter.style.backgroundColor = "#19568b";
-        if (document.getElementById(x[n].id + "_status").innerText != "Pending") {
-            document.getElementById("curr_subj").style.backgroundColor = document.getElementById(x[n].id + "_status").style.backgroundColor;
+        if (document.getElementById(subject.id + "_status").innerText != "Pending") {
+            document.getElementById("curr_subj").style.backgroundColor = document.getElementById(subject.id + "_status").style.backgroundColor;
         }
         else {
             document.getElementById("curr_subj").style.backgroundColor = "grey";
         }
 
-        if (x[n].getElementsByClassName("small").length > 0) {
-            var img = x[n].getElementsByClassName("small")[0];
+        if (subject.getElementsByClassName("small").length > 0) {
+            var img = subject.getElementsByClassName("small")[0];
 
             img.src = img.getAttribute('data-src');
 
@@ -711,7 +920,7 @@ function showTab(n) {
         } else {
             tab.getElementsByTagName("button")[0].disabled = false;
         }
-        if (n == (x.length - 1)) {
+        if (n == (subject_names(tab).length - 1)) {
             tab.getElementsByTagName("button")[1].disabled = true;
         } else {
             tab.getElementsByTagName("button")[1].disabled = false;
@@ -722,9 +931,10 @@ function showTab(n) {
         report = { "type": "report", "data": [] };
         for (let metrics of document.getElementsByClassName("tab-pane")) {
             if (metrics.id != "Dashboard") {
-                for (let subject of metrics.getElementsByClassName("tab")) {
-                    if (document.getElementById(subject.id + "_status")) {
-                        data.push([metrics.id, subject.id, document.getElementById(subject.id + "_status").innerText, document.getElementById(subject.id + "_comments").value])
+                for (let name of subject_names(metrics)) {
+                    if (has_qc(metrics.id, name)) {
+                        qc = get_qc(metrics.id, name);
+                        data.push([metrics.id, name, qc[0], qc[1]])
                     }
                 }
             }
@@ -737,25 +947,21 @@ function showTab(n) {
 
 function nextPrev(n) {
     // This function will figure out which tab to display
-    var x = document.getElementById(currentMetric).getElementsByClassName("tab");
+    var tab = document.getElementById(currentMetric);
     // Increase or decrease the current tab by 1:
-    if (dict_metrics[currentMetric] + n >= x.length || dict_metrics[currentMetric] + n < 0) {
+    if (dict_metrics[currentMetric] + n >= subject_names(tab).length || dict_metrics[currentMetric] + n < 0) {
         // ... the form gets submitted:
         return false;
     }
 
     // Hide the current tab:
-    x[dict_metrics[currentMetric]].style.display = "none";
-    if (x[dict_metrics[currentMetric]].getElementsByClassName("small").length > 0) {
-        x[dict_metrics[currentMetric]].getElementsByClassName("small")[0].removeAttribute("src");
-    }
+    hide_subject(tab, dict_metrics[currentMetric]);
     dict_metrics[currentMetric] = dict_metrics[currentMetric] + n;
     // if you have reached the end of the form...
 
     // Otherwise, display the correct tab:
     showTab(dict_metrics[currentMetric]);
-    document.getElementById(currentMetric).getElementsByClassName('js-dropdown')[0].selectedIndex = dict_metrics[currentMetric];
-    $(document.getElementById(currentMetric).getElementsByClassName('js-dropdown')[0]).trigger("change")
+    select_subject(dict_metrics[currentMetric]);
 }
 
 /* Set the width of the sidebar to 250px and the left margin of the page content to 250px */
@@ -775,6 +981,10 @@ function doMouseWheel(event) {
 }
 
 function update_status(object) {
+    if (object == null) {
+        // The page of the subject is still loading.
+        return;
+    }
     document.getElementById(object.name + "_status").innerText = object.innerText;
     document.getElementById(object.name + "_status").style.backgroundColor = object.style.backgroundColor;
     if (object.innerText != "Pending") {
@@ -792,8 +1002,7 @@ function load_qc() {
     color_dict = { "Pass": "green", "Warning": "orange", "Fail": "red", "Pending": "grey" };
     var selectedFile = document.getElementById('load_file').files[0];
     var reader = new FileReader();
-    var x = document.getElementById(currentMetric).getElementsByClassName("tab");
-    x[dict_metrics[currentMetric]].style.display = "none";
+    hide_subject(document.getElementById(currentMetric), dict_metrics[currentMetric]);
     test = []
     reader.onload = function (event) {
         let importedJSON = JSON.parse(event.target.result);
@@ -803,9 +1012,15 @@ function load_qc() {
                     filename = importedJSON[dict_idx]["data"][data_idx]["filename"];
                     status = importedJSON[dict_idx]["data"][data_idx]["status"];
                     comments = importedJSON[dict_idx]["data"][data_idx]["comments"];
-                    document.getElementById(filename + "_comments").value = comments;
                     curr = importedJSON[dict_idx]["data"][data_idx];
                     test.push([curr["qc"], curr["filename"], curr["status"], curr["comments"]])
+                    subject = get_subject(curr["qc"], filename);
+                    if (subject == null || subject.hasAttribute("data-page")) {
+                        // Applied when the page of the subject is loaded.
+                        qc_store[curr["qc"] + "/" + filename] = [status, comments];
+                        continue;
+                    }
+                    document.getElementById(filename + "_comments").value = comments;
                     document.getElementById(filename + "_status").innerText = status;
                     document.getElementById(filename + "_status").style.backgroundColor = color_dict[status.trim()];
                 }
@@ -865,13 +1080,14 @@ function save_qc() {
                 curr_tab["tab_name"] = metrics.id;
                 curr_tab["tab_index"] = dict_metrics[metrics.id];
                 settings["data"].push(curr_tab);
-                for (let subject of metrics.getElementsByClassName("tab")) {
-                    if (document.getElementById(subject.id + "_status")) {
+                for (let name of subject_names(metrics)) {
+                    if (has_qc(metrics.id, name)) {
+                        qc = get_qc(metrics.id, name);
                         curr_subj = {};
                         curr_subj["qc"] = metrics.id;
-                        curr_subj["status"] = document.getElementById(subject.id + "_status").innerText;
-                        curr_subj["comments"] = document.getElementById(subject.id + "_comments").value;
-                        curr_subj["filename"] = subject.id;
+                        curr_subj["status"] = qc[0];
+                        curr_subj["comments"] = qc[1];
+                        curr_subj["filename"] = name;
                         report["data"].push(curr_subj);
                     }
                 }
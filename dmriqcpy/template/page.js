@@ -0,0 +1,5 @@
+add_page("{{ metric_id }}", {{ page }}, [
+{%- for subject_name, subject_values in subjects %}
+{% set subject_html %}{% include "subject.html" %}{% endset %}{{ subject_html|tojson }}{{ "," if not loop.last }}
+{%- endfor %}
+]);
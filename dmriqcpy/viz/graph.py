@@ -1,11 +1,12 @@
 # -*- coding: utf-8 -*-
 
+import base64
+import json
+
 import numpy as np
-from plotly.graph_objs import Bar, Box, Figure
-import plotly.offline as off
 
 
-def graph_mean_median(title, column_names, summary, online=False):
+def graph_mean_median(title, column_names, summary):
     """
     Compute plotly graph with mean and median stats
 
@@ -17,16 +18,12 @@ def graph_mean_median(title, column_names, summary, online=False):
         Name of the columns in the summary DataFrame.
     summary : DataFrame
         DataFrame containing the mean and median stats.
-    online: Boolean
-        If false it will include plotlyjs
 
     Returns
     -------
     div : html div (string)
         Graph as a HTML div.
     """
-    include_plotlyjs = not online
-
     means = []
     medians = []
     np.random.seed(1)
@@ -34,7 +31,7 @@ def graph_mean_median(title, column_names, summary, online=False):
     means = np.array(summary[column_names[0]])
     medians = np.array(summary[column_names[1]])
 
-    mean = Box(
+    mean = _box(
         name="Mean",
         y=means,
         boxpoints='all',
@@ -44,7 +41,7 @@ def graph_mean_median(title, column_names, summary, online=False):
         hoverinfo="y+text"
     )
 
-    median = Box(
+    median = _box(
         name="Median",
         y=medians,
         boxpoints='all',
@@ -56,7 +53,7 @@ def graph_mean_median(title, column_names, summary, online=False):
 
     data = [mean, median]
 
-    fig = Figure(data=data)
+    fig = _figure(data=data)
     max_value = max(np.max(means), np.max(medians))
 
     range_yaxis = [0, max_value + 2 * max_value]
@@ -64,13 +61,10 @@ def graph_mean_median(title, column_names, summary, online=False):
     fig['layout']['yaxis'].update(range=range_yaxis)
     fig['layout'].update(title=title)
     fig['layout'].update(width=500, height=500)
-    div = off.plot(fig, show_link=False, include_plotlyjs=include_plotlyjs,
-                   output_type='div')
-    div = div.replace("<div>", "<div style=\"display:inline-block\">")
-    return div
+    return _figure_div(fig)
 
 
-def graph_mean_in_tissues(title, column_names, summary, online=False):
+def graph_mean_in_tissues(title, column_names, summary):
     """
     Compute plotly graph with mean value in tissue masks
 
@@ -82,16 +76,12 @@ def graph_mean_in_tissues(title, column_names, summary, online=False):
         Name of the columns in the summary DataFrame.
     summary : DataFrame
         DataFrame containing the mean stats.
-    online: Boolean
-        If false it will include plotlyjs
 
     Returns
     -------
     div : html div (string)
         Graph as a HTML div.
     """
-    include_plotlyjs = not online
-
     means_wm = []
     means_gm = []
     means_csf = []
@@ -100,7 +90,7 @@ def graph_mean_in_tissues(title, column_names, summary, online=False):
     means_wm = np.array(summary[column_names[0]])
     means_gm = np.array(summary[column_names[1]])
     means_csf = np.array(summary[column_names[2]])
-    wm = Box(
+    wm = _box(
         name="WM",
         y=means_wm,
         boxpoints='all',
@@ -110,7 +100,7 @@ def graph_mean_in_tissues(title, column_names, summary, online=False):
         hoverinfo="y+text"
     )
 
-    gm = Box(
+    gm = _box(
         name="GM",
         y=means_gm,
         boxpoints='all',
@@ -120,7 +110,7 @@ def graph_mean_in_tissues(title, column_names, summary, online=False):
         hoverinfo="y+text"
     )
 
-    csf = Box(
+    csf = _box(
         name="CSF",
         y=means_csf,
         boxpoints='all',
@@ -131,7 +121,7 @@ def graph_mean_in_tissues(title, column_names, summary, online=False):
     )
     data = [wm, gm, csf]
 
-    fig = Figure(data=data)
+    fig = _figure(data=data)
 
     range_yaxis = [0, np.max(means_wm) + 2 * np.max(means_wm)]
 
@@ -139,13 +129,10 @@ def graph_mean_in_tissues(title, column_names, summary, online=False):
     fig['layout'].update(title=title)
     fig['layout'].update(width=500, height=500)
 
-    div = off.plot(fig, show_link=False, include_plotlyjs=include_plotlyjs,
-                   output_type='div')
-    div = div.replace("<div>", "<div style=\"display:inline-block\">")
-    return div
+    return _figure_div(fig)
 
 
-def graph_frf_eigen(title, column_names, summary, online=False):
+def graph_frf_eigen(title, column_names, summary):
     """
     Compute plotly graph with mean frf values
 
@@ -157,22 +144,18 @@ def graph_frf_eigen(title, column_names, summary, online=False):
         Name of the columns in the summary DataFrame.
     summary : DataFrame
         DataFrame containing the mean stats.
-    online: Boolean
-        If false it will include plotlyjs
 
     Returns
     -------
     div : html div (string)
         Graph as a HTML div.
     """
-    include_plotlyjs = not online
-
     np.random.seed(1)
     metric = summary.index
     e1 = np.array(summary[column_names[0]])
     e2 = np.array(summary[column_names[1]])
 
-    e1_graph = Box(
+    e1_graph = _box(
         name="Eigen value 1",
         y=e1,
         boxpoints='all',
@@ -182,7 +165,7 @@ def graph_frf_eigen(title, column_names, summary, online=False):
         hoverinfo="y+text"
     )
 
-    e2_graph = Box(
+    e2_graph = _box(
         name="Eigen value 2",
         y=e2,
         boxpoints='all',
@@ -194,16 +177,13 @@ def graph_frf_eigen(title, column_names, summary, online=False):
 
     data = [e1_graph, e2_graph]
 
-    fig = Figure(data=data)
+    fig = _figure(data=data)
 
     fig['layout'].update(title=title)
     fig['layout'].update(width=500, height=500)
-    div = off.plot(fig, show_link=False, include_plotlyjs=include_plotlyjs,
-                   output_type='div')
-    div = div.replace("<div>", "<div style=\"display:inline-block\">")
-    return div
+    return _figure_div(fig)
 
-def graph_frf_b0(title, column_names, summary, online=False):
+def graph_frf_b0(title, column_names, summary):
     """
     Compute plotly graph with mean b0 values
 
@@ -215,19 +195,15 @@ def graph_frf_b0(title, column_names, summary, online=False):
         Name of the columns in the summary DataFrame.
     summary : DataFrame
         DataFrame containing the mean stats.
-    online: Boolean
-        If false it will include plotlyjs
 
     Returns
     -------
     div : html div (string)
         Graph as a HTML div.
     """
-    include_plotlyjs = not online
-
     np.random.seed(1)
     metric = summary.index
-    e1_graph = Box(
+    e1_graph = _box(
         name="Mean B0",
         y=np.array(summary[column_names[2]]),
         boxpoints='all',
@@ -239,17 +215,14 @@ def graph_frf_b0(title, column_names, summary, online=False):
 
     data = [e1_graph]
 
-    fig = Figure(data=data)
+    fig = _figure(data=data)
 
     fig['layout'].update(title=title)
     fig['layout'].update(width=500, height=500)
-    div = off.plot(fig, show_link=False, include_plotlyjs=include_plotlyjs,
-                   output_type='div')
-    div = div.replace("<div>", "<div style=\"display:inline-block\">")
-    return div
+    return _figure_div(fig)
 
 
-def graph_tractogram(title, column_names, summary, online=False):
+def graph_tractogram(title, column_names, summary):
     """
     Compute plotly graph with mean number of streamlines
 
@@ -261,22 +234,18 @@ def graph_tractogram(title, column_names, summary, online=False):
         Name of the columns in the summary DataFrame.
     summary : DataFrame
         DataFrame containing the mean stats.
-    online: Boolean
-        If false it will include plotlyjs
 
     Returns
     -------
     div : html div (string)
         Graph as a HTML div.
     """
-    include_plotlyjs = not online
-
     nb_streamlines = []
     np.random.seed(1)
     metric = summary.index
     nb_streamlines = np.array(summary[column_names[0]])
 
-    nb_streamlines_graph = Box(
+    nb_streamlines_graph = _box(
         name="Nb streamlines",
         y=nb_streamlines,
         boxpoints='all',
@@ -288,17 +257,84 @@ def graph_tractogram(title, column_names, summary, online=False):
 
     data = [nb_streamlines_graph]
 
-    fig = Figure(data=data)
+    fig = _figure(data=data)
 
     fig['layout'].update(title=title)
     fig['layout'].update(width=500, height=500)
-    div = off.plot(fig, show_link=False, include_plotlyjs=include_plotlyjs,
-                   output_type='div')
-    div = div.replace("<div>", "<div style=\"display:inline-block\">")
-    return div
+    return _figure_div(fig)
 
 
-def graph_mask_volume(title, column_names, summary, online=False):
+def graph_streamline_lengths(title, histograms):
+    """
+    Compute plotly graph with the distribution of the streamline lengths of
+    the cohort: the median density of each length bin with the band from
+    the 5th to the 95th percentile of the subjects.
+
+    Parameters
+    ----------
+    title : string
+        Title of the graph.
+    histograms : DataFrame
+        DataFrame containing the number of streamlines in each length bin
+        (columns) for each subject.
+
+    Returns
+    -------
+    div : html div (string)
+        Graph as a HTML div.
+    """
+    bins = np.array(histograms.columns, dtype=float)
+    width = bins[1] - bins[0] if len(bins) > 1 else 1
+    centers = bins + width / 2
+
+    # The subjects without streamlines have no density and are left out.
+    counts = np.array(histograms, dtype=float).reshape((-1, len(bins)))
+    totals = np.sum(counts, axis=1)
+    densities = counts[totals > 0] / (totals[totals > 0, None] * width)
+    if len(densities):
+        low, median, high = np.percentile(densities, [5, 50, 95], axis=0)
+    else:
+        low = median = high = np.full(len(bins), np.nan)
+
+    data = [
+        _scatter(
+            name='5th percentile',
+            x=centers,
+            y=low,
+            mode='lines',
+            line=dict(width=0),
+            hoverinfo="x+y+name"
+        ),
+        _scatter(
+            name='95th percentile',
+            x=centers,
+            y=high,
+            mode='lines',
+            line=dict(width=0),
+            fill='tonexty',
+            fillcolor='rgba(31, 119, 180, 0.3)',
+            hoverinfo="x+y+name"
+        ),
+        _scatter(
+            name='Median',
+            x=centers,
+            y=median,
+            mode='lines',
+            line=dict(width=2, color='rgb(31, 119, 180)'),
+            hoverinfo="x+y+name"
+        )
+    ]
+
+    fig = _figure(data=data)
+
+    fig['layout']['xaxis'].update(title='Length (mm)')
+    fig['layout']['yaxis'].update(title='Density')
+    fig['layout'].update(title=title, showlegend=False)
+    fig['layout'].update(width=500, height=500)
+    return _figure_div(fig)
+
+
+def graph_mask_volume(title, column_names, summary):
     """
     Compute plotly graph with mean mask volume
 
@@ -310,21 +346,17 @@ def graph_mask_volume(title, column_names, summary, online=False):
         Name of the columns in the summary DataFrame.
     summary : DataFrame
         DataFrame containing the mean stats.
-    online: Boolean
-        If false it will include plotlyjs
 
     Returns
     -------
     div : html div (string)
         Graph as a HTML div.
     """
-    include_plotlyjs = not online
-
     np.random.seed(1)
     metric = summary.index
     volume = np.array(summary[column_names[0]])
 
-    volume_graph = Box(
+    volume_graph = _box(
         name="Volume",
         y=volume,
         boxpoints='all',
@@ -336,17 +368,14 @@ def graph_mask_volume(title, column_names, summary, online=False):
 
     data = [volume_graph]
 
-    fig = Figure(data=data)
+    fig = _figure(data=data)
 
     fig['layout'].update(title=title)
     fig['layout'].update(width=500, height=500)
-    div = off.plot(fig, show_link=False, include_plotlyjs=include_plotlyjs,
-                   output_type='div')
-    div = div.replace("<div>", "<div style=\"display:inline-block\">")
-    return div
+    return _figure_div(fig)
 
 
-def graph_dwi_protocol(title, column_name, summary, online=False):
+def graph_dwi_protocol(title, column_name, summary):
     """
     Compute plotly graph with mean mask volume
 
@@ -358,21 +387,17 @@ def graph_dwi_protocol(title, column_name, summary, online=False):
         Name of the columns in the summary DataFrame.
     summary : DataFrame
         DataFrame containing the mean stats.
-    online: Boolean
-        If false it will include plotlyjs
 
     Returns
     -------
     div : html div (string)
         Graph as a HTML div.
     """
-    include_plotlyjs = not online
-
     np.random.seed(1)
     metric = summary.index
     data = np.array(summary[column_name])
 
-    graph = Box(
+    graph = _box(
         name=column_name,
         y=data,
         boxpoints='all',
@@ -384,17 +409,14 @@ def graph_dwi_protocol(title, column_name, summary, online=False):
 
     data = [graph]
 
-    fig = Figure(data=data)
+    fig = _figure(data=data)
 
     fig['layout'].update(title=title)
     fig['layout'].update(width=500, height=500)
-    div = off.plot(fig, show_link=False, include_plotlyjs=include_plotlyjs,
-                   output_type='div')
-    div = div.replace("<div>", "<div style=\"display:inline-block\">")
-    return div
+    return _figure_div(fig)
 
 
-def graph_directions_per_shells(title, summary, online=False):
+def graph_directions_per_shells(title, summary):
     """
     Compute plotly graph with mean mask volume
 
@@ -402,25 +424,24 @@ def graph_directions_per_shells(title, summary, online=False):
     ----------
     title : string
         Title of the graph.
-    summary : dict
-        DataFrame containing the mean stats.
-    online: Boolean
-        If false it will include plotlyjs
+    summary : dict or DataFrame
+        Number of directions of each subject (dict) for each shell, or
+        DataFrame with a column per shell and NaN for the subjects without
+        the shell.
 
     Returns
     -------
     div : html div (string)
         Graph as a HTML div.
     """
-    include_plotlyjs = not online
-
+    summary = _shells_to_dict(summary)
     np.random.seed(1)
     data_graph = []
     for i in sorted(summary):
         metric = list(summary[i].keys())
         data = list(summary[i].values())
 
-        graph = Box(
+        graph = _box(
             name="b=" + str(i),
             y=data,
             boxpoints='all',
@@ -432,17 +453,14 @@ def graph_directions_per_shells(title, summary, online=False):
 
         data_graph.append(graph)
 
-    fig = Figure(data=data_graph)
+    fig = _figure(data=data_graph)
 
     fig['layout'].update(title=title)
     fig['layout'].update(width=700, height=500)
-    div = off.plot(fig, show_link=False, include_plotlyjs=include_plotlyjs,
-                   output_type='div')
-    div = div.replace("<div>", "<div style=\"display:inline-block\">")
-    return div
+    return _figure_div(fig)
 
 
-def graph_subjects_per_shells(title, summary, online=False):
+def graph_subjects_per_shells(title, summary):
     """
     Compute plotly graph with mean mask volume
 
@@ -450,25 +468,24 @@ def graph_subjects_per_shells(title, summary, online=False):
     ----------
     title : string
         Title of the graph.
-    summary : dict
-        DataFrame containing the mean stats.
-    online: Boolean
-        If false it will include plotlyjs
+    summary : dict or DataFrame
+        Number of directions of each subject (dict) for each shell, or
+        DataFrame with a column per shell and NaN for the subjects without
+        the shell.
 
     Returns
     -------
     div : html div (string)
         Graph as a HTML div.
     """
-    include_plotlyjs = not online
-
+    summary = _shells_to_dict(summary)
     np.random.seed(1)
     data_graph = []
     for i in sorted(summary):
         metric = list(summary[i].keys())
         data = [len(metric)]
 
-        graph = Bar(
+        graph = _bar(
             name="b=" + str(i),
             y=data,
             x=["b=" + str(i)],
@@ -477,11 +494,82 @@ def graph_subjects_per_shells(title, summary, online=False):
 
         data_graph.append(graph)
 
-    fig = Figure(data=data_graph)
+    fig = _figure(data=data_graph)
 
     fig['layout'].update(title=title)
     fig['layout'].update(width=700, height=500)
-    div = off.plot(fig, show_link=False, include_plotlyjs=include_plotlyjs,
-                   output_type='div')
-    div = div.replace("<div>", "<div style=\"display:inline-block\">")
-    return div
+    return _figure_div(fig)
+
+
+def _box(**attributes):
+    return _trace('box', attributes)
+
+
+def _bar(**attributes):
+    return _trace('bar', attributes)
+
+
+def _scatter(**attributes):
+    return _trace('scatter', attributes)
+
+
+def _trace(trace_type, attributes):
+    trace = {'type': trace_type}
+    for key, value in attributes.items():
+        if isinstance(value, (np.ndarray, list, tuple)) or\
+                hasattr(value, 'to_numpy'):
+            value = _array(value)
+        trace[key] = value
+    return trace
+
+
+def _array(values):
+    # Numbers are sent as base64 float64 arrays, decoded by the report into
+    # typed arrays, which are much smaller and faster to parse than lists.
+    values = np.asarray(values)
+    if values.dtype.kind in 'biuf':
+        data = values.astype('<f8').tobytes()
+        return {'dtype': 'f8', 'bdata': base64.b64encode(data).decode('ascii')}
+    return values.tolist()
+
+
+def _figure(data):
+    return {'data': data, 'layout': {'xaxis': {}, 'yaxis': {}}}
+
+
+def _figure_div(fig):
+    # The figure is drawn by draw_figures (scripts.js) once plotly.js is
+    # loaded by the report.
+    fig = dict(fig, layout=_finite(fig['layout']))
+    spec = json.dumps(fig, separators=(',', ':'), default=_to_json)
+    spec = spec.replace('<', '\\u003c').replace('>', '\\u003e')\
+        .replace('&', '\\u0026')
+    return '<div style="display:inline-block">' \
+           '<script type="application/json" class="plotly-figure">{}' \
+           '</script></div>'.format(spec)
+
+
+def _finite(value):
+    # NaN and infinity are not valid JSON, plotly ignores null instead.
+    if isinstance(value, dict):
+        return {key: _finite(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_finite(item) for item in value]
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not np.isfinite(value):
+        return None
+    return value
+
+
+def _to_json(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError('{} is not JSON serializable'.format(type(value)))
+
+
+def _shells_to_dict(summary):
+    if isinstance(summary, dict):
+        return summary
+    return {int(shell): values.dropna().to_dict()
+            for shell, values in summary.items()}
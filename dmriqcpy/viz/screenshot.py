@@ -11,8 +11,12 @@ from matplotlib.cm import get_cmap
 import nibabel as nib
 import numpy as np
 
+from dmriqcpy.analysis.utils import (compute_intensity_window,
+                                     get_display_data,
+                                     get_intensity_window)
+from dmriqcpy.io.image import get_data, load_data, load_img
+from dmriqcpy.io.tractogram import iter_streamlines_chunks
 from dmriqcpy.viz.utils import compute_labels_map, renderer_to_arr
-from dipy.io.streamline import load_tractogram
 
 vtkcolors = [window.colors.blue,
              window.colors.red,
@@ -54,7 +58,7 @@ def screenshot_mosaic_wrapper(filename, output_prefix="", directory=".",
     return_path : bool
         Return path of the mosaic.
     lut : str
-        Look up table.
+        Look up table, in FreeSurfer text format or as a .npy array.
     Compute lut: bool
         If set, will compute a look of table using compute_labels_map.
 
@@ -65,20 +69,30 @@ def screenshot_mosaic_wrapper(filename, output_prefix="", directory=".",
     imgs_comb : array 2D
         mosaic in array 2D
     """
-    data = nib.load(filename).get_fdata()
-    data = np.nan_to_num(data)
-    unique = np.unique(data)
+    data = get_display_data(load_data(filename))
 
     output_prefix = output_prefix.replace(' ', '_') + '_'
 
+    value_range = None
+    colors = None
     if lut is not None or compute_lut:
-        lut = compute_labels_map(lut, unique, compute_lut)
-        tmp = np.zeros(data.shape + (3,))
-        for label in unique:
-            tmp[data == label] = lut[label]
-        data = tmp
-
-    imgs_comb = screenshot_mosaic(data, skip, pad, nb_columns, axis, cmap)
+        # The labels index the dense LUT, so the colors are gathered in one
+        # pass and only for the displayed slices. Negative labels would
+        # silently wrap around to the end of the LUT.
+        if data.min() < 0:
+            raise ValueError('Negative label {} in {}.'.format(
+                int(data.min()), filename))
+        unique = np.unique(data) if compute_lut else None
+        colors = compute_labels_map(lut, unique, compute_lut)
+        if data.max() >= len(colors):
+            raise ValueError('Label {} of {} is not in the look up '
+                             'table.'.format(int(data.max()), filename))
+        data = data.astype(np.intp)
+    elif data.ndim < 4 or data.shape[3] != 3:
+        value_range = get_intensity_window(filename, data)
+
+    imgs_comb = screenshot_mosaic(data, skip, pad, nb_columns, axis, cmap,
+                                  value_range, colors)
     if return_path:
         image_name = os.path.basename(str(filename)).split(".")[0]
         if isinstance(imgs_comb, list):
@@ -161,7 +175,8 @@ def screenshot_mosaic_blend(image, image_blend, output_prefix="",
     return name
 
 
-def screenshot_mosaic(data, skip, pad, nb_columns, axis, cmap):
+def screenshot_mosaic(data, skip, pad, nb_columns, axis, cmap,
+                      value_range=None, colors=None):
     """
     Compute a mosaic from an image
 
@@ -179,6 +194,12 @@ def screenshot_mosaic(data, skip, pad, nb_columns, axis, cmap):
         Display axis.
     cmap : string
         Colormap name in matplotlib format.
+    value_range : tuple of float
+        Intensity window (min, max) mapped to [0, 255]. Computed from data
+        if None. Ignored for RGB data.
+    colors : array 2D
+        RGB colors (uint8) of the labels. If set, data is 3D and holds the
+        index of the color of each voxel.
 
     Returns
     -------
@@ -187,43 +208,30 @@ def screenshot_mosaic(data, skip, pad, nb_columns, axis, cmap):
     imgs_comb : array 2D
         mosaic in array 2D
     """
-    range_row = range(0, data.shape[2], skip)
-    nb_rows = int(np.ceil(len(range_row) / nb_columns))
-    is_4d = True if len(data.shape) == 4 else False
-
-    min_val = np.min(data[data > 0])
-    max_val = np.percentile(data[data > 0], 99)
-    if max_val - min_val < 20 and max_val.is_integer():
-        min_val = data.min()
-        max_val = np.percentile(data[data > 0], 99.99)
-    shape = ((data[:, :, 0].shape[1] + pad) * nb_rows + pad * nb_rows,
-             (data[:, :, 0].shape[0] + pad) * nb_columns + nb_columns * pad)
-    padding = ((int(pad / 2), int(pad / 2)), (int(pad / 2), int(pad / 2)))
-    is_rgb = False
-    if is_4d:
-        time = data.shape[3]
-        if time == 3:
-            is_rgb = True
-        shape += (time,)
-        padding += ((0, 0),)
-
-    if not is_rgb:
-        data = np.interp(data, xp=[min_val, max_val], fp=[0, 255]).astype(
+    nb_slices = len(range(0, data.shape[2], skip))
+    nb_rows = int(np.ceil(nb_slices / nb_columns))
+    is_4d = True if len(data.shape) == 4 or colors is not None else False
+
+    shape = ((data.shape[1] + pad) * nb_rows + pad * nb_rows,
+             (data.shape[0] + pad) * nb_columns + nb_columns * pad)
+    is_rgb = is_4d and (colors is not None or data.shape[3] == 3)
+    if is_rgb:
+        value_range = None
+    elif value_range is None:
+        value_range = compute_intensity_window(data)
+    if colors is not None:
+        shape += (3,)
+    elif is_4d:
+        shape += (data.shape[3],)
+
+    slices = data[:, :, ::skip]
+    if colors is not None:
+        slices = colors[slices]
+    elif value_range is not None:
+        slices = np.interp(slices, xp=value_range, fp=[0, 255]).astype(
             dtype=np.uint8)
 
-    mosaic = np.zeros(shape, dtype=np.uint8)
-
-    for i, idx in enumerate(range_row):
-        corner = i % nb_columns
-        row = int(i / nb_columns)
-        curr_img = np.rot90(data[:, :, idx])
-
-        curr_img = np.pad(curr_img, padding, 'constant').astype(dtype=np.uint8)
-        curr_shape = curr_img.shape
-        mosaic[curr_shape[0] * row + row * pad:
-               row * curr_shape[0] + curr_shape[0] + row * pad,
-               curr_shape[1] * corner + corner * pad:
-               corner * curr_shape[1] + curr_shape[1] + corner * pad] = curr_img
+    mosaic = _build_mosaic(slices, pad, nb_columns, nb_rows, shape)
     if axis and not is_4d:
         mosaic = np.pad(mosaic, ((50, 50), (50, 50)), 'constant').astype(
             dtype=np.uint8)
@@ -244,7 +252,7 @@ def screenshot_mosaic(data, skip, pad, nb_columns, axis, cmap):
         colormap = get_cmap(cmap)
         mosaic = np.array(colormap(mosaic / 255.0) * 255).astype(dtype=np.uint8)
 
-    tmp = screenshot_3_axis(data, mosaic, cmap, is_4d)
+    tmp = screenshot_3_axis(data, mosaic, cmap, is_4d, value_range, colors)
     mosaic = np.vstack((tmp, mosaic))
     del data
     if is_4d and mosaic.shape[2] != 3:
@@ -279,11 +287,70 @@ def screenshot_mosaic(data, skip, pad, nb_columns, axis, cmap):
     return imgs_comb
 
 
-def screenshot_3_axis(data, mosaic, cmap=None, is_4d=False):
+def _build_mosaic(slices, pad, nb_columns, nb_rows, shape):
+    """
+    Tile the slices of a volume into a mosaic with a single block copy.
+
+    Parameters
+    ----------
+    slices : array 3D or 4D
+        Slices of the mosaic, stacked along the third axis.
+    pad : int
+        Padding value between each images.
+    nb_columns : int
+        Number of columns.
+    nb_rows : int
+        Number of rows.
+    shape : tuple
+        Shape of the mosaic.
+
+    Returns
+    -------
+    mosaic : array 2D or 3D
+        Mosaic in uint8.
+    """
+    half_pad = int(pad / 2)
+    nb_slices = slices.shape[2]
+    # (X, Y, slices) -> (slices, Y, X), as np.rot90 does for each slice.
+    slices = np.moveaxis(np.rot90(slices), 2, 0)
+    height, width = slices.shape[1:3]
+    cell_height = height + 2 * half_pad + pad
+    cell_width = width + 2 * half_pad + pad
+
+    grid = np.zeros((nb_rows, cell_height, nb_columns, cell_width) +
+                    slices.shape[3:], dtype=np.uint8)
+    cells = np.swapaxes(grid, 1, 2)[:, :, half_pad:half_pad + height,
+                                    half_pad:half_pad + width]
+
+    nb_full_rows = nb_slices // nb_columns
+    nb_full = nb_full_rows * nb_columns
+    cells[:nb_full_rows] = slices[:nb_full].reshape(
+        (nb_full_rows, nb_columns) + slices.shape[1:])
+    if nb_full < nb_slices:
+        cells[nb_full_rows, :nb_slices - nb_full] = slices[nb_full:]
+
+    grid = grid.reshape((nb_rows * cell_height, nb_columns * cell_width) +
+                        slices.shape[3:])
+    if grid.shape == shape:
+        return grid
+
+    mosaic = np.zeros(shape, dtype=np.uint8)
+    mosaic[:grid.shape[0], :grid.shape[1]] = grid
+    return mosaic
+
+
+def screenshot_3_axis(data, mosaic, cmap=None, is_4d=False, value_range=None,
+                      colors=None):
     middle = [data.shape[0] // 2 + 4, data.shape[1] // 2,
               data.shape[2] // 2]
     slice_display = [data[middle[0], :, :], data[:, middle[1], :],
                      data[:, :, middle[2]]]
+    if colors is not None:
+        slice_display = [colors[img] for img in slice_display]
+    elif value_range is not None:
+        slice_display = [np.interp(img, xp=value_range,
+                                   fp=[0, 255]).astype(dtype=np.uint8)
+                         for img in slice_display]
     size = max(data.shape[0:3])
     image = np.array([])
     for j in range(len(slice_display)):
@@ -357,10 +424,10 @@ def screenshot_fa_peaks(fa, peaks, directory='.'):
         Path of the mosaic
     """
     slice_name = ['sagittal', 'coronal', 'axial']
-    data = nib.load(fa).get_fdata()
-    evecs_data = nib.load(peaks).get_fdata()
+    data = load_data(fa)
+    evecs_data = load_data(peaks)
 
-    evecs = np.zeros(data.shape + (1, 3))
+    evecs = np.zeros(data.shape + (1, 3), dtype=evecs_data.dtype)
     evecs[:, :, :, 0, :] = evecs_data[...]
 
     middle = [data.shape[0] // 2 + 4, data.shape[1] // 2,
@@ -419,6 +486,40 @@ def screenshot_fa_peaks(fa, peaks, directory='.'):
     return name
 
 
+def estimate_tracking_memory(tracking, t1, chunk_size=100000):
+    """
+    Estimate the peak memory used by screenshot_tracking for a subject.
+
+    Parameters
+    ----------
+    tracking : string
+        Tractogram filename.
+    t1 : string
+        T1 filename.
+    chunk_size : int
+        Number of streamlines read at a time. See _sample_tractogram.
+
+    Returns
+    -------
+    size : int
+        Estimated memory in bytes.
+    """
+    nb_streamlines = nib.streamlines.load(
+        tracking, lazy_load=True).header.get('nb_streamlines')
+    tracking_size = os.path.getsize(tracking)
+    if nb_streamlines:
+        # A chunk is held as a list of arrays and as an ArraySequence, and
+        # transformed to voxel space.
+        tracking_size = (tracking_size / nb_streamlines *
+                         min(nb_streamlines, chunk_size) * 3)
+
+    # The T1 in float32 and its normalized copy, and the rendered views.
+    t1_size = np.prod(load_img(t1).shape[:3]) * 4 * 2
+    render_size = (3 * 1920 * 1080 + 3 * 1920 * 1920) * 4 * 2
+
+    return int(tracking_size + t1_size + render_size)
+
+
 def screenshot_tracking(tracking, t1, directory="."):
     """
     Compute 3 view screenshot with streamlines on T1.
@@ -437,10 +538,11 @@ def screenshot_tracking(tracking, t1, directory="."):
     name : string
         Path of the mosaic
     """
-    sft = load_tractogram(tracking, 'same')
-    sft.to_vox()
-    t1 = nib.load(t1)
-    t1_data = t1.get_fdata()
+    t1_filename = t1
+    t1 = load_img(t1)
+    t1_data = get_display_data(get_data(t1))
+    min_val, max_val = get_intensity_window(t1_filename, t1_data)
+    t1_color = (t1_data - min_val) / np.float32(max_val - min_val) * 255.0
 
     slice_name = ['sagittal', 'coronal', 'axial']
     img_center = [(int(t1_data.shape[0] / 2) + 5, None, None),
@@ -452,34 +554,18 @@ def screenshot_tracking(tracking, t1, directory="."):
     viewup = [(0, 0, -1), (0, 0, -1), (0, -1, 0)]
     size = (1920, 1080)
 
+    segments, sample = _sample_tractogram(
+        tracking, t1, [img_center[i][i] for i in range(3)])
+
     image = np.array([])
     for i, _axis in enumerate(slice_name):
-        streamlines = []
-        it = 0
-        slice_idx = img_center[i][i]
-
-        for streamline in sft.streamlines:
-            if it > 10000:
-                break
-            if slice_idx in np.array(streamline, dtype=int)[:, i]:
-                it += 1
-                idx = np.where(np.array(streamline, dtype=int)[:, i] == slice_idx)[0][0]
-                lower = idx - 2
-                if lower < 0:
-                    lower = 0
-                upper = idx + 2
-                if upper > len(streamline) - 1:
-                    upper = len(streamline) - 1
-                streamlines.append(streamline[lower:upper])
+        streamlines = segments[i]
 
         ren = window.Scene()
 
         streamline_actor = actor.line(streamlines, linewidth=0.2)
         ren.add(streamline_actor)
 
-        min_val = np.min(t1_data[t1_data > 0])
-        max_val = np.percentile(t1_data[t1_data > 0], 99)
-        t1_color = np.float32(t1_data - min_val) / np.float32(max_val - min_val) * 255.0
         slice_actor = actor.slicer(t1_color, opacity=0.8, value_range=(0, 255),
                                    interpolation='nearest')
         ren.add(slice_actor)
@@ -498,16 +584,8 @@ def screenshot_tracking(tracking, t1, directory="."):
         else:
             image = np.hstack((image, img2))
 
-    streamlines = []
-    it = 0
-    for streamline in sft.streamlines:
-        if it > 10000:
-            break
-        it += 1
-        streamlines.append(streamline)
-
     ren = window.Scene()
-    streamline_actor = actor.line(streamlines, linewidth=0.2)
+    streamline_actor = actor.line(sample, linewidth=0.2)
     ren.add(streamline_actor)
     camera = ren.GetActiveCamera()
     camera.SetViewUp(0, 0, -1)
@@ -526,6 +604,147 @@ def screenshot_tracking(tracking, t1, directory="."):
     return name
 
 
+def _sample_tractogram(tracking, reference, slices_idx, nb_streamlines=10000,
+                       chunk_size=100000, seed=0):
+    """
+    Read a tractogram chunk by chunk and keep, in bounded memory, the slab
+    segments of each view and a uniform sample of the streamlines for the
+    overview.
+
+    Parameters
+    ----------
+    tracking : string
+        Tractogram filename.
+    reference : nibabel image
+        Image giving the voxel space of the streamlines.
+    slices_idx : list of int
+        Index of the slice of each view (sagittal, coronal, axial).
+    nb_streamlines : int
+        Maximum number of streamlines of each view and of the sample.
+    chunk_size : int
+        Number of streamlines read at a time.
+    seed : int
+        Seed of the sampling, so the same tractogram gives the same
+        screenshot.
+
+    Returns
+    -------
+    segments : list
+        For each view, the list of segments crossing its slice. See
+        _select_slab_segments.
+    sample : list of array
+        Reservoir sample of nb_streamlines streamlines.
+    """
+    rng = np.random.default_rng(seed)
+    segments = [[] for _ in slices_idx]
+    sample = []
+    nb_seen = 0
+    for chunk in iter_streamlines_chunks(tracking, reference, chunk_size):
+        missing = [nb_streamlines - len(view) for view in segments]
+        if max(missing) > 0:
+            chunk_segments = _select_slab_segments(chunk, slices_idx,
+                                                   max(missing))
+            for view, curr_segments, curr_missing in zip(segments,
+                                                         chunk_segments,
+                                                         missing):
+                view.extend(curr_segments[:max(curr_missing, 0)])
+
+        # Reservoir sampling: the i-th streamline replaces a random one of
+        # the sample with probability nb_streamlines / (i + 1).
+        nb_fill = min(max(nb_streamlines - len(sample), 0), len(chunk))
+        sample.extend(chunk[:nb_fill].copy())
+        positions = np.arange(nb_seen + nb_fill, nb_seen + len(chunk))
+        slots = rng.integers(0, positions + 1)
+        for i in np.flatnonzero(slots < nb_streamlines):
+            sample[slots[i]] = chunk[nb_fill + i].copy()
+        nb_seen += len(chunk)
+
+    return segments, sample
+
+
+def _select_slab_segments(streamlines, slices_idx, max_streamlines=10000,
+                          chunk_size=10000000):
+    """
+    Cut the segments of the streamlines crossing the middle slice of each
+    view, without iterating over the streamlines.
+
+    The points of the flat buffer of the ArraySequence are read chunk_size
+    at a time, the points in the slices of the three views are found in the
+    same pass and mapped back to their streamline with np.searchsorted on
+    the offsets. The reading stops once max_streamlines streamlines were
+    found for each view.
+
+    Parameters
+    ----------
+    streamlines : ArraySequence
+        Streamlines in voxel space.
+    slices_idx : list of int
+        Index of the slice of each view (sagittal, coronal, axial).
+    max_streamlines : int
+        Maximum number of streamlines kept for each view.
+    chunk_size : int
+        Number of points read at a time.
+
+    Returns
+    -------
+    segments : list
+        For each view, the list of segments of at most 4 points around the
+        first point of each streamline in the slice.
+    """
+    offsets = streamlines._offsets
+    if np.any(np.diff(offsets) < 0):
+        streamlines = streamlines.copy()
+        offsets = streamlines._offsets
+    data = streamlines._data
+    lengths = streamlines._lengths
+    ends = offsets + lengths
+
+    hits = [[] for _ in slices_idx]
+    nb_found = [0] * len(slices_idx)
+    for start in range(0, len(data), chunk_size):
+        chunk = data[start:start + chunk_size].astype(int)
+        for axis, slice_idx in enumerate(slices_idx):
+            if nb_found[axis] >= max_streamlines:
+                continue
+            points = np.flatnonzero(chunk[:, axis] == slice_idx) + start
+            ids = np.searchsorted(offsets, points, side='right') - 1
+            # Points outside of the streamlines of a sliced ArraySequence.
+            valid = (ids >= 0) & (points < ends[ids])
+            hits[axis].append((points[valid], ids[valid]))
+            nb_found[axis] = len(np.unique(np.concatenate(
+                [curr_ids for _, curr_ids in hits[axis]])))
+
+        if min(nb_found) >= max_streamlines:
+            break
+
+    segments = []
+    for axis_hits in hits:
+        points = np.concatenate([curr_points for curr_points, _ in axis_hits]
+                                or [[]]).astype(int)
+        ids = np.concatenate([curr_ids for _, curr_ids in axis_hits]
+                             or [[]]).astype(int)
+        if not len(ids):
+            segments.append([])
+            continue
+
+        # The points are sorted, so the first hit of each streamline is its
+        # first point in the slice.
+        ids, first = np.unique(ids, return_index=True)
+        ids = ids[:max_streamlines]
+        idx = points[first[:max_streamlines]] - offsets[ids]
+        lower = np.maximum(idx - 2, 0)
+        upper = np.minimum(idx + 2, lengths[ids] - 1)
+        nb_points = np.maximum(upper - lower, 0)
+
+        # Index of each point of the segments in the flat buffer.
+        seg_ends = np.cumsum(nb_points)
+        indices = np.repeat(offsets[ids] + lower - (seg_ends - nb_points),
+                            nb_points) + np.arange(seg_ends[-1])
+        segments.append(np.split(data[indices], seg_ends[:-1]))
+
+    return segments
+
+
 def plot_proj_shell(ms, centroids, use_sym=True, use_sphere=True,
                     same_color=False,
                     rad=0.025, opacity=1.0, ofile=None, ores=(300, 300)):
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+import numpy as np
+from nibabel.streamlines import ArraySequence
+
+from dmriqcpy.viz.screenshot import _select_slab_segments
+
+
+def _select_slab_segments_loop(streamlines, slices_idx, max_streamlines):
+    # Selection of the segments as done per streamline before the flat
+    # buffer was used.
+    segments = []
+    for i, slice_idx in enumerate(slices_idx):
+        curr_segments = []
+        for streamline in streamlines:
+            if len(curr_segments) >= max_streamlines:
+                break
+            if slice_idx in np.array(streamline, dtype=int)[:, i]:
+                idx = np.where(np.array(streamline,
+                                        dtype=int)[:, i] == slice_idx)[0][0]
+                lower = max(idx - 2, 0)
+                upper = min(idx + 2, len(streamline) - 1)
+                curr_segments.append(streamline[lower:upper])
+        segments.append(curr_segments)
+    return segments
+
+
+class TestSelectSlabSegments(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.streamlines = ArraySequence(
+            [np.cumsum(rng.uniform(-1, 1, (rng.randint(1, 40), 3)), axis=0) +
+             rng.uniform(0, 20, 3) for _ in range(500)])
+        self.slices_idx = [10, 8, 12]
+
+    def _check(self, streamlines, max_streamlines=10000, chunk_size=10000):
+        segments = _select_slab_segments(streamlines, self.slices_idx,
+                                         max_streamlines=max_streamlines,
+                                         chunk_size=chunk_size)
+        expected = _select_slab_segments_loop(streamlines, self.slices_idx,
+                                              max_streamlines)
+
+        self.assertEqual(len(segments), len(expected))
+        for axis_segments, axis_expected in zip(segments, expected):
+            self.assertGreater(len(axis_expected), 0)
+            self.assertEqual(len(axis_segments), len(axis_expected))
+            for segment, segment_expected in zip(axis_segments,
+                                                 axis_expected):
+                np.testing.assert_array_equal(segment, segment_expected)
+
+    def test_same_as_loop(self):
+        self._check(self.streamlines)
+
+    def test_chunks(self):
+        self._check(self.streamlines, chunk_size=37)
+
+    def test_max_streamlines(self):
+        self._check(self.streamlines, max_streamlines=5, chunk_size=50)
+
+    def test_sliced(self):
+        self._check(self.streamlines[::3], chunk_size=100)
+
+    def test_no_streamline_in_slice(self):
+        segments = _select_slab_segments(self.streamlines, [1000, 1000, 1000])
+        self.assertEqual(segments, [[], [], []])
+
+
+if __name__ == '__main__':
+    unittest.main()
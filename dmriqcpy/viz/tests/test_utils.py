@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+import unittest
+
+import nibabel as nib
+import numpy as np
+
+from dmriqcpy.viz.screenshot import screenshot_mosaic_wrapper
+from dmriqcpy.viz.utils import compute_labels_map, load_lut, save_lut
+
+LUT = """# FreeSurfer look up table
+#No. Label Name:                R   G   B   A
+
+0   Unknown                     0   0   0   0
+2   Left-Cerebral-White-Matter  245 245 245 0
+3   Left-Cerebral-Cortex        205 62  78  0
+
+17  Left-Hippocampus            220 216 20  0
+1000 ctx-lh-unknown             25  5   25  0
+"""
+
+
+def _dict_lut(lut_fname):
+    # Look up table as parsed before the dense arrays.
+    labels = {}
+    with open(lut_fname) as f:
+        for line in f:
+            tokens = ' '.join(line.split()).split()
+            if tokens and not tokens[0].startswith('#'):
+                labels[int(tokens[0])] = np.array(tokens[2:5], dtype=int)
+    return labels
+
+
+class TestLabelsMap(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.lut_fname = self._write('lut.txt', LUT)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _write(self, name, content):
+        filename = os.path.join(self.tmp_dir.name, name)
+        with open(filename, 'w') as f:
+            f.write(content)
+        return filename
+
+    def test_load_lut(self):
+        lut = load_lut(self.lut_fname)
+        labels = _dict_lut(self.lut_fname)
+
+        self.assertEqual(lut.dtype, np.uint8)
+        self.assertEqual(len(lut), max(labels) + 1)
+        for label, color in labels.items():
+            np.testing.assert_array_equal(lut[label], color)
+        missing = sorted(set(range(len(lut))) - set(labels))
+        self.assertFalse(np.any(lut[missing]))
+
+    def test_saved_lut(self):
+        npy_fname = os.path.join(self.tmp_dir.name, 'lut.npy')
+        save_lut(self.lut_fname, npy_fname)
+        np.testing.assert_array_equal(compute_labels_map(npy_fname, None,
+                                                         False),
+                                      load_lut(self.lut_fname))
+
+    def test_computed_lut(self):
+        unique = np.array([0., 2., 17.])
+        lut = compute_labels_map(None, unique, True)
+
+        self.assertEqual(len(lut), 18)
+        self.assertFalse(np.any(lut[0]))
+        self.assertEqual(len(np.unique(lut[[2, 17]], axis=0)), 2)
+
+    def test_negative_label_in_lut(self):
+        lut_fname = self._write('negative.txt', LUT + '-1  Bad  1 2 3 0\n')
+        with self.assertRaisesRegex(ValueError, 'Negative label -1'):
+            load_lut(lut_fname)
+
+    def test_negative_label_in_image(self):
+        data = np.zeros((10, 10, 10), dtype=np.int16)
+        data[2:4, 2:4, 2:4] = 17
+        data[5, 5, 5] = -3
+        filename = os.path.join(self.tmp_dir.name, 'labels.nii.gz')
+        nib.save(nib.Nifti1Image(data, np.eye(4)), filename)
+
+        with self.assertRaisesRegex(ValueError, 'Negative label -3'):
+            screenshot_mosaic_wrapper(filename, directory=self.tmp_dir.name,
+                                      lut=self.lut_fname)
+
+
+if __name__ == '__main__':
+    unittest.main()
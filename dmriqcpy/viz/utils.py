@@ -1,5 +1,8 @@
 # -*- coding: utf-8 -*-
 
+import os
+import threading
+
 import fury
 import numpy as np
 import vtk
@@ -10,6 +13,10 @@ Some functions comes from
 https://github.com/scilus/scilpy/blob/master/scilpy/viz/gradient_sampling.py
 """
 
+_luts = {}
+# Offscreen render window of each thread, see renderer_to_arr.
+_render_context = threading.local()
+
 
 def analyse_qa(stats_per_subjects, stats_across_subjects, column_names):
     """
@@ -82,59 +89,160 @@ def renderer_to_arr(ren, size):
     Notes
     -----
     Inspired from https://github.com/fury-gl/fury/blob/master/fury/window.py
+
+    The offscreen render window of the thread is created on the first call
+    and reused by the next ones. See close_render_context.
     """
     width, height = size
 
-    graphics_factory = vtk.vtkGraphicsFactory()
-    graphics_factory.SetOffScreenOnlyMode(1)
-
-    render_window = vtk.vtkRenderWindow()
-    render_window.SetOffScreenRendering(1)
+    render_window, window_to_image_filter = _get_render_context()
     render_window.AddRenderer(ren)
     render_window.SetSize(width, height)
 
-    render_window.SetAlphaBitPlanes(True)
-
-    render_window.SetMultiSamples(0)
-
     ren.UseDepthPeelingOn()
 
     ren.SetMaximumNumberOfPeels(4)
 
     ren.SetOcclusionRatio(0.0)
 
-    render_window.Render()
+    try:
+        render_window.Render()
 
-    window_to_image_filter = vtk.vtkWindowToImageFilter()
-    window_to_image_filter.SetInput(render_window)
-    window_to_image_filter.Update()
+        window_to_image_filter.Modified()
+        window_to_image_filter.Update()
+    finally:
+        # Release the scene so its actors can be freed.
+        render_window.RemoveRenderer(ren)
 
     vtk_image = window_to_image_filter.GetOutput()
     h, w, _ = vtk_image.GetDimensions()
     vtk_array = vtk_image.GetPointData().GetScalars()
     components = vtk_array.GetNumberOfComponents()
-    arr = numpy_support.vtk_to_numpy(vtk_array).reshape(w, h, components)
+    # Copied, the output of the filter is overwritten by the next call.
+    arr = numpy_support.vtk_to_numpy(vtk_array).reshape(w, h,
+                                                        components).copy()
     return arr
 
 
+def close_render_context():
+    """
+    Release the offscreen render window of the thread, if any. It is
+    created again by the next call to renderer_to_arr.
+    """
+    context = getattr(_render_context, 'value', None)
+    if context is not None:
+        render_window, _ = context
+        _render_context.value = None
+        render_window.Finalize()
+
+
+def _get_render_context():
+    if getattr(_render_context, 'value', None) is None:
+        graphics_factory = vtk.vtkGraphicsFactory()
+        graphics_factory.SetOffScreenOnlyMode(1)
+
+        render_window = vtk.vtkRenderWindow()
+        render_window.SetOffScreenRendering(1)
+
+        render_window.SetAlphaBitPlanes(True)
+
+        render_window.SetMultiSamples(0)
+
+        window_to_image_filter = vtk.vtkWindowToImageFilter()
+        window_to_image_filter.SetInput(render_window)
+
+        _render_context.value = (render_window, window_to_image_filter)
+    return _render_context.value
+
+
 def compute_labels_map(lut_fname, unique_vals, compute_lut):
-    labels = {}
-    if compute_lut:
-        labels[0] = np.array((0,0,0),dtype=np.int8)
-        vtkcolors = fury.colormap.distinguishable_colormap(nb_colors=len(unique_vals))
-        for index, curr_label in enumerate(unique_vals[1:]):
-            labels[curr_label] = np.array((vtkcolors[index][0]*255,
-                                           vtkcolors[index][1]*255,
-                                           vtkcolors[index][2]*255),
-                                           dtype=np.int8)
-    else:
-        with open(lut_fname) as f:
-            for line in f:
-                tokens = ' '.join(line.split()).split()
-                if tokens and not tokens[0].startswith('#'):
-                    labels[np.int(tokens[0])] = np.array((tokens[2],
-                                                          tokens[3],
-                                                          tokens[4]),
-                                                          dtype=np.int8)
-
-    return labels
+    """
+    Compute the colors of the labels.
+
+    Parameters
+    ----------
+    lut_fname : string
+        Look up table filename, in FreeSurfer text format or as a .npy
+        array saved by save_lut.
+    unique_vals : array
+        Labels of the image. Only used if compute_lut is set.
+    compute_lut : bool
+        If set, compute distinguishable colors for the labels instead of
+        using the look up table.
+
+    Returns
+    -------
+    lut : array 2D
+        RGB colors (uint8) indexed by label.
+    """
+    if not compute_lut:
+        return load_lut(lut_fname)
+
+    unique_vals = np.asarray(unique_vals).astype(int)
+    lut = np.zeros((unique_vals.max() + 1, 3), dtype=np.uint8)
+    vtkcolors = fury.colormap.distinguishable_colormap(
+        nb_colors=len(unique_vals))
+    lut[unique_vals[1:]] = np.array(vtkcolors[:len(unique_vals) - 1]) * 255
+
+    return lut
+
+
+def load_lut(lut_fname):
+    """
+    Load a look up table as a dense array of colors. A file is only parsed
+    once per process, so the workers forked after a first call reuse it.
+
+    Parameters
+    ----------
+    lut_fname : string
+        Look up table filename, in FreeSurfer text format or as a .npy
+        array saved by save_lut.
+
+    Returns
+    -------
+    lut : array 2D
+        RGB colors (uint8) indexed by label. The labels missing from the
+        file are black.
+    """
+    stat = os.stat(lut_fname)
+    key = (os.path.realpath(lut_fname), stat.st_size, stat.st_mtime_ns)
+    if key not in _luts:
+        if lut_fname.endswith('.npy'):
+            _luts[key] = np.load(lut_fname)
+        else:
+            _luts[key] = _parse_lut(lut_fname)
+    return _luts[key]
+
+
+def save_lut(lut_fname, out_fname):
+    """
+    Save a look up table in FreeSurfer text format as a .npy array, which
+    is faster to load.
+
+    Parameters
+    ----------
+    lut_fname : string
+        Look up table filename.
+    out_fname : string
+        Output filename (.npy).
+    """
+    np.save(out_fname, load_lut(lut_fname))
+
+
+def _parse_lut(lut_fname):
+    labels = []
+    colors = []
+    with open(lut_fname) as f:
+        for line in f:
+            tokens = line.split()
+            if tokens and not tokens[0].startswith('#'):
+                labels.append(int(tokens[0]))
+                colors.append(tokens[2:5])
+
+    if min(labels) < 0:
+        raise ValueError('Negative label {} in {}.'.format(min(labels),
+                                                          lut_fname))
+
+    lut = np.zeros((max(labels) + 1, 3), dtype=np.uint8)
+    lut[labels] = np.array(colors, dtype=int)
+    return lut
@@ -2,17 +2,21 @@
 # -*- coding: utf-8 -*-
 
 import argparse
+import logging
 import os
 import shutil
 
-import itertools
-from multiprocessing import Pool
 import numpy as np
 
+from dmriqcpy.io.cache import cached_screenshot, load_cache
+from dmriqcpy.io.executor import load_executor
 from dmriqcpy.io.report import Report
-from dmriqcpy.io.utils import (add_online_arg, add_overwrite_arg,
-                               assert_inputs_exist, assert_outputs_exist,
-                               list_files_from_paths)
+from dmriqcpy.io.shard import ReportShard
+from dmriqcpy.io.utils import (add_cache_arg, add_executor_arg,
+                               add_online_arg, add_overwrite_arg,
+                               add_report_args, add_update_arg,
+                               assert_executor_args, assert_inputs_exist,
+                               assert_outputs_exist, list_files_from_paths)
 from dmriqcpy.analysis.stats import stats_mean_median
 from dmriqcpy.viz.graph import graph_mean_median
 from dmriqcpy.viz.screenshot import screenshot_mosaic_blend
@@ -50,30 +54,31 @@ def _build_arg_parser():
     p.add_argument('--nb_threads', type=int, default=1,
                    help='Number of threads. [%(default)s]')
 
+    add_executor_arg(p)
+    add_cache_arg(p)
+    add_update_arg(p)
     add_online_arg(p)
+    add_report_args(p)
     add_overwrite_arg(p)
 
     return p
 
 
-def _subj_parralel(images_no_bet, images_bet_mask, name, skip,
-                   summary, nb_columns):
-    subjects_dict = {}
-    for subj_metric, mask in zip(images_no_bet, images_bet_mask):
-        curr_key = os.path.basename(subj_metric).split('.')[0]
-        screenshot_path = screenshot_mosaic_blend(subj_metric, mask,
-                                                  output_prefix=name,
-                                                  directory="data",
-                                                  blend_val=0.3,
-                                                  skip=skip,
-                                                  nb_columns=nb_columns,
-                                                  is_mask=True)
+def _subj_parralel(subj_metric, mask, name, skip, nb_columns, cache):
+    return cached_screenshot(cache, screenshot_mosaic_blend, "data",
+                             subj_metric, mask, output_prefix=name,
+                             blend_val=0.3, skip=skip, nb_columns=nb_columns,
+                             is_mask=True)
 
-        summary_html = dataframe_to_html(summary.loc[curr_key].to_frame())
-        subjects_dict[curr_key] = {}
-        subjects_dict[curr_key]['screenshot'] = screenshot_path
-        subjects_dict[curr_key]['stats'] = summary_html
-    return subjects_dict
+
+def _subj_task(task):
+    # A failing subject only loses its own screenshot, the error is
+    # reported by the parent.
+    index, subj_args = task
+    try:
+        return index, _subj_parralel(*subj_args), None
+    except Exception as e:
+        return index, None, '{}: {}'.format(type(e).__name__, e)
 
 
 def main():
@@ -89,61 +94,97 @@ def main():
     all_images = np.concatenate([images_no_bet, images_bet_mask])
     assert_inputs_exist(parser, all_images)
     assert_outputs_exist(parser, args, [args.output_report, "data", "libs"])
+    assert_executor_args(parser, args)
 
-    if os.path.exists("data"):
-        shutil.rmtree("data")
-    os.makedirs("data")
+    executor = load_executor(args)
+    images_no_bet, images_bet_mask = executor.shard(images_no_bet,
+                                                    images_bet_mask)
 
-    if os.path.exists("libs"):
-        shutil.rmtree("libs")
+    if os.path.exists("data") and not (args.update or executor.partial):
+        shutil.rmtree("data")
+    os.makedirs("data", exist_ok=True)
 
     metrics = images_no_bet
     name = args.image_type
+    cache = load_cache(args)
     curr_metrics = ['Mean {}'.format(name),
                     'Median {}'.format(name)]
 
-    summary, stats = stats_mean_median(curr_metrics, metrics)
+    summary, stats = stats_mean_median(curr_metrics, metrics,
+                                       nb_threads=args.nb_threads,
+                                       cache=cache, executor=executor)
+
+    # One task per subject, the largest first, so the slow subjects do not
+    # end up alone at the end of the run.
+    tasks = [(i, (subj_metric, mask, name, args.skip, args.nb_columns, cache))
+             for i, (subj_metric, mask) in enumerate(zip(images_no_bet,
+                                                         images_bet_mask))]
+    tasks.sort(key=lambda task: os.path.getsize(task[1][0]), reverse=True)
+
+    screenshots = [None] * len(tasks)
+    failed = []
+    executor.close()
+    pool = executor.pool()
+    for i, screenshot_path, error in pool.imap_unordered(_subj_task, tasks,
+                                                         chunksize=1):
+        screenshots[i] = screenshot_path
+        if error is not None:
+            logging.warning("Screenshot of {} failed. {}".format(
+                images_no_bet[i], error))
+            failed.append(os.path.basename(images_no_bet[i]).split('.')[0])
+    pool.close()
+    pool.join()
+
+    metrics_dict = {}
+    subjects_dict = {}
+    for subj_metric, screenshot_path in zip(images_no_bet, screenshots):
+        curr_key = os.path.basename(subj_metric).split('.')[0]
+        summary_html = dataframe_to_html(summary.loc[curr_key].to_frame())
+        subjects_dict[curr_key] = {}
+        subjects_dict[curr_key]['screenshot'] = screenshot_path
+        subjects_dict[curr_key]['stats'] = summary_html
+    metrics_dict[name] = subjects_dict
+
+    nb_subjects = len(images_no_bet)
+    title = "Quality Assurance BET " + args.image_type
+    if executor.partial:
+        if args.shard_dir:
+            shard = ReportShard(title, nb_subjects)
+            shard.add_summary(name, summary, curr_metrics)
+            shard.add_graph('graph_mean_median', 'Mean {}'.format(name),
+                            name, curr_metrics)
+            shard.add_warnings(name, 'Screenshot failed', failed)
+            shard.add_subjects(metrics_dict)
+            shard.save(args.shard_dir, args.shard_index)
+        cache.close()
+        return
 
     warning_dict = {}
     warning_dict[name] = analyse_qa(summary, stats, curr_metrics)
+    if failed:
+        warning_dict[name]['Screenshot failed'] = failed
     warning_images = [filenames for filenames in warning_dict[name].values()]
-    warning_list = np.concatenate([warning_images])
+    warning_list = np.concatenate(warning_images)
     warning_dict[name]['nb_warnings'] = len(np.unique(warning_list))
 
     graphs = []
-    graph = graph_mean_median('Mean {}'.format(name), curr_metrics, summary,
-                              args.online)
+    graph = graph_mean_median('Mean {}'.format(name), curr_metrics, summary)
     graphs.append(graph)
 
     stats_html = dataframe_to_html(stats)
     summary_dict = {}
     summary_dict[name] = stats_html
 
-    pool = Pool(args.nb_threads)
-    subjects_dict_pool = pool.starmap(_subj_parralel,
-        zip(np.array_split(np.array(images_no_bet), args.nb_threads),
-            np.array_split(np.array(images_bet_mask), args.nb_threads),
-            itertools.repeat(name), itertools.repeat(args.skip),
-            itertools.repeat(summary), itertools.repeat(args.nb_columns)))
-
-    pool.close()
-    pool.join()
-
-    metrics_dict = {}
-    subjects_dict = {}
-    for dict_sub in subjects_dict_pool:
-        for key in dict_sub:
-            subjects_dict[key] = dict_sub[key]
-    metrics_dict[name] = subjects_dict
-
-    nb_subjects = len(images_no_bet)
-    report = Report(args.output_report)
-    report.generate(title="Quality Assurance BET " + args.image_type,
+    report = Report(args.output_report, assets_dir=args.assets_dir,
+                    page_size=args.page_size)
+    report.generate(title=title,
                     nb_subjects=nb_subjects, summary_dict=summary_dict,
                     graph_array=graphs, metrics_dict=metrics_dict,
                     warning_dict=warning_dict,
                     online=args.online)
 
+    cache.close()
+
 
 if __name__ == '__main__':
     main()
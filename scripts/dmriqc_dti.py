@@ -3,21 +3,26 @@
 
 import argparse
 import itertools
-from multiprocessing import Pool
 import os
 import shutil
 
 import numpy as np
 
-from dmriqcpy.analysis.stats import stats_mean_in_tissues
+from dmriqcpy.analysis.stats import stats_mean_in_tissues_multi
+from dmriqcpy.io.cache import cached_screenshot, load_cache
+from dmriqcpy.io.executor import load_executor
 from dmriqcpy.io.report import Report
-from dmriqcpy.io.utils import (add_online_arg, add_overwrite_arg,
-                               assert_inputs_exist, assert_outputs_exist,
-                               list_files_from_paths)
+from dmriqcpy.io.shard import ReportShard
+from dmriqcpy.io.utils import (add_cache_arg, add_executor_arg,
+                               add_online_arg, add_overwrite_arg,
+                               add_report_args, add_update_arg,
+                               assert_executor_args, assert_inputs_exist,
+                               assert_outputs_exist, list_files_from_paths)
 from dmriqcpy.viz.graph import graph_mean_in_tissues
 from dmriqcpy.viz.screenshot import (screenshot_fa_peaks,
                                      screenshot_mosaic_wrapper)
-from dmriqcpy.viz.utils import analyse_qa, dataframe_to_html
+from dmriqcpy.viz.utils import (analyse_qa, close_render_context,
+                                dataframe_to_html)
 
 DESCRIPTION = """
 Compute the DTI report in HTML format.
@@ -68,29 +73,27 @@ def _build_arg_parser():
     p.add_argument('--nb_threads', type=int, default=1,
                    help='Number of threads. [%(default)s]')
 
+    add_executor_arg(p)
+    add_cache_arg(p)
+    add_update_arg(p)
     add_online_arg(p)
+    add_report_args(p)
     add_overwrite_arg(p)
 
     return p
 
 
-def _subj_parralel(subj_metric, summary, name, skip, nb_columns):
-    subjects_dict = {}
-    curr_key = os.path.basename(subj_metric).split('.')[0]
+def _subj_parralel(subj_metric, name, skip, nb_columns, cache):
     cmap = None
     if name == "Residual":
         cmap = "hot"
-    screenshot_path = screenshot_mosaic_wrapper(subj_metric,
-                                                output_prefix=name,
-                                                directory="data", skip=skip,
-                                                nb_columns=nb_columns,
-                                                cmap=cmap)
+    return cached_screenshot(cache, screenshot_mosaic_wrapper, "data",
+                             subj_metric, output_prefix=name, skip=skip,
+                             nb_columns=nb_columns, cmap=cmap)
+
 
-    summary_html = dataframe_to_html(summary.loc[curr_key].to_frame())
-    subjects_dict[curr_key] = {}
-    subjects_dict[curr_key]['screenshot'] = screenshot_path
-    subjects_dict[curr_key]['stats'] = summary_html
-    return subjects_dict
+def _subj_peaks(fa, evecs, cache):
+    return cached_screenshot(cache, screenshot_fa_peaks, "data", fa, evecs)
 
 
 def main():
@@ -115,77 +118,115 @@ def main():
                                  gm, csf])
     assert_inputs_exist(parser, all_images)
     assert_outputs_exist(parser, args, [args.output_report, "data", "libs"])
+    assert_executor_args(parser, args)
 
-    if os.path.exists("data"):
-        shutil.rmtree("data")
-    os.makedirs("data")
+    executor = load_executor(args)
+    fa, md, rd, ad, residual, evecs_v1, wm, gm, csf = executor.shard(
+        fa, md, rd, ad, residual, evecs_v1, wm, gm, csf)
 
-    if os.path.exists("libs"):
-        shutil.rmtree("libs")
+    if os.path.exists("data") and not (args.update or executor.partial):
+        shutil.rmtree("data")
+    os.makedirs("data", exist_ok=True)
 
+    cache = load_cache(args)
     metrics_names = [[fa, 'FA'], [md, 'MD'], [rd, 'RD'],
                      [ad, 'AD'], [residual, "Residual"]]
     metrics_dict = {}
     summary_dict = {}
     graphs = []
     warning_dict = {}
-    for metrics, name in metrics_names:
-        subjects_dict = {}
-        curr_metrics = ['Mean {} in WM'.format(name),
-                        'Mean {} in GM'.format(name),
-                        'Mean {} in CSF'.format(name),
-                        'Max {} in WM'.format(name)]
+    summaries = {}
+    jobs = []
+    curr_metrics_names = [['Mean {} in WM'.format(name),
+                           'Mean {} in GM'.format(name),
+                           'Mean {} in CSF'.format(name),
+                           'Max {} in WM'.format(name)]
+                          for _, name in metrics_names]
+    tissues_stats = stats_mean_in_tissues_multi(
+        [(curr_metrics, metrics) for curr_metrics, (metrics, _) in
+         zip(curr_metrics_names, metrics_names)], wm, gm, csf,
+        nb_threads=args.nb_threads, cache=cache, executor=executor)
+
+    for (metrics, name), (summary, _) in zip(metrics_names, tissues_stats):
+        summaries[name] = summary
+        jobs.extend(zip(metrics, itertools.repeat(name),
+                        itertools.repeat(args.skip),
+                        itertools.repeat(args.nb_columns),
+                        itertools.repeat(cache)))
+
+    executor.close()
+    # A single pool for the screenshots of all the metrics and the peaks, so
+    # the workers stay busy across the metrics. The peaks are the slowest
+    # screenshots, so they are submitted first.
+    pool = executor.pool()
+    peaks_pool = pool.starmap_async(_subj_peaks,
+                                    zip(fa, evecs_v1,
+                                        itertools.repeat(cache)),
+                                    chunksize=1)
+    screenshots = pool.starmap(_subj_parralel, jobs, chunksize=1)
+    peaks_screenshots = peaks_pool.get()
+    pool.close()
+    pool.join()
+    close_render_context()
+
+    for (subj_metric, name, _, _, _), screenshot_path in zip(jobs,
+                                                              screenshots):
+        curr_key = os.path.basename(subj_metric).split('.')[0]
+        summary_html = dataframe_to_html(
+            summaries[name].loc[curr_key].to_frame())
+        subjects_dict = metrics_dict.setdefault(name, {})
+        subjects_dict[curr_key] = {}
+        subjects_dict[curr_key]['screenshot'] = screenshot_path
+        subjects_dict[curr_key]['stats'] = summary_html
 
-        summary, stats = stats_mean_in_tissues(curr_metrics, metrics, wm,
-                                               gm, csf)
+    subjects_dict = {}
+    name = "Peaks"
+    for curr_evecs, screenshot_path in zip(evecs_v1, peaks_screenshots):
+        evecs_filename = os.path.basename(curr_evecs).split('.')[0]
+        subjects_dict[evecs_filename] = {}
+        subjects_dict[evecs_filename]['screenshot'] = screenshot_path
+    metrics_dict[name] = subjects_dict
 
+    nb_subjects = len(fa)
+    title = "Quality Assurance DTI metrics"
+    if executor.partial:
+        if args.shard_dir:
+            shard = ReportShard(title, nb_subjects)
+            for (_, name), curr_metrics in zip(metrics_names,
+                                               curr_metrics_names):
+                shard.add_summary(name, summaries[name], curr_metrics[:3])
+                shard.add_graph('graph_mean_in_tissues',
+                                'Mean {}'.format(name), name,
+                                curr_metrics[:3])
+            shard.add_subjects(metrics_dict)
+            shard.save(args.shard_dir, args.shard_index)
+        cache.close()
+        return
+
+    for (_, name), curr_metrics, (summary, stats) in zip(
+            metrics_names, curr_metrics_names, tissues_stats):
         warning_dict[name] = analyse_qa(summary, stats, curr_metrics[:3])
         warning_list = np.concatenate(
             [filenames for filenames in warning_dict[name].values()])
         warning_dict[name]['nb_warnings'] = len(np.unique(warning_list))
 
         graph = graph_mean_in_tissues('Mean {}'.format(name), curr_metrics[:3],
-                                      summary, args.online)
+                                      summary)
         graphs.append(graph)
 
         stats_html = dataframe_to_html(stats)
         summary_dict[name] = stats_html
 
-        pool = Pool(args.nb_threads)
-        subjects_dict_pool = pool.starmap(_subj_parralel,
-                                          zip(metrics,
-                                              itertools.repeat(summary),
-                                              itertools.repeat(name),
-                                              itertools.repeat(args.skip),
-                                              itertools.repeat(
-                                                 args.nb_columns)))
-
-        pool.close()
-        pool.join()
-
-        for dict_sub in subjects_dict_pool:
-            for key in dict_sub:
-                subjects_dict[key] = dict_sub[key]
-        metrics_dict[name] = subjects_dict
-
-    subjects_dict = {}
-    name = "Peaks"
-    for curr_fa, curr_evecs in zip(fa, evecs_v1):
-        evecs_filename = os.path.basename(curr_evecs).split('.')[0]
-        screenshot_path = screenshot_fa_peaks(curr_fa, curr_evecs, "data")
-
-        subjects_dict[evecs_filename] = {}
-        subjects_dict[evecs_filename]['screenshot'] = screenshot_path
-    metrics_dict[name] = subjects_dict
-
-    nb_subjects = len(fa)
-    report = Report(args.output_report)
-    report.generate(title="Quality Assurance DTI metrics",
+    report = Report(args.output_report, assets_dir=args.assets_dir,
+                    page_size=args.page_size)
+    report.generate(title=title,
                     nb_subjects=nb_subjects, summary_dict=summary_dict,
                     graph_array=graphs, metrics_dict=metrics_dict,
                     warning_dict=warning_dict,
                     online=args.online)
 
+    cache.close()
+
 
 if __name__ == '__main__':
     main()
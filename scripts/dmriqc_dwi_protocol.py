@@ -2,6 +2,7 @@
 # -*- coding: utf-8 -*-
 
 import argparse
+import itertools
 import os
 import shutil
 
@@ -11,10 +12,15 @@ import pandas as pd
 from dmriqcpy.analysis.utils import (dwi_protocol, read_protocol,
                                      identify_shells,
                                      build_ms_from_shell_idx)
+from dmriqcpy.io.cache import cached_screenshot, load_cache
+from dmriqcpy.io.executor import load_executor
 from dmriqcpy.io.report import Report
-from dmriqcpy.io.utils import (add_online_arg, add_overwrite_arg,
-                               assert_inputs_exist, assert_outputs_exist,
-                               list_files_from_paths)
+from dmriqcpy.io.shard import ReportShard
+from dmriqcpy.io.utils import (add_cache_arg, add_executor_arg,
+                               add_online_arg, add_overwrite_arg,
+                               add_report_args, add_update_arg,
+                               assert_executor_args, assert_inputs_exist,
+                               assert_outputs_exist, list_files_from_paths)
 from dmriqcpy.viz.graph import (graph_directions_per_shells,
                                 graph_dwi_protocol,
                                 graph_subjects_per_shells)
@@ -53,12 +59,39 @@ def _build_arg_parser():
                    help='The tolerated gap between the b-values to '
                         'extract\nand the actual b-values. [%(default)s]')
 
+    p.add_argument('--nb_threads', type=int, default=1,
+                   help='Number of threads. [%(default)s]')
+
+    add_executor_arg(p)
+    add_cache_arg(p)
+    add_update_arg(p)
     add_online_arg(p)
+    add_report_args(p)
     add_overwrite_arg(p)
 
     return p
 
 
+def _subj_parralel(curr_bval, curr_bvec, name, cache):
+    return cached_screenshot(cache, _screenshot_shells, "data", curr_bval,
+                             curr_bvec, name)
+
+
+def _screenshot_shells(curr_bval, curr_bvec, name, directory="."):
+    curr_subj = os.path.basename(curr_bval).split('.')[0]
+    points = np.genfromtxt(curr_bvec)
+    if points.shape[0] == 3:
+        points = points.T
+    bvals = np.genfromtxt(curr_bval)
+    centroids, shell_idx = identify_shells(bvals)
+    ms = build_ms_from_shell_idx(points, shell_idx)
+    ofile = os.path.join(directory, name.replace(" ", "_") + "_" + curr_subj)
+    plot_proj_shell(ms, centroids, use_sym=True, use_sphere=True,
+                    same_color=False, rad=0.025, opacity=0.2,
+                    ofile=ofile, ores=(800, 800))
+    return ofile + '.png'
+
+
 def main():
     parser = _build_arg_parser()
     args = parser.parse_args()
@@ -71,30 +104,37 @@ def main():
     if not len(bval) == len(bvec):
         parser.error("Not the same number of images in input.")
 
-    stats_tags = []
-    stats_tags_for_graph = []
-    if args.metadata:
-        if not len(metadata) == len(bval):
-            parser.error('Number of metadata files: {}.\n'
-                         'Number of bval files: {}.\n'
-                         'Not the same number of images '
-                         'in input'.format(len(metadata),
-                                           len(bval)))
-        else:
-            stats_tags, stats_tags_for_graph,\
-                stats_tags_for_graph_all = read_protocol(metadata,
-                                                         args.dicom_fields)
+    if args.metadata and not len(metadata) == len(bval):
+        parser.error('Number of metadata files: {}.\n'
+                     'Number of bval files: {}.\n'
+                     'Not the same number of images '
+                     'in input'.format(len(metadata),
+                                       len(bval)))
 
     all_data = np.concatenate([bval, bvec])
     assert_inputs_exist(parser, all_data)
     assert_outputs_exist(parser, args, [args.output_report, "data", "libs"])
+    assert_executor_args(parser, args)
+
+    executor = load_executor(args)
+    if args.metadata:
+        bval, bvec, metadata = executor.shard(bval, bvec, metadata)
+    else:
+        bval, bvec = executor.shard(bval, bvec)
 
-    if os.path.exists("data"):
+    stats_tags = []
+    stats_tags_for_graph = []
+    # A shard may have no subject.
+    if args.metadata and metadata:
+        stats_tags, stats_tags_for_graph,\
+            stats_tags_for_graph_all = read_protocol(metadata,
+                                                     args.dicom_fields)
+
+    if os.path.exists("data") and not (args.update or executor.partial):
         shutil.rmtree("data")
-    os.makedirs("data")
+    os.makedirs("data", exist_ok=True)
 
-    if os.path.exists("libs"):
-        shutil.rmtree("libs")
+    cache = load_cache(args)
 
     name = "DWI Protocol"
     summary, stats_for_graph, stats_all, shells = dwi_protocol(bval)
@@ -115,6 +155,46 @@ def main():
         stats_all = pd.concat([stats_all, stats_tags_for_graph_all],
                               axis=1, join="inner")
 
+    pool = executor.pool()
+    screenshots = pool.starmap(_subj_parralel,
+                               zip(bval, bvec,
+                                   itertools.repeat(name),
+                                   itertools.repeat(cache)))
+    pool.close()
+    pool.join()
+
+    subjects_dict = {}
+    for curr_bval, screenshot_path in zip(bval, screenshots):
+        curr_subj = os.path.basename(curr_bval).split('.')[0]
+        subjects_dict[curr_subj] = {}
+        subjects_dict[curr_subj]['screenshot'] = screenshot_path
+    metrics_dict = {}
+    for subj in bval:
+        curr_subj = os.path.basename(subj).split('.')[0]
+        summary_html = dataframe_to_html(summary[subj])
+        subjects_dict[curr_subj]['stats'] = summary_html
+    metrics_dict[name] = subjects_dict
+
+    nb_subjects = len(bval)
+    title = "Quality Assurance DWI protocol"
+    if executor.partial:
+        if args.shard_dir:
+            # The shells of each subject, recomputed across the shards by
+            # the graphs.
+            shard = ReportShard(title, nb_subjects)
+            shard.add_summary(name, stats_for_graph, stats_for_graph.columns)
+            shard.add_table('Shells', pd.DataFrame(shells))
+            shard.add_graph('graph_directions_per_shells',
+                            "Nbr directions per shell", 'Shells')
+            shard.add_graph('graph_subjects_per_shells',
+                            "Nbr subjects per shell", 'Shells')
+            for c in stats_for_graph.keys():
+                shard.add_graph('graph_dwi_protocol', c, name, c)
+            shard.add_subjects(metrics_dict)
+            shard.save(args.shard_dir, args.shard_index)
+        cache.close()
+        return
+
     warning_dict = {}
     warning_dict[name] = analyse_qa(stats_for_graph, stats_all,
                                     stats_all.columns)
@@ -134,51 +214,24 @@ def main():
     graphs = []
 
     graphs.append(
-        graph_directions_per_shells("Nbr directions per shell",
-                                    shells, args.online))
+        graph_directions_per_shells("Nbr directions per shell", shells))
 
     graphs.append(graph_subjects_per_shells("Nbr subjects per shell",
-                                            shells, args.online))
+                                            shells))
     for c in stats_for_graph.keys():
-        graph = graph_dwi_protocol(c, c, stats_for_graph, args.online)
+        graph = graph_dwi_protocol(c, c, stats_for_graph)
         graphs.append(graph)
 
-    subjects_dict = {}
-    for curr_bval, curr_bvec in zip(bval, bvec):
-        curr_subj = os.path.basename(curr_bval).split('.')[0]
-        subjects_dict[curr_subj] = {}
-        points = np.genfromtxt(curr_bvec)
-        if points.shape[0] == 3:
-            points = points.T
-        bvals = np.genfromtxt(curr_bval)
-        centroids, shell_idx = identify_shells(bvals)
-        ms = build_ms_from_shell_idx(points, shell_idx)
-        plot_proj_shell(ms, centroids, use_sym=True, use_sphere=True,
-                        same_color=False, rad=0.025, opacity=0.2,
-                        ofile=os.path.join("data", name.replace(" ", "_") +
-                                           "_" + curr_subj),
-                        ores=(800, 800))
-        subjects_dict[curr_subj]['screenshot'] = os.path.join("data",
-                                                              name.replace(" ",
-                                                                           "_") +
-                                                              "_" +
-                                                              curr_subj +
-                                                              '.png')
-    metrics_dict = {}
-    for subj in bval:
-        curr_subj = os.path.basename(subj).split('.')[0]
-        summary_html = dataframe_to_html(summary[subj])
-        subjects_dict[curr_subj]['stats'] = summary_html
-    metrics_dict[name] = subjects_dict
-
-    nb_subjects = len(bval)
-    report = Report(args.output_report)
-    report.generate(title="Quality Assurance DWI protocol",
+    report = Report(args.output_report, assets_dir=args.assets_dir,
+                    page_size=args.page_size)
+    report.generate(title=title,
                     nb_subjects=nb_subjects, metrics_dict=metrics_dict,
                     summary_dict=summary_dict, graph_array=graphs,
                     warning_dict=warning_dict,
                     online=args.online)
 
+    cache.close()
+
 
 if __name__ == '__main__':
     main()
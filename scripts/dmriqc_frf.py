@@ -3,15 +3,16 @@
 
 import argparse
 import os
-import shutil
 
 import numpy as np
 
 from dmriqcpy.analysis.stats import stats_frf
+from dmriqcpy.io.cache import load_cache
 from dmriqcpy.io.report import Report
-from dmriqcpy.io.utils import (add_online_arg, add_overwrite_arg,
-                               assert_inputs_exist, assert_outputs_exist,
-                               list_files_from_paths)
+from dmriqcpy.io.utils import (add_cache_arg, add_online_arg,
+                               add_overwrite_arg, add_report_args,
+                               add_update_arg, assert_inputs_exist,
+                               assert_outputs_exist, list_files_from_paths)
 from dmriqcpy.viz.graph import graph_frf_eigen, graph_frf_b0
 from dmriqcpy.viz.utils import analyse_qa, dataframe_to_html
 
@@ -32,7 +33,10 @@ def _build_arg_parser():
     p.add_argument('output_report',
                    help='Filename of QC report (in html format).')
 
+    add_cache_arg(p)
+    add_update_arg(p)
     add_online_arg(p)
+    add_report_args(p)
     add_overwrite_arg(p)
 
     return p
@@ -47,23 +51,19 @@ def main():
     assert_inputs_exist(parser, frf)
     assert_outputs_exist(parser, args, [args.output_report, "libs"])
 
-    if os.path.exists("libs"):
-        shutil.rmtree("libs")
-
     name = "FRF"
+    cache = load_cache(args)
     metrics_names = ["Mean Eigen value 1", "Mean Eigen value 2", "Mean B0"]
 
     warning_dict = {}
-    summary, stats = stats_frf(metrics_names, frf)
+    summary, stats = stats_frf(metrics_names, frf, cache=cache)
     warning_dict[name] = analyse_qa(summary, stats, metrics_names)
     warning_list = np.concatenate([filenames for filenames in warning_dict[name].values()])
     warning_dict[name]['nb_warnings'] = len(set(warning_list))
 
     graphs = []
-    graphs.append(graph_frf_eigen("EigenValues", metrics_names, summary,
-                                  args.online))
-    graphs.append(graph_frf_b0("Mean B0", metrics_names, summary, args.online))
-
+    graphs.append(graph_frf_eigen("EigenValues", metrics_names, summary))
+    graphs.append(graph_frf_b0("Mean B0", metrics_names, summary))
 
     summary_dict = {}
     stats_html = dataframe_to_html(stats)
@@ -79,13 +79,16 @@ def main():
     metrics_dict[name] = subjects_dict
 
     nb_subjects = len(frf)
-    report = Report(args.output_report)
+    report = Report(args.output_report, assets_dir=args.assets_dir,
+                    page_size=args.page_size)
     report.generate(title="Quality Assurance FRF",
                     nb_subjects=nb_subjects, summary_dict=summary_dict,
                     graph_array=graphs, metrics_dict=metrics_dict,
                     warning_dict=warning_dict,
                     online=args.online)
 
+    cache.close()
+
 
 if __name__ == '__main__':
     main()
@@ -7,9 +7,12 @@ import os
 import pandas as pd
 import shutil
 
+from dmriqcpy.io.cache import cached_screenshot, load_cache
 from dmriqcpy.io.report import Report
-from dmriqcpy.io.utils import (add_online_arg, add_overwrite_arg,
-                               assert_inputs_exist, assert_outputs_exist)
+from dmriqcpy.io.utils import (add_cache_arg, add_online_arg,
+                               add_overwrite_arg, add_report_args,
+                               add_update_arg, assert_inputs_exist,
+                               assert_outputs_exist)
 from dmriqcpy.viz.utils import dataframe_to_html
 
 DESCRIPTION = """
@@ -33,12 +36,26 @@ def _build_arg_parser():
     p.add_argument('--sym_link', action="store_true",
                    help='Use symlink instead of copy')
 
+    add_cache_arg(p)
+    add_update_arg(p)
     add_online_arg(p)
+    add_report_args(p)
     add_overwrite_arg(p)
 
     return p
 
 
+def _copy_screenshot(screenshot, sym_link=False, directory="."):
+    name = os.path.join(directory, os.path.basename(screenshot))
+    if sym_link:
+        if os.path.lexists(name):
+            os.remove(name)
+        os.symlink(os.path.abspath(screenshot), name)
+    else:
+        shutil.copyfile(screenshot, name)
+    return name
+
+
 def main():
     parser = _build_arg_parser()
     args = parser.parse_args()
@@ -50,12 +67,11 @@ def main():
     for folder in args.data[1:]:
         nb_subjects += len(os.listdir(folder))
 
-    if os.path.exists("data"):
+    if os.path.exists("data") and not args.update:
         shutil.rmtree("data")
-    os.makedirs("data")
+    os.makedirs("data", exist_ok=True)
 
-    if os.path.exists("libs"):
-        shutil.rmtree("libs")
+    cache = load_cache(args)
 
     metrics_dict = {}
     types = ""
@@ -75,26 +91,24 @@ def main():
         subjects_dict = {}
         for index, curr_screenshot in enumerate(screenshot_files):
             screenshot_basename = os.path.basename(curr_screenshot)
-            if args.sym_link:
-                os.symlink(os.path.abspath(folder) + "/" + screenshot_basename,
-                           "data/" + screenshot_basename)
-            else:
-                shutil.copyfile(curr_screenshot,
-                                "data/" + screenshot_basename)
             subjects_dict[screenshot_basename] = {}
             subjects_dict[screenshot_basename]['screenshot'] =\
-                "data/" + screenshot_basename
+                cached_screenshot(cache, _copy_screenshot, "data",
+                                  curr_screenshot, sym_link=args.sym_link)
             if args.stats:
                 subjects_dict[screenshot_basename]['stats'] = dataframe_to_html(pd.read_csv(stats_files[index], index_col=False))
 
         metrics_dict[name] = subjects_dict
         types += " {0}".format(name)
 
-    report = Report(args.output_report)
+    report = Report(args.output_report, assets_dir=args.assets_dir,
+                    page_size=args.page_size)
     report.generate(title="Quality Assurance" + types,
                     nb_subjects=nb_subjects, metrics_dict=metrics_dict,
                     online=args.online)
 
+    cache.close()
+
 
 if __name__ == '__main__':
     main()
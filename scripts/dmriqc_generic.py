@@ -3,17 +3,21 @@
 
 import argparse
 import itertools
-from multiprocessing import Pool
 import os
 import shutil
 
 import numpy as np
 
 from dmriqcpy.analysis.stats import stats_mean_in_tissues, stats_mean_median
+from dmriqcpy.io.cache import cached_screenshot, load_cache
+from dmriqcpy.io.executor import load_executor
 from dmriqcpy.io.report import Report
-from dmriqcpy.io.utils import (add_online_arg, add_overwrite_arg,
-                               assert_inputs_exist, assert_outputs_exist,
-                               list_files_from_paths)
+from dmriqcpy.io.shard import ReportShard
+from dmriqcpy.io.utils import (add_cache_arg, add_executor_arg,
+                               add_online_arg, add_overwrite_arg,
+                               add_report_args, add_update_arg,
+                               assert_executor_args, assert_inputs_exist,
+                               assert_outputs_exist, list_files_from_paths)
 from dmriqcpy.viz.graph import graph_mean_in_tissues, graph_mean_median
 from dmriqcpy.viz.screenshot import screenshot_mosaic_wrapper
 from dmriqcpy.viz.utils import analyse_qa, dataframe_to_html
@@ -56,29 +60,29 @@ def _build_arg_parser():
                    help='Duration of each image in GIF in milliseconds.'
                         ' [%(default)s]')
 
+    p.add_argument('--all_volumes', action='store_true',
+                   help='Compute the mean and median over all the volumes of '
+                        '4D images\ninstead of the volume with the highest '
+                        'value at the center voxel.\nIgnored if the tissue '
+                        'masks are given.')
+
     p.add_argument('--nb_threads', type=int, default=1,
                    help='Number of threads. [%(default)s]')
 
+    add_executor_arg(p)
+    add_cache_arg(p)
+    add_update_arg(p)
     add_online_arg(p)
+    add_report_args(p)
     add_overwrite_arg(p)
 
     return p
 
 
-def _subj_parralel(subj_metric, summary, name, skip, nb_columns, duration):
-    subjects_dict = {}
-    curr_key = os.path.basename(subj_metric).split('.')[0]
-    screenshot_path = screenshot_mosaic_wrapper(subj_metric,
-                                                output_prefix=name,
-                                                directory="data", skip=skip,
-                                                nb_columns=nb_columns,
-                                                duration=duration)
-
-    summary_html = dataframe_to_html(summary.loc[curr_key].to_frame())
-    subjects_dict[curr_key] = {}
-    subjects_dict[curr_key]['screenshot'] = screenshot_path
-    subjects_dict[curr_key]['stats'] = summary_html
-    return subjects_dict
+def _subj_parralel(subj_metric, name, skip, nb_columns, duration, cache):
+    return cached_screenshot(cache, screenshot_mosaic_wrapper, "data",
+                             subj_metric, output_prefix=name, skip=skip,
+                             nb_columns=nb_columns, duration=duration)
 
 
 def main():
@@ -101,15 +105,20 @@ def main():
 
     assert_inputs_exist(parser, all_images)
     assert_outputs_exist(parser, args, [args.output_report, "data", "libs"])
+    assert_executor_args(parser, args)
 
-    if os.path.exists("data"):
-        shutil.rmtree("data")
-    os.makedirs("data")
+    executor = load_executor(args)
+    if with_tissues:
+        images, wm, gm, csf = executor.shard(images, wm, gm, csf)
+    else:
+        images = executor.shard(images)
 
-    if os.path.exists("libs"):
-        shutil.rmtree("libs")
+    if os.path.exists("data") and not (args.update or executor.partial):
+        shutil.rmtree("data")
+    os.makedirs("data", exist_ok=True)
 
     name = args.image_type
+    cache = load_cache(args)
 
     if with_tissues:
         curr_metrics = ['Mean {} in WM'.format(name),
@@ -117,15 +126,63 @@ def main():
                         'Mean {} in CSF'.format(name),
                         'Max {} in WM'.format(name)]
         summary, stats = stats_mean_in_tissues(curr_metrics, images,
-                                               wm, gm, csf)
-        graph = graph_mean_in_tissues('Mean {}'.format(name), curr_metrics[:3],
-                                      summary, args.online)
+                                               wm, gm, csf,
+                                               nb_threads=args.nb_threads,
+                                               cache=cache, executor=executor)
     else:
         curr_metrics = ['Mean {}'.format(name),
                         'Median {}'.format(name)]
-        summary, stats = stats_mean_median(curr_metrics, images)
+        summary, stats = stats_mean_median(curr_metrics, images,
+                                           nb_threads=args.nb_threads,
+                                           all_volumes=args.all_volumes,
+                                           cache=cache, executor=executor)
+
+    executor.close()
+    pool = executor.pool()
+    screenshots = pool.starmap(_subj_parralel,
+                               zip(images,
+                                   itertools.repeat(name),
+                                   itertools.repeat(args.skip),
+                                   itertools.repeat(args.nb_columns),
+                                   itertools.repeat(args.duration),
+                                   itertools.repeat(cache)))
+    pool.close()
+    pool.join()
+
+    metrics_dict = {}
+    subjects_dict = {}
+    for subj_metric, screenshot_path in zip(images, screenshots):
+        curr_key = os.path.basename(subj_metric).split('.')[0]
+        summary_html = dataframe_to_html(summary.loc[curr_key].to_frame())
+        subjects_dict[curr_key] = {}
+        subjects_dict[curr_key]['screenshot'] = screenshot_path
+        subjects_dict[curr_key]['stats'] = summary_html
+    metrics_dict[name] = subjects_dict
+
+    nb_subjects = len(images)
+    title = "Quality Assurance " + args.image_type
+    if executor.partial:
+        if args.shard_dir:
+            shard = ReportShard(title, nb_subjects)
+            shard.add_summary(name, summary, curr_metrics[:3])
+            if with_tissues:
+                shard.add_graph('graph_mean_in_tissues',
+                                'Mean {}'.format(name), name,
+                                curr_metrics[:3])
+            else:
+                shard.add_graph('graph_mean_median', 'Mean {}'.format(name),
+                                name, curr_metrics)
+            shard.add_subjects(metrics_dict)
+            shard.save(args.shard_dir, args.shard_index)
+        cache.close()
+        return
+
+    if with_tissues:
+        graph = graph_mean_in_tissues('Mean {}'.format(name), curr_metrics[:3],
+                                      summary)
+    else:
         graph = graph_mean_median('Mean {}'.format(name), curr_metrics,
-                                  summary, args.online)
+                                  summary)
 
     warning_dict = {}
     warning_dict[name] = analyse_qa(summary, stats, curr_metrics[:3])
@@ -139,33 +196,17 @@ def main():
     stats_html = dataframe_to_html(stats)
     summary_dict = {}
     summary_dict[name] = stats_html
-    pool = Pool(args.nb_threads)
-    subjects_dict_pool = pool.starmap(_subj_parralel,
-                                      zip(images,
-                                          itertools.repeat(summary),
-                                          itertools.repeat(name),
-                                          itertools.repeat(args.skip),
-                                          itertools.repeat(args.nb_columns),
-                                          itertools.repeat(args.duration)))
-    pool.close()
-    pool.join()
 
-    metrics_dict = {}
-    subjects_dict = {}
-    for dict_sub in subjects_dict_pool:
-        for key in dict_sub:
-            curr_key = os.path.basename(key).split('.')[0]
-            subjects_dict[curr_key] = dict_sub[curr_key]
-    metrics_dict[name] = subjects_dict
-
-    nb_subjects = len(images)
-    report = Report(args.output_report)
-    report.generate(title="Quality Assurance " + args.image_type,
+    report = Report(args.output_report, assets_dir=args.assets_dir,
+                    page_size=args.page_size)
+    report.generate(title=title,
                     nb_subjects=nb_subjects, summary_dict=summary_dict,
                     graph_array=graphs, metrics_dict=metrics_dict,
                     warning_dict=warning_dict,
                     online=args.online)
 
+    cache.close()
+
 
 if __name__ == '__main__':
     main()
@@ -6,14 +6,19 @@ import os
 import shutil
 
 import itertools
-from multiprocessing import Pool
 import numpy as np
 
+from dmriqcpy.io.cache import cached_screenshot, load_cache
+from dmriqcpy.io.executor import load_executor
 from dmriqcpy.io.report import Report
-from dmriqcpy.io.utils import (add_online_arg, add_overwrite_arg,
-                               assert_inputs_exist, assert_outputs_exist,
-                               list_files_from_paths)
+from dmriqcpy.io.shard import ReportShard
+from dmriqcpy.io.utils import (add_cache_arg, add_executor_arg,
+                               add_online_arg, add_overwrite_arg,
+                               add_report_args, add_update_arg,
+                               assert_executor_args, assert_inputs_exist,
+                               assert_outputs_exist, list_files_from_paths)
 from dmriqcpy.viz.screenshot import screenshot_mosaic_blend
+from dmriqcpy.viz.utils import load_lut
 
 
 DESCRIPTION = """
@@ -44,8 +49,9 @@ def _build_arg_parser():
     p.add_argument('--nb_columns', default=12, type=int,
                    help='Number of columns for the mosaic. [%(default)s]')
 
-    p.add_argument('--lut', nargs=1, default="",
-                   help='Look Up Table for RGB.')
+    p.add_argument('--lut',
+                   help='Look Up Table for RGB, in FreeSurfer text format or '
+                        'as a .npy\narray saved by dmriqcpy.viz.utils.save_lut.')
 
     p.add_argument('--compute_lut', action='store_true',
                    help='Compute Look Up Table for RGB.')
@@ -53,24 +59,24 @@ def _build_arg_parser():
     p.add_argument('--nb_threads', type=int, default=1,
                    help='Number of threads. [%(default)s]')
 
+    add_executor_arg(p)
+    add_cache_arg(p)
+    add_update_arg(p)
     add_online_arg(p)
+    add_report_args(p)
     add_overwrite_arg(p)
 
     return p
 
 
-def _subj_parralel(t1, label, name, skip, nb_columns, lut, compute_lut):
+def _subj_parralel(t1, label, name, skip, nb_columns, lut, compute_lut,
+                   cache):
     subjects_dict = {}
-    if not lut:
-        lut = None
-
-    screenshot_path = screenshot_mosaic_blend(t1, label,
-                                              output_prefix=name,
-                                              directory="data",
-                                              blend_val=0.4,
-                                              skip=skip, nb_columns=nb_columns,
-                                              lut=lut,
-                                              compute_lut=compute_lut)
+    screenshot_path = cached_screenshot(cache, screenshot_mosaic_blend,
+                                        "data", t1, label,
+                                        output_prefix=name, blend_val=0.4,
+                                        skip=skip, nb_columns=nb_columns,
+                                        lut=lut, compute_lut=compute_lut)
 
     key = os.path.basename(t1).split('.')[0]
 
@@ -94,21 +100,27 @@ def main():
 
     all_images = np.concatenate([t1, label])
     if args.lut:
-        all_images = np.concatenate(all_images, args.lut)
+        all_images = np.concatenate([all_images, [args.lut]])
 
     assert_inputs_exist(parser, all_images)
     assert_outputs_exist(parser, args, [args.output_report, "data", "libs"])
+    assert_executor_args(parser, args)
 
-    if os.path.exists("data"):
-        shutil.rmtree("data")
-    os.makedirs("data")
+    executor = load_executor(args)
+    t1, label = executor.shard(t1, label)
 
-    if os.path.exists("libs"):
-        shutil.rmtree("libs")
+    if os.path.exists("data") and not (args.update or executor.partial):
+        shutil.rmtree("data")
+    os.makedirs("data", exist_ok=True)
 
     name = "Labels"
+    cache = load_cache(args)
 
-    pool = Pool(args.nb_threads)
+    if args.lut:
+        # Parsed once here, the forked workers reuse it.
+        load_lut(args.lut)
+
+    pool = executor.pool()
     subjects_dict_pool = pool.starmap(_subj_parralel,
                                       zip(t1,
                                           label,
@@ -116,7 +128,8 @@ def main():
                                           itertools.repeat(args.skip),
                                           itertools.repeat(args.nb_columns),
                                           itertools.repeat(args.lut),
-                                          itertools.repeat(args.compute_lut)))
+                                          itertools.repeat(args.compute_lut),
+                                          itertools.repeat(cache)))
     pool.close()
     pool.join()
 
@@ -129,11 +142,23 @@ def main():
     metrics_dict[name] = subjects_dict
 
     nb_subjects = len(t1)
-    report = Report(args.output_report)
-    report.generate(title="Quality Assurance labels",
+    title = "Quality Assurance labels"
+    if executor.partial:
+        if args.shard_dir:
+            shard = ReportShard(title, nb_subjects)
+            shard.add_subjects(metrics_dict)
+            shard.save(args.shard_dir, args.shard_index)
+        cache.close()
+        return
+
+    report = Report(args.output_report, assets_dir=args.assets_dir,
+                    page_size=args.page_size)
+    report.generate(title=title,
                     nb_subjects=nb_subjects, metrics_dict=metrics_dict,
                     online=args.online)
 
+    cache.close()
+
 
 if __name__ == '__main__':
     main()
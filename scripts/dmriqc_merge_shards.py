@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+
+from dmriqcpy.io.shard import list_shards, merge_shards
+from dmriqcpy.io.utils import (add_online_arg, add_overwrite_arg,
+                               add_report_args, assert_inputs_exist,
+                               assert_outputs_exist)
+
+
+DESCRIPTION = """
+Compute a report in HTML format from the shards written by a dmriqc script
+run with --executor array and --shard_dir. The stats across subjects, the
+warnings and the graphs are computed again from all the subjects.
+
+Run it in the folder the shards were computed in, where their screenshots
+are.
+"""
+
+
+def _build_arg_parser():
+    p = argparse.ArgumentParser(description=DESCRIPTION,
+                                formatter_class=argparse.RawTextHelpFormatter)
+
+    p.add_argument('output_report',
+                   help='HTML report.')
+
+    p.add_argument('shards', nargs='+',
+                   help='Folder or list of shards.')
+
+    add_online_arg(p)
+    add_report_args(p)
+    add_overwrite_arg(p)
+
+    return p
+
+
+def main():
+    parser = _build_arg_parser()
+    args = parser.parse_args()
+
+    shards = list_shards(args.shards)
+    if not shards:
+        parser.error("No shard found.")
+
+    assert_inputs_exist(parser, shards)
+    assert_outputs_exist(parser, args, [args.output_report, "libs"])
+
+    merge_shards(shards, args.output_report, online=args.online,
+                 assets_dir=args.assets_dir, page_size=args.page_size)
+
+
+if __name__ == '__main__':
+    main()
@@ -6,15 +6,19 @@ import os
 import shutil
 
 import itertools
-from multiprocessing import Pool
 import numpy as np
 
 
 from dmriqcpy.analysis.stats import stats_mean_in_tissues
+from dmriqcpy.io.cache import cached_screenshot, load_cache
+from dmriqcpy.io.executor import load_executor
 from dmriqcpy.io.report import Report
-from dmriqcpy.io.utils import (add_online_arg, add_overwrite_arg,
-                               assert_inputs_exist, assert_outputs_exist,
-                               list_files_from_paths)
+from dmriqcpy.io.shard import ReportShard
+from dmriqcpy.io.utils import (add_cache_arg, add_executor_arg,
+                               add_online_arg, add_overwrite_arg,
+                               add_report_args, add_update_arg,
+                               assert_executor_args, assert_inputs_exist,
+                               assert_outputs_exist, list_files_from_paths)
 from dmriqcpy.viz.graph import graph_mean_in_tissues
 from dmriqcpy.viz.screenshot import screenshot_mosaic_blend
 from dmriqcpy.viz.utils import analyse_qa, dataframe_to_html
@@ -58,26 +62,20 @@ def _build_arg_parser():
     p.add_argument('--nb_threads', type=int, default=1,
                    help='Number of threads. [%(default)s]')
 
+    add_executor_arg(p)
+    add_cache_arg(p)
+    add_update_arg(p)
     add_online_arg(p)
+    add_report_args(p)
     add_overwrite_arg(p)
 
     return p
 
 
-def _subj_parralel(t1_metric, rgb_metric, summary, name, skip, nb_columns):
-    subjects_dict = {}
-    curr_key = os.path.basename(t1_metric).split('.')[0]
-    screenshot_path = screenshot_mosaic_blend(t1_metric, rgb_metric,
-                                              output_prefix=name,
-                                              directory="data",
-                                              blend_val=0.5,
-                                              skip=skip, nb_columns=nb_columns)
-
-    summary_html = dataframe_to_html(summary.loc[curr_key].to_frame())
-    subjects_dict[curr_key] = {}
-    subjects_dict[curr_key]['screenshot'] = screenshot_path
-    subjects_dict[curr_key]['stats'] = summary_html
-    return subjects_dict
+def _subj_parralel(t1_metric, rgb_metric, name, skip, nb_columns, cache):
+    return cached_screenshot(cache, screenshot_mosaic_blend, "data",
+                             t1_metric, rgb_metric, output_prefix=name,
+                             blend_val=0.5, skip=skip, nb_columns=nb_columns)
 
 
 def main():
@@ -97,63 +95,86 @@ def main():
     all_images = np.concatenate([t1_warped, rgb, wm, gm, csf])
     assert_inputs_exist(parser, all_images)
     assert_outputs_exist(parser, args, [args.output_report, "data", "libs"])
+    assert_executor_args(parser, args)
 
-    if os.path.exists("data"):
-        shutil.rmtree("data")
-    os.makedirs("data")
+    executor = load_executor(args)
+    t1_warped, rgb, wm, gm, csf = executor.shard(t1_warped, rgb, wm, gm, csf)
 
-    if os.path.exists("libs"):
-        shutil.rmtree("libs")
+    if os.path.exists("data") and not (args.update or executor.partial):
+        shutil.rmtree("data")
+    os.makedirs("data", exist_ok=True)
 
     name = "Register T1"
+    cache = load_cache(args)
     curr_metrics = ['Mean {} in WM'.format(name),
                     'Mean {} in GM'.format(name),
                     'Mean {} in CSF'.format(name),
                     'Max {} in WM'.format(name)]
 
-    warning_dict = {}
     summary, stats = stats_mean_in_tissues(curr_metrics, t1_warped,
-                                           wm, gm, csf)
+                                           wm, gm, csf,
+                                           nb_threads=args.nb_threads,
+                                           cache=cache, executor=executor)
+
+    executor.close()
+    pool = executor.pool()
+    screenshots = pool.starmap(_subj_parralel,
+                               zip(t1_warped,
+                                   rgb,
+                                   itertools.repeat(name),
+                                   itertools.repeat(args.skip),
+                                   itertools.repeat(args.nb_columns),
+                                   itertools.repeat(cache)))
+    pool.close()
+    pool.join()
+
+    metrics_dict = {}
+    subjects_dict = {}
+    for t1_metric, screenshot_path in zip(t1_warped, screenshots):
+        curr_key = os.path.basename(t1_metric).split('.')[0]
+        summary_html = dataframe_to_html(summary.loc[curr_key].to_frame())
+        subjects_dict[curr_key] = {}
+        subjects_dict[curr_key]['screenshot'] = screenshot_path
+        subjects_dict[curr_key]['stats'] = summary_html
+    metrics_dict[name] = subjects_dict
+
+    nb_subjects = len(t1_warped)
+    title = "Quality Assurance registration"
+    if executor.partial:
+        if args.shard_dir:
+            shard = ReportShard(title, nb_subjects)
+            shard.add_summary(name, summary, curr_metrics[:3])
+            shard.add_graph('graph_mean_in_tissues', 'Mean {}'.format(name),
+                            name, curr_metrics[:3])
+            shard.add_subjects(metrics_dict)
+            shard.save(args.shard_dir, args.shard_index)
+        cache.close()
+        return
+
+    warning_dict = {}
     warning_dict[name] = analyse_qa(summary, stats, curr_metrics[:3])
     warning_list = np.concatenate([filenames for filenames in warning_dict[name].values()])
     warning_dict[name]['nb_warnings'] = len(np.unique(warning_list))
 
     graphs = []
     graph = graph_mean_in_tissues('Mean {}'.format(name), curr_metrics[:3],
-                                  summary, args.online)
+                                  summary)
     graphs.append(graph)
 
     stats_html = dataframe_to_html(stats)
     summary_dict = {}
     summary_dict[name] = stats_html
 
-    pool = Pool(args.nb_threads)
-    subjects_dict_pool = pool.starmap(_subj_parralel,
-                                      zip(t1_warped,
-                                          rgb,
-                                          itertools.repeat(summary),
-                                          itertools.repeat(name),
-                                          itertools.repeat(args.skip),
-                                          itertools.repeat(args.nb_columns)))
-    pool.close()
-    pool.join()
-
-    metrics_dict = {}
-    subjects_dict = {}
-    for dict_sub in subjects_dict_pool:
-        for key in dict_sub:
-            curr_key = os.path.basename(key).split('.')[0]
-            subjects_dict[curr_key] = dict_sub[curr_key]
-    metrics_dict[name] = subjects_dict
-
-    nb_subjects = len(t1_warped)
-    report = Report(args.output_report)
-    report.generate(title="Quality Assurance registration",
+    report = Report(args.output_report, assets_dir=args.assets_dir,
+                    page_size=args.page_size)
+    report.generate(title=title,
                     nb_subjects=nb_subjects, summary_dict=summary_dict,
                     graph_array=graphs, metrics_dict=metrics_dict,
                     warning_dict=warning_dict,
                     online=args.online)
 
+    cache.close()
+
 
 if __name__ == '__main__':
     main()
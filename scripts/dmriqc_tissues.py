@@ -6,15 +6,19 @@ import os
 import shutil
 
 import itertools
-from multiprocessing import Pool
 import numpy as np
 
 
 from dmriqcpy.analysis.stats import stats_mask_volume
+from dmriqcpy.io.cache import cached_screenshot, load_cache
+from dmriqcpy.io.executor import load_executor
 from dmriqcpy.io.report import Report
-from dmriqcpy.io.utils import (add_online_arg, add_overwrite_arg,
-                               assert_inputs_exist, assert_outputs_exist,
-                               list_files_from_paths)
+from dmriqcpy.io.shard import ReportShard
+from dmriqcpy.io.utils import (add_cache_arg, add_executor_arg,
+                               add_online_arg, add_overwrite_arg,
+                               add_report_args, add_update_arg,
+                               assert_executor_args, assert_inputs_exist,
+                               assert_outputs_exist, list_files_from_paths)
 from dmriqcpy.viz.graph import graph_mask_volume
 from dmriqcpy.viz.screenshot import screenshot_mosaic_wrapper
 from dmriqcpy.viz.utils import analyse_qa, dataframe_to_html
@@ -51,25 +55,20 @@ def _build_arg_parser():
     p.add_argument('--nb_threads', type=int, default=1,
                    help='Number of threads. [%(default)s]')
 
+    add_executor_arg(p)
+    add_cache_arg(p)
+    add_update_arg(p)
     add_online_arg(p)
+    add_report_args(p)
     add_overwrite_arg(p)
 
     return p
 
 
-def _subj_parralel(subj_metric, summary, name, skip, nb_columns):
-    subjects_dict = {}
-    curr_key = os.path.basename(subj_metric).split('.')[0]
-    screenshot_path = screenshot_mosaic_wrapper(subj_metric,
-                                                output_prefix=name,
-                                                directory="data", skip=skip,
-                                                nb_columns=nb_columns)
-
-    summary_html = dataframe_to_html(summary.loc[curr_key].to_frame())
-    subjects_dict[curr_key] = {}
-    subjects_dict[curr_key]['screenshot'] = screenshot_path
-    subjects_dict[curr_key]['stats'] = summary_html
-    return subjects_dict
+def _subj_parralel(subj_metric, name, skip, nb_columns, cache):
+    return cached_screenshot(cache, screenshot_mosaic_wrapper, "data",
+                             subj_metric, output_prefix=name, skip=skip,
+                             nb_columns=nb_columns)
 
 
 def main():
@@ -86,61 +85,95 @@ def main():
     all_images = np.concatenate([wm, gm, csf])
     assert_inputs_exist(parser, all_images)
     assert_outputs_exist(parser, args, [args.output_report, "data", "libs"])
+    assert_executor_args(parser, args)
 
-    if os.path.exists("data"):
-        shutil.rmtree("data")
-    os.makedirs("data")
+    executor = load_executor(args)
+    wm, gm, csf = executor.shard(wm, gm, csf)
 
-    if os.path.exists("libs"):
-        shutil.rmtree("libs")
+    if os.path.exists("data") and not (args.update or executor.partial):
+        shutil.rmtree("data")
+    os.makedirs("data", exist_ok=True)
 
     metrics_names = [[wm, 'WM mask'],
                      [gm, 'GM mask'],
                      [csf, 'CSF mask']]
+    cache = load_cache(args)
     metrics_dict = {}
     summary_dict = {}
     graphs = []
     warning_dict = {}
+    summaries = {}
+    all_stats = {}
+    jobs = []
     for metrics, name in metrics_names:
         columns = ["{} volume".format(name)]
-        summary, stats = stats_mask_volume(columns, metrics)
+        summaries[name], all_stats[name] = stats_mask_volume(
+            columns, metrics, nb_threads=args.nb_threads, cache=cache,
+            executor=executor)
+
+        jobs.extend(zip(metrics, itertools.repeat(name),
+                        itertools.repeat(args.skip),
+                        itertools.repeat(args.nb_columns),
+                        itertools.repeat(cache)))
+
+    executor.close()
+    # A single pool for the screenshots of all the metrics, so the workers
+    # stay busy across the metrics.
+    pool = executor.pool()
+    screenshots = pool.starmap(_subj_parralel, jobs, chunksize=1)
+    pool.close()
+    pool.join()
+
+    for (subj_metric, name, _, _, _), screenshot_path in zip(jobs,
+                                                              screenshots):
+        curr_key = os.path.basename(subj_metric).split('.')[0]
+        summary_html = dataframe_to_html(
+            summaries[name].loc[curr_key].to_frame())
+        subjects_dict = metrics_dict.setdefault(name, {})
+        subjects_dict[curr_key] = {}
+        subjects_dict[curr_key]['screenshot'] = screenshot_path
+        subjects_dict[curr_key]['stats'] = summary_html
+
+    nb_subjects = len(wm)
+    title = "Quality Assurance tissue segmentation"
+    if executor.partial:
+        if args.shard_dir:
+            shard = ReportShard(title, nb_subjects)
+            for metrics, name in metrics_names:
+                columns = ["{} volume".format(name)]
+                shard.add_summary(name, summaries[name], columns)
+                shard.add_graph('graph_mask_volume',
+                                '{} mean volume'.format(name), name, columns)
+            shard.add_subjects(metrics_dict)
+            shard.save(args.shard_dir, args.shard_index)
+        cache.close()
+        return
+
+    for _, name in metrics_names:
+        columns = ["{} volume".format(name)]
+        summary, stats = summaries[name], all_stats[name]
 
         warning_dict[name] = analyse_qa(summary, stats, columns)
         warning_list = np.concatenate([filenames for filenames in warning_dict[name].values()])
         warning_dict[name]['nb_warnings'] = len(np.unique(warning_list))
 
         graph = graph_mask_volume('{} mean volume'.format(name),
-                                  columns, summary, args.online)
+                                  columns, summary)
         graphs.append(graph)
 
         stats_html = dataframe_to_html(stats)
         summary_dict[name] = stats_html
 
-        subjects_dict = {}
-        pool = Pool(args.nb_threads)
-        subjects_dict_pool = pool.starmap(_subj_parralel,
-                                          zip(metrics,
-                                              itertools.repeat(summary),
-                                              itertools.repeat(name),
-                                              itertools.repeat(args.skip),
-                                              itertools.repeat(args.nb_columns)))
-        pool.close()
-        pool.join()
-
-        for dict_sub in subjects_dict_pool:
-            for key in dict_sub:
-                curr_key = os.path.basename(key).split('.')[0]
-                subjects_dict[curr_key] = dict_sub[curr_key]
-        metrics_dict[name] = subjects_dict
-
-    nb_subjects = len(wm)
-    report = Report(args.output_report)
-    report.generate(title="Quality Assurance tissue segmentation",
+    report = Report(args.output_report, assets_dir=args.assets_dir,
+                    page_size=args.page_size)
+    report.generate(title=title,
                     nb_subjects=nb_subjects, summary_dict=summary_dict,
                     graph_array=graphs, metrics_dict=metrics_dict,
                     warning_dict=warning_dict,
                     online=args.online)
 
+    cache.close()
+
 
 if __name__ == '__main__':
     main()
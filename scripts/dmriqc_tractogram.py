@@ -4,18 +4,25 @@
 import argparse
 import os
 import shutil
+import threading
 
 import numpy as np
 
-
+from dmriqcpy.io.cache import cached_screenshot, load_cache
+from dmriqcpy.io.executor import load_executor
 from dmriqcpy.io.report import Report
-from dmriqcpy.io.utils import (add_online_arg, add_overwrite_arg,
-                               assert_inputs_exist, assert_outputs_exist,
-                               list_files_from_paths)
-from dmriqcpy.analysis.stats import stats_tractogram
-from dmriqcpy.viz.graph import graph_tractogram
-from dmriqcpy.viz.screenshot import screenshot_tracking
-from dmriqcpy.viz.utils import analyse_qa, dataframe_to_html
+from dmriqcpy.io.shard import ReportShard
+from dmriqcpy.io.utils import (add_cache_arg, add_executor_arg,
+                               add_online_arg, add_overwrite_arg,
+                               add_report_args, add_update_arg,
+                               assert_executor_args, assert_inputs_exist,
+                               assert_outputs_exist, list_files_from_paths)
+from dmriqcpy.analysis.stats import stats_streamlines
+from dmriqcpy.viz.graph import graph_streamline_lengths, graph_tractogram
+from dmriqcpy.viz.screenshot import (estimate_tracking_memory,
+                                     screenshot_tracking)
+from dmriqcpy.viz.utils import (analyse_qa, close_render_context,
+                                 dataframe_to_html)
 
 
 DESCRIPTION = """
@@ -37,12 +44,68 @@ def _build_arg_parser():
     p.add_argument('--t1', nargs='+',
                    help='Folder or list of T1 images in Nifti format.')
 
+    p.add_argument('--nb_threads', type=int, default=1,
+                   help='Number of threads. [%(default)s]')
+
+    p.add_argument('--max_memory', type=float,
+                   help='Maximum memory in MB used by the subjects rendered '
+                        'at the same\ntime, estimated from the size of their '
+                        'tractogram and T1.\nA subject bigger than this '
+                        'limit is rendered alone.\n[Physical memory of the '
+                        'node]')
+
+    add_executor_arg(p)
+    add_cache_arg(p)
+    add_update_arg(p)
     add_online_arg(p)
+    add_report_args(p)
     add_overwrite_arg(p)
 
     return p
 
 
+def _subj_parralel(subj_metric, t1, cache):
+    return cached_screenshot(cache, screenshot_tracking, "data",
+                             subj_metric, t1)
+
+
+def _map_memory_bounded(func, args, sizes, executor, max_memory):
+    """
+    Apply func to the arguments of each subject in a pool of the executor,
+    without running at the same time subjects whose estimated memory sizes
+    add up to more than max_memory. The results keep the order of args.
+    """
+    condition = threading.Condition()
+    in_use = [0]
+
+    def release(size):
+        def callback(_):
+            with condition:
+                in_use[0] -= size
+                condition.notify_all()
+        return callback
+
+    with executor.pool() as pool:
+        results = []
+        for curr_args, size in zip(args, sizes):
+            with condition:
+                condition.wait_for(lambda: in_use[0] == 0 or
+                                   in_use[0] + size <= max_memory)
+                in_use[0] += size
+            results.append(pool.apply_async(func, curr_args,
+                                             callback=release(size),
+                                             error_callback=release(size)))
+
+        return [result.get() for result in results]
+
+
+def _physical_memory():
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        return np.inf
+
+
 def main():
     parser = _build_arg_parser()
     args = parser.parse_args()
@@ -56,50 +119,93 @@ def main():
     all_images = np.concatenate([tractograms, t1])
     assert_inputs_exist(parser, all_images)
     assert_outputs_exist(parser, args, [args.output_report, "data", "libs"])
+    assert_executor_args(parser, args)
 
-    if os.path.exists("data"):
-        shutil.rmtree("data")
-    os.makedirs("data")
+    executor = load_executor(args)
+    t1, tractograms = executor.shard(t1, tractograms)
 
-    if os.path.exists("libs"):
-        shutil.rmtree("libs")
+    if os.path.exists("data") and not (args.update or executor.partial):
+        shutil.rmtree("data")
+    os.makedirs("data", exist_ok=True)
 
     name = "Tracking"
-    columns = ["Nb streamlines"]
+    cache = load_cache(args)
+    columns = ["Nb streamlines", "Mean length", "Median length",
+               "5th percentile length", "95th percentile length",
+               "Mean nb points", "Mean step size",
+               "Extent x", "Extent y", "Extent z"]
+
+    summary, stats, histograms = stats_streamlines(columns, tractograms,
+                                                   nb_threads=args.nb_threads,
+                                                   cache=cache,
+                                                   executor=executor)
+    executor.close()
+
+    subjects_args = [(subj_metric, curr_t1, cache)
+                     for subj_metric, curr_t1 in zip(tractograms, t1)]
+    if args.nb_threads > 1 and len(tractograms) > 1:
+        max_memory = _physical_memory()
+        if args.max_memory is not None:
+            max_memory = args.max_memory * 1024 ** 2
+        sizes = [estimate_tracking_memory(subj_metric, curr_t1)
+                 for subj_metric, curr_t1 in zip(tractograms, t1)]
+        screenshots = _map_memory_bounded(_subj_parralel, subjects_args,
+                                          sizes, executor, max_memory)
+    else:
+        screenshots = [_subj_parralel(*curr_args)
+                       for curr_args in subjects_args]
+    close_render_context()
+
+    metrics_dict = {}
+    subjects_dict = {}
+    for subj_metric, screenshot_path in zip(tractograms, screenshots):
+        curr_key = os.path.basename(subj_metric).split('.')[0]
+        summary_html = dataframe_to_html(summary.loc[curr_key].to_frame())
+        subjects_dict[curr_key] = {}
+        subjects_dict[curr_key]['screenshot'] = screenshot_path
+        subjects_dict[curr_key]['stats'] = summary_html
+    metrics_dict[name] = subjects_dict
+
+    nb_subjects = len(tractograms)
+    title = "Quality Assurance tractograms"
+    if executor.partial:
+        if args.shard_dir:
+            shard = ReportShard(title, nb_subjects)
+            shard.add_summary(name, summary, columns)
+            shard.add_table('Streamline lengths', histograms)
+            shard.add_graph('graph_tractogram', 'Tracking', name, columns)
+            shard.add_graph('graph_streamline_lengths', 'Streamline lengths',
+                            'Streamline lengths')
+            shard.add_subjects(metrics_dict)
+            shard.save(args.shard_dir, args.shard_index)
+        cache.close()
+        return
 
     warning_dict = {}
-    summary, stats = stats_tractogram(columns, tractograms)
-    warning_dict[name] = analyse_qa(summary, stats, ["Nb streamlines"])
+    warning_dict[name] = analyse_qa(summary, stats, columns)
     warning_list = np.concatenate([filenames for filenames in warning_dict[name].values()])
     warning_dict[name]['nb_warnings'] = len(np.unique(warning_list))
 
     graphs = []
-    graph = graph_tractogram("Tracking", columns, summary, args.online)
+    graph = graph_tractogram("Tracking", columns, summary)
+    graphs.append(graph)
+    graph = graph_streamline_lengths("Streamline lengths", histograms)
     graphs.append(graph)
 
     summary_dict = {}
     stats_html = dataframe_to_html(stats)
     summary_dict[name] = stats_html
 
-    metrics_dict = {}
-    subjects_dict = {}
-    for subj_metric, curr_t1 in zip(tractograms, t1):
-        curr_key = os.path.basename(subj_metric).split('.')[0]
-        screenshot_path = screenshot_tracking(subj_metric, curr_t1, "data")
-        summary_html = dataframe_to_html(summary.loc[curr_key].to_frame())
-        subjects_dict[curr_key] = {}
-        subjects_dict[curr_key]['screenshot'] = screenshot_path
-        subjects_dict[curr_key]['stats'] = summary_html
-    metrics_dict[name] = subjects_dict
-
-    nb_subjects = len(tractograms)
-    report = Report(args.output_report)
-    report.generate(title="Quality Assurance tractograms",
+    report = Report(args.output_report, assets_dir=args.assets_dir,
+                    page_size=args.page_size)
+    report.generate(title=title,
                     nb_subjects=nb_subjects, summary_dict=summary_dict,
                     graph_array=graphs, metrics_dict=metrics_dict,
                     warning_dict=warning_dict,
                     online=args.online)
 
+    cache.close()
+
 
 if __name__ == '__main__':
     main()